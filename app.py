@@ -1,115 +1,149 @@
 # app.py
 # Prototype léger pour gestion économat local (lecture/écriture Excel)
 # Utilise pandas + openpyxl pour manipuler le classeur et tkinter pour l'interface.
+import os
 import pathlib
-import threading
-import time
+from collections import deque
 import pandas as pd
 import tkinter as tk
 from tkinter import ttk, messagebox
 
+from src.cache import load_sheets
+from src.io_excel import normalize_frame, normalize_tables, product_dictionary
+from src.journal import SalesJournal, journal_path_for
+from src.service import SalesClient, ServiceError, sale_line
+from src import perf
+from src.writer import WriteBehind, atomic_write
+from src.xlsx import sheet_names
+from src.xlsx_patch import append_rows
+from src.watcher import WorkbookConflict, WorkbookWatcher, check_unchanged, excel_lock_file
+from src.kpis import KpiState, choose_col, compute_kpis
+from src.catalogue import ProductCatalogue
+from src.calc import SHEETS_CATEGORIES, SalesCube, category_frame, cube_dimensions
+from src.recettes import cout_portion
+from src.stock import StockLedger
+
 # -------- CONFIG --------
 EXCEL_PATH = pathlib.Path("Dashboard Regraga 2026.xlsx")  # nom du fichier (déjà présent)
 # On choisira dynamiquement les noms d'onglets si nécessaire
 SHEET_VENTES = "tbl_Ventes"
 SHEET_PRODUITS_PREFIX = "tbl_Produits"  # on accepte "tbl_Produits" ou "tbl_Produits " (espace)
+SHEET_RECETTES = "tbl_Recettes"
+SHEET_STOCK = "tbl_Stock"
+SHEET_ACHATS = "tbl_Achats"
+SHEET_SORTIES = "tbl_Sorties"
 SAVE_INTERVAL_SEC = 0  # si >0 : auto-save périodique (0 = pas d'auto save)
+SAVE_POLL_MS = 200  # relevé des événements du thread de sauvegarde
+WATCH_INTERVAL_SEC = 2  # scrutation du classeur modifié hors de l'appli (0 = désactivée)
+WATCH_POLL_MS = 500  # relevé des changements détectés
+# caisse cliente du service multi-caisses (python -m src service): ventes envoyées au
+# service, qui seul écrit le classeur; vide = journal local de ce poste
+SERVICE_URL = os.environ.get("REGRAGA_SERVICE", "")
 # ------------------------
 
-def find_sheet_by_prefix(xl: pd.ExcelFile, prefix: str):
-    for s in xl.sheet_names:
+def find_sheet_by_prefix(names, prefix: str):
+    for s in names:
         if s == prefix or s.startswith(prefix):
             return s
     return None
 
+def watched_sheets():
+    """Onglets ventes et produits du classeur (nom de l'onglet produits toléré avec espace final)."""
+    # noms d'onglets lus dans workbook.xml, sans parser les onglets
+    names = sheet_names(EXCEL_PATH)
+    # Trouver sheet produits avec tolérance d'espace/trailing
+    return [SHEET_VENTES, find_sheet_by_prefix(names, SHEET_PRODUITS_PREFIX) or "tbl_Produits"]
+
+@perf.timed("load_tables")
 def load_tables():
     """Charge les tables principales depuis le fichier Excel."""
     if not EXCEL_PATH.exists():
         raise FileNotFoundError(f"Fichier introuvable : {EXCEL_PATH.resolve()}")
-    xl = pd.ExcelFile(EXCEL_PATH, engine="openpyxl")
-    # Trouver sheet produits avec tolérance d'espace/trailing
-    sheet_produits = find_sheet_by_prefix(xl, SHEET_PRODUITS_PREFIX) or "tbl_Produits"
-    ventes = pd.read_excel(xl, SHEET_VENTES) if SHEET_VENTES in xl.sheet_names else pd.DataFrame()
-    produits = pd.read_excel(xl, sheet_produits) if sheet_produits in xl.sheet_names else pd.DataFrame()
+    # onglets servis par le cache colonne (seuls les onglets modifiés depuis le dernier chargement sont relus)
+    sheet_produits = watched_sheets()[1]
+    tables = load_sheets(EXCEL_PATH, [SHEET_VENTES, sheet_produits])
+    ventes = tables.get(SHEET_VENTES, pd.DataFrame())
+    produits = tables.get(sheet_produits, pd.DataFrame())
+    # produits / codes en catégories sur un dictionnaire commun, dates en datetime64
+    with perf.span("normalisation", rows=len(ventes)):
+        normalize_tables({"ventes": ventes, "produits": produits})
     return ventes, produits
 
-def save_tables(ventes, produits):
-    """Réécrit les deux onglets en créant un fichier temporaire puis remplace l'original."""
-    import tempfile, os
-    # charger tout le classeur existant
-    xl = pd.ExcelFile(EXCEL_PATH, engine="openpyxl")
-    # créer writer sur un fichier temporaire et recopier tout en remplaçant les onglets ciblés
-    fd, tmp_path = tempfile.mkstemp(suffix=".xlsx")
-    os.close(fd)
-    with pd.ExcelWriter(tmp_path, engine="openpyxl") as writer:
-        # recopier onglets non ciblés
-        for sheet in xl.sheet_names:
-            if sheet == SHEET_VENTES:
-                ventes.to_excel(writer, sheet_name=sheet, index=False)
-            elif sheet.startswith(SHEET_PRODUITS_PREFIX):
-                produits.to_excel(writer, sheet_name=sheet, index=False)
-            else:
-                # lire et réécrire l'onglet tel quel
-                df = pd.read_excel(xl, sheet)
-                df.to_excel(writer, sheet_name=sheet, index=False)
-    # remplacer l'original (écrase)
-    os.replace(tmp_path, EXCEL_PATH)
-# utilitaires pour noms de colonnes
-def choose_col(df, possibles):
-    for c in possibles:
-        if c in df.columns:
-            return c
-    return None
+def load_watched(path, sheets):
+    """Onglets relus par le watcher après une modification externe, normalisés comme load_tables."""
+    tables = load_sheets(path, sheets)
+    normalize_tables(tables, keys=list(tables))
+    return tables
 
-def compute_kpis(ventes_df, produits_df):
-    """Calcule des KPI simples en s'adaptant aux noms de colonnes présents."""
-    k = {}
-    if ventes_df.empty:
-        k["Total CA"] = 0
-        k["Coût matière total"] = 0
-        k["Food cost %"] = 0
-        k["Top produits"] = {}
-        return k
-
-    # colonnes prévues dans ton fichier
-    col_prod = choose_col(ventes_df, ["Produit", "Nom du Produit", "Nom Produit"])
-    col_qte = choose_col(ventes_df, ["Qté Vendue", "Qté vendue", "Quantité", "Qte", "Qty"])
-    col_prix = choose_col(ventes_df, ["Prix Menu", "Prix de vente", "Prix", "PrixVente"])
-    col_ca = choose_col(ventes_df, ["CA ligne", "CA", "Montant"])
-    col_cmp = choose_col(ventes_df, ["CMP_par_portion", "Coût Moyen Portion", "Coût_par_portion", "CMP"])
-    col_cm_l = choose_col(ventes_df, ["Coût matière ligne", "Coût matière", "Cout_ligne"])
-
-    # créer CA ligne si absent
-    if col_ca is None:
-        px = col_prix if col_prix else None
-        q = col_qte if col_qte else None
-        if px and q:
-            ventes_df["CA ligne"] = ventes_df[px].fillna(0) * ventes_df[q].fillna(0)
-        else:
-            ventes_df["CA ligne"] = 0
-        col_ca = "CA ligne"
-
-    # créer Coût matière ligne si absent
-    if col_cm_l is None:
-        cmpcol = col_cmp if col_cmp else None
-        q = col_qte if col_qte else None
-        if cmpcol and q:
-            ventes_df["Coût matière ligne"] = ventes_df[cmpcol].fillna(0) * ventes_df[q].fillna(0)
-        else:
-            ventes_df["Coût matière ligne"] = 0
-        col_cm_l = "Coût matière ligne"
+@perf.timed("load_cout_portion")
+def load_cout_portion():
+    """Coût portion par code produit: tbl_Recettes x CMP rejoué depuis tbl_Stock / tbl_Achats / tbl_Sorties."""
+    tables = load_sheets(EXCEL_PATH, [SHEET_RECETTES, SHEET_STOCK, SHEET_ACHATS, SHEET_SORTIES])
+    stock = tables.get(SHEET_STOCK)
+    prices = None
+    if stock is not None:
+        prices = StockLedger.from_workbook(stock, tables.get(SHEET_ACHATS), tables.get(SHEET_SORTIES)).cmp()
+    return cout_portion(tables.get(SHEET_RECETTES), stock, prices)
+
+def load_dimensions(produits):
+    """Catégorie (onglets par carte) et famille de chaque produit, pour les regroupements du cube."""
+    return cube_dimensions(produits, category_frame(load_sheets(EXCEL_PATH, list(SHEETS_CATEGORIES))))
 
-    total_ca = ventes_df[col_ca].sum()
-    total_cm = ventes_df[col_cm_l].sum()
-    k["Total CA"] = float(total_ca)
-    k["Coût matière total"] = float(total_cm)
-    k["Food cost %"] = float((total_cm / total_ca) * 100) if total_ca else 0.0
+@perf.timed("save_tables", rows_in=lambda ventes, produits: len(ventes) + len(produits))
+def save_tables(ventes, produits):
+    """
+    Réécrit les deux onglets dans un fichier temporaire (même dossier, fsync) puis
+    remplace l'original en une opération: une coupure ne laisse jamais de classeur tronqué.
+    """
+    def write(tmp_path):
+        # charger tout le classeur existant (fermé avant le remplacement: verrou Windows)
+        with pd.ExcelFile(EXCEL_PATH, engine="openpyxl") as xl, pd.ExcelWriter(tmp_path, engine="openpyxl") as writer:
+            # recopier onglets non ciblés
+            for sheet in xl.sheet_names:
+                if sheet == SHEET_VENTES:
+                    ventes.to_excel(writer, sheet_name=sheet, index=False)
+                elif sheet.startswith(SHEET_PRODUITS_PREFIX):
+                    produits.to_excel(writer, sheet_name=sheet, index=False)
+                else:
+                    # lire et réécrire l'onglet tel quel
+                    df = pd.read_excel(xl, sheet)
+                    df.to_excel(writer, sheet_name=sheet, index=False)
+    atomic_write(EXCEL_PATH, write)
+
+@perf.timed("append_sales", rows_in=lambda pending, *a, **k: len(pending))
+def append_sales(pending, base=None, before_replace=None):
+    """
+    Ajoute des lignes à tbl_Ventes sans réécrire le reste du classeur: seule la
+    feuille (et la plage de sa table si elle grandit) change, formules, tables
+    et styles des autres onglets sont recopiés tels quels.
+    base ({onglet: crc} de la version connue, cf. WorkbookWatcher.crcs): revérifié juste
+    avant le remplacement; un enregistrement Excel survenu pendant l'écriture serait
+    écrasé -> WorkbookConflict, les ventes restent au journal.
+    before_replace: cf. atomic_write (SalesJournal.seal lors d'une compaction).
+    """
+    report = {}
+    def write(tmp_path):
+        report.update(append_rows(EXCEL_PATH, tmp_path, SHEET_VENTES, pending.to_dict("records")))
+        if base is not None:
+            check_unchanged(EXCEL_PATH, base)
+    atomic_write(EXCEL_PATH, write, before_replace)
+    return report
 
-    # top produits par CA (utilise la colonne produit trouvée)
-    prod_col_for_group = col_prod if col_prod else ventes_df.columns[0]
-    top = ventes_df.groupby(prod_col_for_group, dropna=True).agg({col_ca: "sum"}).sort_values(col_ca, ascending=False).head(5)
-    k["Top produits"] = top[col_ca].to_dict() if not top.empty else {}
-    return k
+def compact_journal(journal, watcher=None, folded=None):
+    """
+    Replie les ventes en attente du journal dans tbl_Ventes en une seule écriture.
+    watcher: écriture refusée si Excel a le classeur ouvert (les ventes restent au journal)
+    et non signalée comme modification externe. folded (liste) reçoit les lignes repliées.
+    """
+    def fold(pending, base=None):
+        append_sales(pending, base, journal.seal)
+        if folded is not None:
+            folded.extend(pending.to_dict("records"))
+    if watcher is None:
+        return journal.compact(fold)
+    with watcher.writing() as w:
+        # version connue (chargement + modifications externes absorbées) revérifiée avant remplacement
+        return journal.compact(lambda pending: fold(pending, dict(w.crcs)))
 
 # ---------- Interface Tkinter ----------
 class App(tk.Tk):
@@ -119,8 +153,20 @@ class App(tk.Tk):
         self.geometry("820x520")
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
+        # journal des ventes non encore repliées dans le classeur (local, ou celui du service)
+        if SERVICE_URL:
+            self.journal = SalesClient(SERVICE_URL)
+        else:
+            self.journal = SalesJournal(journal_path_for(EXCEL_PATH), EXCEL_PATH)
+        self.watcher = None
+        self.ventes_wb = pd.DataFrame()  # lignes du classeur seul (sans le journal)
+        self.kpi = KpiState()
+        self.cube = SalesCube()
+        self.catalogue = ProductCatalogue()
+        self.dimensions = {}
+        self.cout_portion = pd.Series(dtype=float)
         try:
-            self.ventes_df, self.produits_df = load_tables()
+            self.load_data()
         except Exception as e:
             messagebox.showerror("Erreur", f"Impossible de charger le fichier Excel:\n{e}")
             self.ventes_df = pd.DataFrame()
@@ -128,9 +174,24 @@ class App(tk.Tk):
         self.create_widgets()
         self.refresh_ui()
 
+        # sauvegardes hors du thread Tk: un écrivain unique, demandes regroupées;
+        # il relit le journal lui-même (aucun DataFrame partagé avec l'interface)
+        self._folded = deque(maxlen=5000)  # ventes repliées par l'appli (détection d'un écrasement depuis Excel)
+        self._conflit = False
+        if SERVICE_URL:
+            # le service écrit le classeur: une sauvegarde = export demandé au service
+            self.saver = WriteBehind(lambda _: self.journal.compact())
+        else:
+            self.saver = WriteBehind(lambda _: compact_journal(self.journal, self.watcher, self._folded))
+        self._manual_save = False
+        self.after(SAVE_POLL_MS, self.poll_saves)
+        # modifications faites dans Excel / OneDrive: scrutation en arrière-plan, delta appliqué ici
+        if WATCH_INTERVAL_SEC > 0 and EXCEL_PATH.exists():
+            self.watcher = WorkbookWatcher(EXCEL_PATH, watched_sheets(), WATCH_INTERVAL_SEC, load_watched,
+                                           self.watched_tables()).start()
+            self.after(WATCH_POLL_MS, self.poll_watcher)
         if SAVE_INTERVAL_SEC > 0:
-            self.auto_save_thread = threading.Thread(target=self.auto_save_loop, daemon=True)
-            self.auto_save_thread.start()
+            self.after(SAVE_INTERVAL_SEC * 1000, self.auto_save_tick)
 
     def create_widgets(self):
         # Frame KPIs
@@ -139,7 +200,8 @@ class App(tk.Tk):
         self.kpi_vars = {
             "Total CA": tk.StringVar(value="0"),
             "Coût matière total": tk.StringVar(value="0"),
-            "Food cost %": tk.StringVar(value="0")
+            "Food cost %": tk.StringVar(value="0"),
+            "CA mois / M-1": tk.StringVar(value="0"),
         }
         for i, (k, v) in enumerate(self.kpi_vars.items()):
             ttk.Label(f_kpi, text=k + ":").grid(row=0, column=2*i, sticky="w", padx=6)
@@ -150,9 +212,9 @@ class App(tk.Tk):
         f_sale.pack(fill="x", padx=10, pady=8)
         ttk.Label(f_sale, text="Produit:").grid(row=0, column=0, padx=6, pady=6, sticky="e")
 
-        prod_col = "Produit" if "Produit" in self.produits_df.columns else (self.produits_df.columns[0] if len(self.produits_df.columns)>0 else "")
-        self.prod_cb = ttk.Combobox(f_sale, values=list(self.produits_df.get(prod_col, [])))
+        self.prod_cb = ttk.Combobox(f_sale, values=self.catalogue.names)
         self.prod_cb.grid(row=0, column=1, padx=6, pady=6)
+        self.prod_cb.bind("<KeyRelease>", self.filter_products)
         ttk.Label(f_sale, text="Quantité:").grid(row=0, column=2, padx=6, pady=6, sticky="e")
         self.qty_e = ttk.Entry(f_sale, width=8)
         self.qty_e.grid(row=0, column=3, padx=6, pady=6)
@@ -173,38 +235,120 @@ class App(tk.Tk):
         bframe.pack(fill="x", padx=10, pady=6)
         ttk.Button(bframe, text="Rafraîchir (recharger fichier)", command=self.manual_reload).pack(side="left")
         ttk.Button(bframe, text="Sauvegarder maintenant", command=self.manual_save).pack(side="left", padx=6)
+        ttk.Button(bframe, text="Perf", command=self.show_perf).pack(side="left")
         ttk.Button(bframe, text="Ouvrir fichier Excel (OneDrive)", command=self.open_excel).pack(side="right")
+        self.save_status = tk.StringVar(value="")
+        ttk.Label(bframe, textvariable=self.save_status, foreground="gray").pack(side="right", padx=8)
+
+    def load_data(self):
+        """Classeur + lignes en attente du journal (rien n'est perdu entre deux compactions)."""
+        ventes, self.produits_df = load_tables()
+        self.catalogue = ProductCatalogue(self.produits_df)
+        try:
+            self.cout_portion = load_cout_portion()
+        except ValueError:
+            # recettes absentes ou cycliques: on garde la colonne saisie à la main
+            self.cout_portion = pd.Series(dtype=float)
+        self.dimensions = load_dimensions(self.produits_df)
+        self.ventes_wb = ventes
+        self.merge_pending()
+
+    def pending_count(self):
+        """Ventes en attente de report dans le classeur (0 si le service ne répond pas)."""
+        try:
+            return len(self.journal)
+        except (OSError, ServiceError):
+            return 0
+
+    def merge_pending(self):
+        """ventes_df = lignes du classeur + lignes en attente du journal."""
+        ventes = self.ventes_wb
+        try:
+            pending = self.journal.pending_frame()
+        except (OSError, ServiceError):
+            # service injoignable: le classeur seul, les ventes des caisses apparaîtront à l'export
+            pending = pd.DataFrame()
+        if not pending.empty:
+            # lignes du journal (texte, dates saisies) ramenées sur les mêmes types compacts
+            ventes = normalize_frame(pd.concat([ventes, pending], ignore_index=True),
+                                     product_dictionary(ventes, self.produits_df))
+        self.ventes_df = ventes
 
+    def watched_tables(self):
+        sheet_ventes, sheet_produits = watched_sheets()
+        return {sheet_ventes: self.ventes_wb, sheet_produits: self.produits_df}
+
+    @perf.timed("refresh_ui", rows_in=lambda self: len(self.ventes_df))
     def refresh_ui(self):
-        # recalc KPIs et rafraichir table
+        # recharger, ré-amorcer les KPI et rafraichir table
         try:
-            self.ventes_df, self.produits_df = load_tables()
+            self.load_data()
         except Exception as e:
             messagebox.showerror("Erreur", f"Impossible de charger le fichier Excel:\n{e}")
             return
-        k = compute_kpis(self.ventes_df, self.produits_df)
-        self.kpi_vars["Total CA"].set(f"{k['Total CA']:.2f}")
-        self.kpi_vars["Coût matière total"].set(f"{k['Coût matière total']:.2f}")
-        self.kpi_vars["Food cost %"].set(f"{k['Food cost %']:.1f}%")
+        if self.watcher is not None:
+            self.watcher.rebase(self.watched_tables())
+        # amorçage unique; ensuite chaque vente met à jour l'état en O(1)
+        with perf.span("amorçage KPI / cube", rows=len(self.ventes_df)):
+            self.kpi = KpiState.from_frame(self.ventes_df)
+            self.cube = SalesCube.from_frame(self.ventes_df, self.dimensions)
+        self.show_kpis()
         # remplir table ventes (dernières 50)
+        with perf.span("remplissage journal", rows=min(50, len(self.ventes_df))):
+            self.fill_tree()
+
+        # rafraîchir combobox produits (liste construite une fois avec le catalogue)
+        self.prod_cb["values"] = self.catalogue.names
+
+    def fill_tree(self):
         for i in self.tree.get_children():
             self.tree.delete(i)
         if not self.ventes_df.empty:
             # déterminer colonnes sources pour affichage
-            col_date = choose_col(self.ventes_df, ["Date", "date"])
-            col_prod = choose_col(self.ventes_df, ["Produit", "Nom du Produit", "Nom Produit"]) or self.ventes_df.columns[0]
-            col_qte = choose_col(self.ventes_df, ["Qté Vendue", "Qté vendue", "Quantité", "Qte", "Qty"])
-            col_prix = choose_col(self.ventes_df, ["Prix Menu", "Prix de vente", "Prix", "PrixVente"])
-            col_ca = choose_col(self.ventes_df, ["CA ligne", "CA", "Montant"]) or "CA ligne"
-            last = self.ventes_df.tail(50).fillna("")
+            self.tree_cols = (
+                choose_col(self.ventes_df, ["Date", "date"]),
+                choose_col(self.ventes_df, ["Produit", "Nom du Produit", "Nom Produit"]) or self.ventes_df.columns[0],
+                choose_col(self.ventes_df, ["Qté Vendue", "Qté vendue", "Quantité", "Qte", "Qty"]),
+                choose_col(self.ventes_df, ["Prix Menu", "Prix de vente", "Prix", "PrixVente"]),
+                choose_col(self.ventes_df, ["CA ligne", "CA", "Montant"]) or "CA ligne",
+            )
+            # colonnes catégories / datetime64: passage en objets avant de remplacer les vides
+            last = self.ventes_df.tail(50).astype(object).fillna("")
             for _, r in last.iterrows():
-                ca = r.get(col_ca, r.get(col_qte, 0) * r.get(col_prix, 0))
-                self.tree.insert("", "end", values=[r.get(col_date, ""), r.get(col_prod, ""), r.get(col_qte, ""), r.get(col_prix, ""), f"{float(ca or 0):.2f}"])
+                self.tree_add(r)
 
-        # rafraîchir combobox produits
-        prod_col = "Produit" if "Produit" in self.produits_df.columns else (self.produits_df.columns[0] if len(self.produits_df.columns)>0 else "")
-        self.prod_cb["values"] = list(self.produits_df.get(prod_col, []))
+    def filter_products(self, event):
+        """Autocomplétion: filtre la liste du combobox sur le texte saisi (préfixe puis trigrammes)."""
+        if event.keysym in ("Up", "Down", "Return", "Escape", "Tab"):
+            return
+        text = self.prod_cb.get()
+        self.prod_cb["values"] = self.catalogue.search(text) if text.strip() else self.catalogue.names
+
+    def show_kpis(self):
+        k = self.kpi.kpis()
+        self.kpi_vars["Total CA"].set(f"{k['Total CA']:.2f}")
+        self.kpi_vars["Coût matière total"].set(f"{k['Coût matière total']:.2f}")
+        self.kpi_vars["Food cost %"].set(f"{k['Food cost %']:.1f}%")
+        # mois courant contre mois précédent, lu dans le cube
+        mois = pd.Timestamp.now()
+        cmp = self.cube.compare("mois", mois, mois - pd.DateOffset(months=1), by=None)
+        if cmp.empty:
+            self.kpi_vars["CA mois / M-1"].set("0.00 / 0.00")
+        else:
+            self.kpi_vars["CA mois / M-1"].set(f"{cmp.iloc[0, 1]:.2f} / {cmp.iloc[0, 2]:.2f}")
+
+    def tree_add(self, r, max_rows=50):
+        """Ajoute une ligne de vente (Series ou dict) en bas du journal affiché."""
+        col_date, col_prod, col_qte, col_prix, col_ca = getattr(
+            self, "tree_cols", ("Date", "Produit", "Qté Vendue", "Prix Menu", "CA ligne"))
+        ca = r.get(col_ca, r.get(col_qte, 0) * r.get(col_prix, 0))
+        self.tree.insert("", "end", values=[r.get(col_date, ""), r.get(col_prod, ""), r.get(col_qte, ""), r.get(col_prix, ""), f"{float(ca or 0):.2f}"])
+        children = self.tree.get_children()
+        if len(children) > max_rows:
+            self.tree.delete(*children[:len(children) - max_rows])
 
+    # lignes: taille des KPI tenus à jour (coût de la vente indépendant de tbl_Ventes)
+    @perf.timed("add_sale", rows_in=lambda self: self.kpi.nb_lignes)
     def add_sale(self):
         prod = self.prod_cb.get().strip()
         try:
@@ -215,46 +359,183 @@ class App(tk.Tk):
         if prod == "" or qty <= 0:
             messagebox.showwarning("Saisie", "Produit ou quantité manquante")
             return
-        # trouver prix et CMP dans tbl_Produits
-        prod_col = "Produit" if "Produit" in self.produits_df.columns else (self.produits_df.columns[0] if len(self.produits_df.columns)>0 else "")
-        row = self.produits_df[self.produits_df.get(prod_col,"") == prod]
-        if row.empty:
+        # trouver prix et CMP dans tbl_Produits (index du catalogue, nom ou code)
+        item = self.catalogue.get(prod)
+        if item is None:
             messagebox.showerror("Produit", "Produit introuvable dans tbl_Produits")
             return
-        prix = float(row.iloc[0].get("Prix Menu", row.iloc[0].get("Prix Menu", 0) or 0))
-        cmp_par = float(row.iloc[0].get("Coût Moyen Portion", row.iloc[0].get("Coût Moyen Portion", 0) or 0))
-        ca_ligne = qty * prix
-        cout_ligne = qty * cmp_par
-        # construire nouvelle ligne de ventes
-        new = {
-            "Date": pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "Produit": prod,
-            "Qté Vendue": qty,
-            "Prix Menu": prix,
-            "CA ligne": ca_ligne,
-            "CMP_par_portion": cmp_par,
-            "Coût matière ligne": cout_ligne
-        }
-        self.ventes_df = pd.concat([self.ventes_df, pd.DataFrame([new])], ignore_index=True)
+        # construire nouvelle ligne de ventes (coût calculé depuis la recette si le produit en a une)
+        new = sale_line(item, qty, self.cout_portion)
+        # ajout O(1) dans le journal; le classeur est mis à jour à la compaction
         try:
-            save_tables(self.ventes_df, self.produits_df)
+            with perf.span("journal.append", rows=1):
+                self.journal.append(new)
         except Exception as e:
-            messagebox.showerror("Erreur sauvegarde", f"Impossible de sauvegarder:\n{e}")
+            messagebox.showerror("Erreur sauvegarde", f"Impossible d'enregistrer la vente:\n{e}")
             return
         self.qty_e.delete(0, "end")
-        self.refresh_ui()
-        messagebox.showinfo("OK", "Vente enregistrée et fichier mis à jour.")
+        # mise à jour incrémentale: pas de rechargement du classeur
+        self.kpi.add(new)
+        self.cube.add(new)
+        self.show_kpis()
+        self.tree_add(new)
+        messagebox.showinfo("OK", "Vente enregistrée (journal).")
+
+    def show_perf(self):
+        """Panneau perf: spans enregistrés (agrégat par nom + derniers appels)."""
+        win = tk.Toplevel(self)
+        win.title("Perf")
+        win.geometry("760x420")
+        actif = tk.BooleanVar(value=perf.enabled())
+        top = ttk.Frame(win)
+        top.pack(fill="x", padx=8, pady=6)
+        ttk.Checkbutton(top, text="Enregistrer (REGRAGA_PERF)", variable=actif,
+                        command=lambda: perf.enable(actif.get())).pack(side="left")
+        cols = ["nom", "appels", "moyenne (ms)", "max (ms)", "dernier (ms)", "lignes (dernier)"]
+        agg = ttk.Treeview(win, columns=cols, show="headings", height=8)
+        for c in cols:
+            agg.heading(c, text=c)
+            agg.column(c, width=120)
+        agg.pack(fill="both", expand=True, padx=8)
+        cols_last = ["nom", "durée (ms)", "lignes", "mémoire Δ (Ko)", "parent"]
+        last = ttk.Treeview(win, columns=cols_last, show="headings", height=8)
+        for c in cols_last:
+            last.heading(c, text=c)
+            last.column(c, width=140)
+        last.pack(fill="both", expand=True, padx=8, pady=6)
+
+        def fmt(v):
+            return f"{v:.1f}" if isinstance(v, float) else ("" if v is None else v)
+
+        def reload():
+            agg.delete(*agg.get_children())
+            for a in perf.summary():
+                agg.insert("", "end", values=[fmt(a.get(c)) for c in cols])
+            last.delete(*last.get_children())
+            for r in reversed(perf.records()[-30:]):
+                last.insert("", "end", values=[fmt(r.get(c)) for c in cols_last])
+
+        ttk.Button(top, text="Actualiser", command=reload).pack(side="left", padx=6)
+        ttk.Button(top, text="Vider", command=lambda: (perf.clear(), reload())).pack(side="left")
+        reload()
 
     def manual_reload(self):
         self.refresh_ui()
         messagebox.showinfo("Rafraîchi", "Fichier rechargé depuis le disque.")
 
     def manual_save(self):
+        # non bloquant: le résultat arrive par poll_saves
+        self._manual_save = True
+        self.save_status.set("Sauvegarde demandée…")
+        self.saver.submit()
+
+    def poll_saves(self):
+        """Relève les événements du thread de sauvegarde (appelé par after, dans le thread Tk)."""
+        for etat, info in self.saver.poll():
+            if etat == "début":
+                self.save_status.set(f"Sauvegarde en cours ({self.pending_count()} vente(s) en attente)…")
+            elif etat == "ok":
+                n = info["résultat"]
+                self.save_status.set(f"Sauvegardé à {pd.Timestamp.now():%H:%M:%S} ({n} vente(s), {info['durée (s)']:.1f} s)")
+                if self._manual_save:
+                    messagebox.showinfo("Sauvegarde", f"Fichier Excel sauvegardé ({n} vente(s) reportée(s) dans tbl_Ventes).")
+            elif isinstance(info["erreur"], WorkbookConflict):
+                # classeur ouvert dans Excel: rien n'est écrit, les ventes restent au journal
+                self._conflit = True
+                self.save_status.set(f"{info['erreur']} ({self.pending_count()} vente(s) en attente)")
+                if self._manual_save:
+                    messagebox.showwarning("Sauvegarde différée", f"{info['erreur']}\n\nLes ventes seront reportées "
+                                           "dans le classeur à sa fermeture dans Excel.")
+            else:
+                self.save_status.set(f"Échec de la sauvegarde à {pd.Timestamp.now():%H:%M:%S}")
+                if self._manual_save:
+                    messagebox.showerror("Erreur", f"Impossible de sauvegarder :\n{info['erreur']}")
+            if etat != "début" and not self.saver.busy:
+                self._manual_save = False
+        self.after(SAVE_POLL_MS, self.poll_saves)
+
+    def poll_watcher(self):
+        """Relève les modifications externes détectées par le watcher (thread Tk)."""
+        for etat, info in self.watcher.poll():
+            if etat == "modifié":
+                self.apply_external(info)
+            else:
+                self.save_status.set(f"Surveillance du classeur: {info['erreur']}")
+        # Excel fermé: les ventes gardées au journal partent à la sauvegarde suivante
+        if self._conflit and excel_lock_file(EXCEL_PATH) is None:
+            self._conflit = False
+            if self.pending_count():
+                self.saver.submit()
+        self.after(WATCH_POLL_MS, self.poll_watcher)
+
+    @staticmethod
+    def _sale_key(date, produit, qte):
         try:
-            save_tables(self.ventes_df, self.produits_df)
-            messagebox.showinfo("Sauvegarde", "Fichier Excel sauvegardé.")
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Impossible de sauvegarder :\n{e}")
+            return pd.Timestamp(date).round("s"), str(produit).strip(), round(float(qte), 6)
+        except (TypeError, ValueError):
+            return None
+
+    @perf.timed("apply_external", rows_in=lambda self, info: sum(len(a) + len(r) for a, r in info["deltas"].values()))
+    def apply_external(self, info):
+        """Modification du classeur hors de l'appli: delta de lignes appliqué aux KPI / cube, sans tout recharger."""
+        sheet_ventes, sheet_produits = watched_sheets()
+        if sheet_produits in info["feuilles"]:
+            # prix, familles, catégories: rare, rechargement complet
+            self.refresh_ui()
+            self.save_status.set(f"{sheet_produits} modifié hors de l'appli: rechargé à {pd.Timestamp.now():%H:%M:%S}")
+            return
+        if sheet_ventes not in info["deltas"]:
+            return
+        if SERVICE_URL:
+            # lignes exportées par le service: déjà comptées parmi les ventes en attente,
+            # KPI et cube ré-amorcés sur classeur + attente plutôt qu'un delta compté deux fois
+            self.ventes_wb = info["tables"][sheet_ventes]
+            self.merge_pending()
+            self.kpi = KpiState.from_frame(self.ventes_df)
+            self.cube = SalesCube.from_frame(self.ventes_df, self.dimensions)
+            self.show_kpis()
+            self.fill_tree()
+            self.save_status.set(f"tbl_Ventes mis à jour par le service à {pd.Timestamp.now():%H:%M:%S}")
+            return
+        ajoutees, retirees = info["deltas"][sheet_ventes]
+        self.kpi.add_frame(retirees, sign=-1)
+        self.kpi.add_frame(ajoutees)
+        self.cube.add_frame(retirees, sign=-1)
+        self.cube.add_frame(ajoutees)
+        self.ventes_wb = info["tables"][sheet_ventes]
+        self.merge_pending()
+        self.show_kpis()
+        self.fill_tree()
+        col_date, col_prod, col_qte = (choose_col(self.ventes_wb, c) for c in (
+            ["Date", "date"], ["Produit", "Nom du Produit", "Nom Produit"], ["Qté Vendue", "Qté vendue", "Quantité", "Qte", "Qty"]))
+        n_aj = int(ajoutees[col_prod].notna().sum()) if col_prod else len(ajoutees)
+        n_ret = int(retirees[col_prod].notna().sum()) if col_prod else len(retirees)
+        msg = f"Classeur modifié hors de l'appli à {pd.Timestamp.now():%H:%M:%S}: +{n_aj} / -{n_ret} vente(s)"
+        attente = self.pending_count()
+        if attente:
+            msg += f"; {attente} vente(s) saisie(s) ici seront ajoutées à la suite"
+        self.save_status.set(msg)
+
+        # ventes reportées par l'appli puis disparues (version ouverte dans Excel enregistrée par-dessus)
+        if not (col_date and col_prod and col_qte) or not n_ret or not self._folded:
+            return
+        keys = lambda df: [self._sale_key(d, p, q) for d, p, q in zip(df[col_date], df[col_prod], df[col_qte])]
+        nous = {self._sale_key(l.get(col_date), l.get(col_prod), l.get(col_qte)) for l in list(self._folded)}
+        revenues = set(keys(ajoutees))
+        perdues = [r for r, k in zip(retirees.to_dict("records"), keys(retirees)) if k in nous and k not in revenues]
+        if perdues and messagebox.askyesno(
+                "Ventes écrasées",
+                f"{len(perdues)} vente(s) saisie(s) dans l'appli ont disparu de {sheet_ventes} "
+                "(classeur enregistré depuis Excel par-dessus ?).\n\nLes remettre en attente pour la prochaine sauvegarde ?"):
+            for ligne in perdues:
+                ligne = {k: v for k, v in ligne.items() if not pd.isna(v)}
+                self.journal.append(ligne)
+                self.kpi.add(ligne)
+                self.cube.add(ligne)
+            self.merge_pending()
+            self.show_kpis()
+            self.fill_tree()
+            self.saver.submit()
 
     def open_excel(self):
         import os, subprocess
@@ -263,16 +544,21 @@ class App(tk.Tk):
         except Exception as e:
             messagebox.showerror("Erreur", f"Impossible d'ouvrir le fichier :\n{e}")
 
-    def auto_save_loop(self):
-        while True:
-            time.sleep(SAVE_INTERVAL_SEC)
-            try:
-                save_tables(self.ventes_df, self.produits_df)
-            except:
-                pass
+    def auto_save_tick(self):
+        # simple demande: l'écriture se fait dans le thread de sauvegarde
+        if self.pending_count():
+            self.saver.submit()
+        self.after(SAVE_INTERVAL_SEC * 1000, self.auto_save_tick)
 
     def on_close(self):
         if messagebox.askyesno("Quitter", "Souhaitez-vous quitter l'application ?"):
+            # laisser finir les sauvegardes demandées (le journal garde de toute façon les ventes)
+            self.save_status.set("Fin de la sauvegarde en cours…")
+            self.update_idletasks()
+            self.saver.close()
+            if self.watcher is not None:
+                self.watcher.stop()
+            self.journal.close()
             self.destroy()
 
 if __name__ == "__main__":
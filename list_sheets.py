@@ -1,12 +1,16 @@
 # list_sheets.py
-import pandas as pd, pathlib
+import pathlib
+from src.cache import load_sheets
+from src.xlsx import sheet_names
 p = pathlib.Path("Dashboard Regraga 2026.xlsx")
-xl = pd.ExcelFile(p, engine="openpyxl")
-print("Feuilles:", xl.sheet_names)
+names = sheet_names(p)
+print("Feuilles:", names)
+wanted = [s for s in ["tbl_Ventes", "tbl_Produits", "tbl_Produits "] if s in names]
+tables = load_sheets(p, wanted)
 for s in ["tbl_Ventes", "tbl_Produits", "tbl_Produits "]:
-    if s in xl.sheet_names:
-        df = pd.read_excel(xl, s)
+    if s in tables:
+        df = tables[s]
         print(f"\nTrouvé onglet: {s} shape:", df.shape)
         print(df.head(3).to_dict('records'))
     else:
-        print(f"\nOnglet absent: {s}")
\ No newline at end of file
+        print(f"\nOnglet absent: {s}")
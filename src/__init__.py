@@ -1 +1,16 @@
-from src.io_excel import read_workbook, clean_codes
\ No newline at end of file
+# src/__init__.py
+# Imports paresseux (PEP 562): `import src` / `python -m src --help` ne chargent
+# ni pandas ni openpyxl; read_workbook et clean_codes sont importés au premier accès.
+
+_EXPORTS = {"read_workbook": "io_excel", "clean_codes": "io_excel"}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        import importlib
+        value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
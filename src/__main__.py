@@ -0,0 +1,293 @@
+# src/__main__.py
+# Ligne de commande sans interface graphique:
+#   python -m src resultats "Dashboard Regraga 2026.xlsx" -o resultats --formats xlsx,csv
+#   python -m src consolider . -j 4
+#   python -m src bench -n 10k,100k --baseline bench_baseline.json
+#   python -m src prevision "Dashboard Regraga 2026.xlsx" -j 4
+#   python -m src service "Dashboard Regraga 2026.xlsx" --hote 0.0.0.0   (caisses: REGRAGA_SERVICE=http://poste:8765)
+#   python -m src charge "Dashboard Regraga 2026.xlsx" -c 4 -d 10
+# pandas / openpyxl ne sont importés qu'à l'exécution d'une commande (--help reste instantané).
+
+import argparse
+import pathlib
+import sys
+import time
+
+
+def _formats(value):
+    from_cli = [f.strip().lower() for f in value.split(",") if f.strip()]
+    bad = [f for f in from_cli if f not in ("xlsx", "csv", "parquet")]
+    if bad:
+        raise argparse.ArgumentTypeError(f"format inconnu: {', '.join(bad)} (xlsx, csv, parquet)")
+    return from_cli
+
+
+def _parquet_engine():
+    import importlib.util
+    return any(importlib.util.find_spec(m) for m in ("pyarrow", "fastparquet"))
+
+
+def _out_dirs(root, paths):
+    """Un sous-dossier par classeur quand il y en a plusieurs (suffixe si deux classeurs ont le même nom)."""
+    root = pathlib.Path(root)
+    if len(paths) == 1:
+        return [root]
+    dirs, seen = [], {}
+    for p in paths:
+        stem = pathlib.Path(p).stem
+        seen[stem] = seen.get(stem, 0) + 1
+        dirs.append(root / (stem if seen[stem] == 1 else f"{stem}-{seen[stem]}"))
+    return dirs
+
+
+def cmd_resultats(args):
+    if "parquet" in args.formats and not _parquet_engine():
+        print("format parquet: installer pyarrow (ou fastparquet)", file=sys.stderr)
+        return 2
+    from .batch import Stages, compute_results, peak_rss_mb, write_results
+
+    t0 = time.perf_counter()
+    code = 0
+    for path, out_dir in zip(args.classeurs, _out_dirs(args.sortie, args.classeurs)):
+        path = pathlib.Path(path)
+        stages = Stages()
+        try:
+            results = compute_results(path, stages, journal=not args.sans_journal)
+            written = stages.run("écriture", write_results, results, out_dir, args.formats)
+        except Exception as e:
+            print(f"{path}: échec: {e}", file=sys.stderr)
+            code = 1
+            continue
+        kpi = results["KPI"].set_index("Indicateur")["Valeur"]
+        print(f"{path}: CA {kpi['Total CA']:.2f}, coût matière {kpi['Coût matière total']:.2f}, "
+              f"food cost {kpi['Food cost %']:.1f}%")
+        for w in written:
+            print(f"  -> {w}")
+        if not args.quiet:
+            stages.report()
+    rss = peak_rss_mb()
+    print(f"Total {time.perf_counter() - t0:.2f} s, pic RSS {'n/d' if rss is None else f'{rss:.0f} Mo'}", file=sys.stderr)
+    return code
+
+
+def cmd_consolider(args):
+    if "parquet" in args.formats and not _parquet_engine():
+        print("format parquet: installer pyarrow (ou fastparquet)", file=sys.stderr)
+        return 2
+    from .batch import peak_rss_mb, write_results
+    from .consolidation import consolidate, discover
+
+    t0 = time.perf_counter()
+    paths = [p for src in args.sources for p in discover(src)]
+    if not paths:
+        print("aucun classeur trouvé", file=sys.stderr)
+        return 1
+    root = args.sources[0] if len(args.sources) == 1 else "."
+    out = consolidate(paths, root=root, workers=args.workers, journal=not args.sans_journal)
+    written = write_results(out, args.sortie, args.formats, name="Regraga_Consolidation")
+    sites = out["Sites"]
+    for _, s in sites.iterrows():
+        etat = f"échec: {s['erreur']}" if s["erreur"] else f"CA {s['CA']:.2f}"
+        print(f"{s['site']}: {etat} ({s['durée (s)'] * 1000:.0f} ms)")
+    for w in written:
+        print(f"  -> {w}")
+    rss = peak_rss_mb()
+    print(f"{len(paths)} classeur(s), total {time.perf_counter() - t0:.2f} s, pic RSS (parent) "
+          f"{'n/d' if rss is None else f'{rss:.0f} Mo'}", file=sys.stderr)
+    return 1 if (sites["erreur"] != "").any() else 0
+
+
+def _lignes(value):
+    try:
+        return [int(v.replace("_", "").replace("k", "000").replace("M", "000000")) for v in value.split(",") if v]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"tailles invalides: {value} (ex. 10k,100k,2M)")
+
+
+def cmd_generer(args):
+    from .synthetic import generate_workbook
+
+    t0 = time.perf_counter()
+    generate_workbook(args.classeur, n_ventes=args.lignes, seed=args.seed)
+    print(f"{args.classeur}: {args.lignes} ligne(s) de ventes, seed {args.seed} ({time.perf_counter() - t0:.1f} s)")
+    return 0
+
+
+def cmd_bench(args):
+    from . import bench
+
+    log = (lambda *a, **k: None) if args.quiet else (lambda msg: print(msg, file=sys.stderr))
+    doc = bench.run(args.lignes, seed=args.seed, repetitions=args.repetitions, memoire=not args.sans_memoire,
+                    only=args.cas, dossier=args.dossier, log=log)
+    bench.save_json(doc, args.sortie)
+    print(f"résultats -> {args.sortie}")
+    code = 0
+    if args.baseline and pathlib.Path(args.baseline).exists() and not args.enregistrer_baseline:
+        regressions = bench.compare(doc, bench.load_json(args.baseline), args.seuil_temps, args.seuil_memoire)
+        for r in regressions:
+            print(f"RÉGRESSION {r['cas']} ({r['lignes']} lignes) {r['mesure']}: "
+                  f"{r['référence']:.4g} -> {r['actuel']:.4g} (+{r['écart %']:.0f} %)")
+        if not regressions:
+            print(f"aucune régression par rapport à {args.baseline}")
+        code = 1 if regressions else 0
+    if args.enregistrer_baseline:
+        bench.save_json(doc, args.baseline)
+        print(f"référence enregistrée -> {args.baseline}")
+    return code
+
+
+def cmd_prevision(args):
+    if "parquet" in args.formats and not _parquet_engine():
+        print("format parquet: installer pyarrow (ou fastparquet)", file=sys.stderr)
+        return 2
+    from .batch import write_results
+    from .prevision import forecast_workbook
+
+    code = 0
+    for path, out_dir in zip(args.classeurs, _out_dirs(args.sortie, args.classeurs)):
+        t0 = time.perf_counter()
+        try:
+            out = forecast_workbook(path, horizon=args.horizon, workers=args.workers, cache=not args.sans_cache)
+        except Exception as e:
+            print(f"{path}: échec: {e}", file=sys.stderr)
+            code = 1
+            continue
+        bilan = out.pop("bilan")
+        written = write_results(out, out_dir, args.formats, name="Regraga_Prevision")
+        a_commander = (out["Achats_Suggérés"]["Achat suggéré"] > 0).sum()
+        print(f"{path}: {len(out['Prévisions'])} produit(s) ({bilan['ajustés']} ajusté(s), "
+              f"{bilan['mis à jour']} mis à jour), {a_commander} ingrédient(s) à commander "
+              f"({time.perf_counter() - t0:.2f} s)")
+        for w in written:
+            print(f"  -> {w}")
+    return code
+
+
+def cmd_service(args):
+    from .service import SalesService
+
+    service = SalesService(args.classeur, host=args.hote, port=args.port, export_sec=args.export)
+    print(f"{args.classeur}: {len(service.catalogue)} produit(s), ventes reçues sur http://{args.hote}:{args.port} "
+          f"(export toutes les {args.export} s, Ctrl+C pour arrêter)", file=sys.stderr)
+    service.run()
+    print(f"arrêt: {service.stats['ventes']} vente(s) reçue(s), {service.stats['exportées']} exportée(s)", file=sys.stderr)
+    return 0
+
+
+def cmd_charge(args):
+    import shutil
+    import tempfile
+
+    from .service import SalesService, load_test
+
+    service, tmp = None, None
+    url = args.url
+    if url is None:
+        if not args.classeur:
+            print("classeur ou --url requis", file=sys.stderr)
+            return 2
+        # service lancé ici sur une copie du classeur (le vrai classeur et son journal ne sont pas touchés)
+        tmp = tempfile.mkdtemp(prefix="regraga-charge-")
+        copie = pathlib.Path(tmp) / pathlib.Path(args.classeur).name
+        shutil.copyfile(args.classeur, copie)
+        service = SalesService(copie, port=0, export_sec=args.export).start()
+        url = service.url
+    try:
+        r = load_test(url, clients=args.caisses, duree=args.duree, lot=args.lot)
+        # latences et ventes / transaction valent None si aucun lot n'a abouti
+        nd = lambda v: "n/d" if v is None else f"{v:.1f}"
+        print(f"{r['caisses']} caisse(s), {r['durée (s)']:.1f} s: {r['ventes']} vente(s), {r['ventes/s']:.0f} ventes/s, "
+              f"latence p50 {nd(r['latence p50 (ms)'])} ms / p95 {nd(r['latence p95 (ms)'])} ms / "
+              f"p99 {nd(r['latence p99 (ms)'])} ms, {r['transactions']} transaction(s) "
+              f"({nd(r['ventes / transaction'])} vente(s) par transaction), {r['erreurs']} erreur(s)")
+        if r["erreurs"]:
+            print(f"première erreur: {r['première erreur']}", file=sys.stderr)
+        if service is not None:
+            t0 = time.perf_counter()
+            n = len(service.journal)
+            service.stop()
+            print(f"export final de {n} vente(s) vers tbl_Ventes: {time.perf_counter() - t0:.2f} s "
+                  f"({service.stats['exportées']} exportée(s) au total)")
+        return 1 if r["erreurs"] else 0
+    finally:
+        if service is not None:
+            service.stop()
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src", description="Regraga: calculs sans interface graphique.")
+    sub = parser.add_subparsers(dest="commande", required=True)
+
+    p = sub.add_parser("resultats", help="KPI et tableau de pilotage -> Regraga_Resultats.xlsx / CSV / Parquet")
+    p.add_argument("classeurs", nargs="+", help="classeur(s) .xlsx à traiter")
+    p.add_argument("-o", "--sortie", default="resultats", help="dossier de sortie (défaut: resultats)")
+    p.add_argument("--formats", type=_formats, default=["xlsx"], help="liste: xlsx,csv,parquet (défaut: xlsx)")
+    p.add_argument("--sans-journal", action="store_true", help="ignorer les ventes en attente du journal de l'appli")
+    p.add_argument("-q", "--quiet", action="store_true", help="ne pas afficher le détail des étapes")
+    p.set_defaults(func=cmd_resultats)
+
+    p = sub.add_parser("consolider", help="pilotage par site et groupe sur tous les classeurs d'un dossier (en parallèle)")
+    p.add_argument("sources", nargs="+", help="dossier(s) à parcourir ou classeur(s)")
+    p.add_argument("-o", "--sortie", default="resultats", help="dossier de sortie (défaut: resultats)")
+    p.add_argument("-j", "--workers", type=int, default=None, help="nombre de processus (défaut: nb de coeurs)")
+    p.add_argument("--formats", type=_formats, default=["xlsx"], help="liste: xlsx,csv,parquet (défaut: xlsx)")
+    p.add_argument("--sans-journal", action="store_true", help="ignorer les ventes en attente des journaux")
+    p.set_defaults(func=cmd_consolider)
+
+    p = sub.add_parser("generer", help="classeur synthétique de même structure (mesures de performance)")
+    p.add_argument("classeur", help="fichier .xlsx à écrire")
+    p.add_argument("-n", "--lignes", type=lambda v: _lignes(v)[0], default=10_000, help="lignes de tbl_Ventes (ex. 100k)")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=cmd_generer)
+
+    p = sub.add_parser("bench", help="mesure lecture / calcul / écriture; régressions contre une référence JSON")
+    p.add_argument("-n", "--lignes", type=_lignes, default=[10_000], help="tailles de tbl_Ventes (ex. 10k,100k,2M)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("-r", "--repetitions", type=int, default=3)
+    p.add_argument("--cas", nargs="*", help="limiter aux cas nommés (ex. compute_kpis)")
+    p.add_argument("--sans-memoire", action="store_true", help="ne pas mesurer le pic mémoire (tracemalloc)")
+    p.add_argument("--dossier", default=".regraga_bench", help="classeurs générés (réutilisés d'un passage à l'autre)")
+    p.add_argument("-o", "--sortie", default="bench.json", help="fichier JSON des résultats")
+    p.add_argument("--baseline", default="bench_baseline.json", help="référence pour la détection des régressions")
+    p.add_argument("--enregistrer-baseline", action="store_true", help="enregistrer ces résultats comme référence")
+    p.add_argument("--seuil-temps", type=float, default=0.15, help="régression si médiane > référence x (1 + seuil)")
+    p.add_argument("--seuil-memoire", type=float, default=0.20)
+    p.add_argument("-q", "--quiet", action="store_true")
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("prevision", help="quantités prévues par produit et achats suggérés contre tbl_Stock")
+    p.add_argument("classeurs", nargs="+", help="classeur(s) .xlsx à traiter")
+    p.add_argument("-o", "--sortie", default="resultats", help="dossier de sortie (défaut: resultats)")
+    p.add_argument("--horizon", type=int, default=7, help="jours prévus (défaut: 7)")
+    p.add_argument("-j", "--workers", type=int, default=None, help="processus pour les ajustements (défaut: nb de coeurs)")
+    p.add_argument("--sans-cache", action="store_true", help="réajuster tous les produits (états en cache ignorés)")
+    p.add_argument("--formats", type=_formats, default=["xlsx"], help="liste: xlsx,csv,parquet (défaut: xlsx)")
+    p.set_defaults(func=cmd_prevision)
+
+    p = sub.add_parser("service", help="service de saisie des ventes pour plusieurs caisses (HTTP local)")
+    p.add_argument("classeur", help="classeur .xlsx dont tbl_Ventes reçoit les ventes")
+    p.add_argument("--hote", default="127.0.0.1", help="adresse d'écoute (0.0.0.0: postes du réseau local)")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--export", type=float, default=30, help="export vers tbl_Ventes toutes les N s (0: à la demande)")
+    p.set_defaults(func=cmd_service)
+
+    p = sub.add_parser("charge", help="test de charge du service: caisses simultanées, ventes/s et latences")
+    p.add_argument("classeur", nargs="?", help="service lancé sur une copie de ce classeur (sans --url)")
+    p.add_argument("--url", default=None, help="service déjà lancé (ex. http://127.0.0.1:8765)")
+    p.add_argument("-c", "--caisses", type=int, default=4)
+    p.add_argument("-d", "--duree", type=float, default=10.0, help="durée du test (s)")
+    p.add_argument("--lot", type=int, default=1, help="ventes par requête (ticket de plusieurs lignes)")
+    p.add_argument("--export", type=float, default=5, help="export périodique du service lancé ici (s)")
+    p.set_defaults(func=cmd_charge)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
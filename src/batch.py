@@ -0,0 +1,169 @@
+# src/batch.py
+# Calcul sans interface (ni Tk ni Streamlit) des résultats d'un classeur:
+# KPI, tableau de pilotage, CMP ingrédients et coût portion, écrits en
+# Regraga_Resultats.xlsx / CSV / Parquet. Utilisé par `python -m src`.
+
+import os
+import pathlib
+import sys
+import time
+
+import pandas as pd
+
+try:
+    from .calc import build_tableau_pilotage
+    from .io_excel import clean_codes, normalize_frame, product_dictionary, read_workbook
+    from .journal import journal_path_for, SalesJournal
+    from .kpis import compute_kpis
+    from .recettes import cout_portion
+    from .stock import StockLedger
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from calc import build_tableau_pilotage
+    from io_excel import clean_codes, normalize_frame, product_dictionary, read_workbook
+    from journal import journal_path_for, SalesJournal
+    from kpis import compute_kpis
+    from recettes import cout_portion
+    from stock import StockLedger
+
+RESULTS_NAME = "Regraga_Resultats"
+FORMATS = ("xlsx", "csv", "parquet")
+
+
+def peak_rss_mb():
+    """Pic de mémoire résidente du processus (Mo), None si non disponible (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ko sous Linux, octets sous macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class Stages:
+    """
+    Chronométrage des étapes: durée murale et pic RSS atteint à la fin de chaque étape.
+    memory: gain de la normalisation par table (cf. io_excel.normalize_tables).
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.memory = {}
+
+    def run(self, name, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.rows.append({"étape": name, "durée (s)": time.perf_counter() - t0, "pic RSS (Mo)": peak_rss_mb()})
+
+    def report(self, out=sys.stderr):
+        for r in self.rows:
+            rss = "n/d" if r["pic RSS (Mo)"] is None else f"{r['pic RSS (Mo)']:.0f} Mo"
+            print(f"  {r['étape']:<28} {r['durée (s)'] * 1000:9.1f} ms   pic RSS {rss}", file=out)
+        for table, m in self.memory.items():
+            if m["avant (Ko)"]:
+                print(f"  mémoire {table:<20} {m['avant (Ko)']:9.0f} Ko -> {m['après (Ko)']:.0f} Ko "
+                      f"({-m['gain %']:+.0f} %)", file=out)
+            else:
+                print(f"  mémoire {table:<20} {m['après (Ko)']:9.0f} Ko (partagé)", file=out)
+
+
+def _pending_sales(path):
+    """Ventes saisies dans l'appli et pas encore repliées dans le classeur (journal existant seulement)."""
+    jpath = journal_path_for(path)
+    if not jpath.exists():
+        return pd.DataFrame()
+    journal = SalesJournal(jpath, path)
+    try:
+        return journal.pending_frame()
+    finally:
+        journal.close()
+
+
+def compute_results(path, stages=None, journal=True):
+    """
+    Résultats d'un classeur: {nom de feuille: DataFrame}.
+      KPI, Top_Produits, Pilotage, CMP (si tbl_Stock), Coût_Produits (si tbl_Recettes)
+    journal=True ajoute les ventes en attente du journal de l'appli Tk.
+    """
+    stages = stages or Stages()
+    data = stages.run("lecture", read_workbook, str(path), report=stages.memory)
+    produits = data.get("produits")
+    ventes = data.get("ventes")
+    if produits is None or ventes is None:
+        raise ValueError(f"{path}: onglets tbl_Produits / tbl_Ventes introuvables")
+    if journal:
+        pending = stages.run("journal", _pending_sales, path)
+        if not pending.empty:
+            ventes = normalize_frame(pd.concat([ventes, pending], ignore_index=True),
+                                     product_dictionary(ventes, produits))
+
+    results = {}
+    stock = data.get("stock")
+    prices = None
+    if stock is not None:
+        ledger = stages.run("CMP stock", StockLedger.from_workbook, stock, data.get("achats"), data.get("sorties"))
+        prices = ledger.cmp()
+        etat = ledger.state()
+        results["CMP"] = pd.DataFrame({
+            "Cde_Ingrdt": etat.index,
+            "CMP_effectif": etat["cmp"].to_numpy(),
+            "Quantité_totale": etat["qte"].to_numpy(),
+            "Valeur_totale": etat["valeur"].to_numpy(),
+        })
+    couts = None
+    if data.get("recettes") is not None:
+        couts = stages.run("coût recettes", cout_portion, data["recettes"], stock, prices)
+        results["Coût_Produits"] = pd.DataFrame({"Cde_Prdt": couts.index, "Coût_Matière_Portion": couts.to_numpy()})
+
+    # compute_kpis ajoute des colonnes calculées: on lui passe sa propre copie
+    k = stages.run("KPI", compute_kpis, ventes.copy(), produits)
+    results["KPI"] = pd.DataFrame({
+        "Indicateur": ["Total CA", "Coût matière total", "Food cost %"],
+        "Valeur": [k["Total CA"], k["Coût matière total"], k["Food cost %"]],
+    })
+    results["Top_Produits"] = pd.DataFrame(list(k["Top produits"].items()), columns=["Produit", "CA"])
+
+    produits_c = stages.run("codes produits", clean_codes, produits)
+    ventes_c = stages.run("codes ventes", clean_codes, ventes)
+    results["Pilotage"] = stages.run("tableau pilotage", build_tableau_pilotage, produits_c, ventes_c, couts)
+    # ordre des feuilles dans le classeur de sortie
+    order = ["KPI", "Top_Produits", "Pilotage", "CMP", "Coût_Produits"]
+    return {name: results[name] for name in order if name in results}
+
+
+def _parquet_ready(df):
+    # colonnes objet mixtes (texte + nombres des onglets Excel): Parquet exige un type par colonne
+    df = df.copy()
+    for c in df.columns:
+        if df[c].dtype == object:
+            df[c] = df[c].map(lambda v: v if v is None or isinstance(v, str) or pd.isna(v) else str(v))
+    df.columns = [str(c) for c in df.columns]
+    return df
+
+
+def write_results(results, out_dir, formats=("xlsx",), name=RESULTS_NAME):
+    """Écrit les résultats dans out_dir (name.xlsx, name_feuille.csv, ...); retourne la liste des fichiers écrits."""
+    out_dir = pathlib.Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    if "xlsx" in formats:
+        target = out_dir / f"{name}.xlsx"
+        tmp = target.with_name(target.name + ".tmp")
+        with pd.ExcelWriter(tmp, engine="openpyxl") as writer:
+            for sheet, df in results.items():
+                df.to_excel(writer, sheet_name=sheet, index=False)
+        os.replace(tmp, target)
+        written.append(target)
+    for fmt in ("csv", "parquet"):
+        if fmt not in formats:
+            continue
+        for sheet, df in results.items():
+            target = out_dir / f"{name}_{sheet}.{fmt}"
+            if fmt == "csv":
+                df.to_csv(target, index=False, encoding="utf-8-sig")
+            else:
+                _parquet_ready(df).to_parquet(target, index=False)
+            written.append(target)
+    return written
@@ -0,0 +1,194 @@
+# src/bench.py
+# Banc de mesure des chemins lecture / calcul / écriture sur des classeurs
+# synthétiques (src/synthetic.py): durée (min / médiane sur n répétitions) et pic
+# mémoire (tracemalloc, passe séparée pour ne pas fausser les durées).
+# Résultats en JSON; comparaison à une référence enregistrée -> régressions signalées.
+
+import contextlib
+import json
+import os
+import pathlib
+import platform
+import shutil
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+try:
+    from .synthetic import generate_workbook
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from synthetic import generate_workbook
+
+BENCH_DIRNAME = ".regraga_bench"
+SEUIL_TEMPS = 0.15     # +15 % sur la médiane
+SEUIL_MEMOIRE = 0.20   # +20 % sur le pic mémoire
+PLANCHER_S = 0.005     # écarts sous 5 ms ignorés (bruit de mesure)
+
+
+def workbook_for(n_ventes, seed=0, dossier=BENCH_DIRNAME):
+    """Classeur synthétique de n_ventes lignes (généré une fois, réutilisé ensuite)."""
+    d = pathlib.Path(dossier)
+    d.mkdir(parents=True, exist_ok=True)
+    path = d / f"synth-{n_ventes}-s{seed}.xlsx"
+    if not path.exists():
+        tmp = path.with_name(path.name + ".tmp")
+        generate_workbook(tmp, n_ventes=n_ventes, seed=seed)
+        os.replace(tmp, path)
+    return path
+
+
+@contextlib.contextmanager
+def _app_on(path):
+    """Fait pointer app.py (load_tables / save_tables) sur un autre classeur le temps d'une mesure."""
+    import app
+    old = app.EXCEL_PATH
+    app.EXCEL_PATH = pathlib.Path(path)
+    try:
+        yield app
+    finally:
+        app.EXCEL_PATH = old
+
+
+def cases(path, work_dir):
+    """
+    Cas mesurés: nom -> (préparation, mesure). La préparation n'est pas chronométrée
+    et renvoie les arguments de la mesure.
+    """
+    from .cache import invalidate
+    import numpy as np
+
+    from .calc import PriceScenarios, build_tableau_pilotage
+    from .io_excel import clean_codes, read_workbook
+    from .kpis import compute_kpis
+
+    data = read_workbook(str(path))
+    ventes, produits = data["ventes"], data["produits"]
+    copie = pathlib.Path(work_dir) / "save_tables.xlsx"
+
+    def cold():
+        invalidate(path)
+        return ()
+
+    def save_prep():
+        shutil.copyfile(path, copie)
+        return (ventes, produits)
+
+    def load_tables():
+        with _app_on(path) as app:
+            return app.load_tables()
+
+    def save_tables(v, p):
+        with _app_on(copie) as app:
+            app.save_tables(v, p)
+
+    def what_if_prep():
+        return (PriceScenarios.from_tables(clean_codes(produits), clean_codes(ventes), charges_df=data.get("charges")),)
+
+    def what_if(sim):
+        sim.grid(np.arange(-20, 20.5, 0.5), np.arange(-10, 31, 1), elasticite=-0.8).totals()
+
+    def append_sale(ligne):
+        with _app_on(copie) as app:
+            app.append_sales(ligne)
+
+    return {
+        "read_workbook (sans cache)": (cold, lambda: read_workbook(str(path))),
+        "read_workbook (cache)": (lambda: (), lambda: read_workbook(str(path))),
+        "load_tables": (lambda: (), load_tables),
+        "compute_kpis": (lambda: (ventes.copy(),), lambda v: compute_kpis(v, produits)),
+        "build_tableau_pilotage": (lambda: (produits, ventes),
+                                   lambda p, v: build_tableau_pilotage(clean_codes(p), clean_codes(v))),
+        "what_if (grille 81x41)": (what_if_prep, what_if),
+        "save_tables": (save_prep, save_tables),
+        "append_sales (1 vente)": (lambda: (save_prep()[0].tail(1),), append_sale),
+    }
+
+
+def measure(prep, fn, repetitions=3, memoire=True):
+    durees = []
+    for _ in range(repetitions):
+        args = prep()
+        t0 = time.perf_counter()
+        fn(*args)
+        durees.append(time.perf_counter() - t0)
+    pic = None
+    if memoire:
+        args = prep()
+        tracemalloc.start()
+        try:
+            fn(*args)
+            pic = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return {"min (s)": min(durees), "médiane (s)": statistics.median(durees), "répétitions": repetitions,
+            "pic mémoire (Mo)": pic}
+
+
+def _meta(seed):
+    import numpy
+    import pandas
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": platform.python_version(),
+            "pandas": pandas.__version__, "numpy": numpy.__version__, "plateforme": platform.platform(),
+            "seed": seed}
+
+
+def run(lignes=(10_000,), seed=0, repetitions=3, memoire=True, only=None, dossier=BENCH_DIRNAME, log=print):
+    """Mesure chaque cas pour chaque taille de tbl_Ventes; retourne le document JSON des résultats."""
+    resultats = []
+    for n in lignes:
+        t0 = time.perf_counter()
+        path = workbook_for(n, seed, dossier)
+        log(f"classeur {path} ({time.perf_counter() - t0:.1f} s)")
+        work = pathlib.Path(dossier) / "travail"
+        work.mkdir(exist_ok=True)
+        for nom, (prep, fn) in cases(path, work).items():
+            if only and nom not in only:
+                continue
+            try:
+                r = measure(prep, fn, repetitions, memoire)
+            except ImportError as e:  # ex. tkinter absent pour load_tables / save_tables
+                log(f"  {nom:<28} ignoré ({e})")
+                continue
+            r.update({"cas": nom, "lignes": n})
+            resultats.append(r)
+            pic = "" if r["pic mémoire (Mo)"] is None else f"   pic {r['pic mémoire (Mo)']:.1f} Mo"
+            log(f"  {nom:<28} médiane {r['médiane (s)'] * 1000:9.1f} ms   min {r['min (s)'] * 1000:9.1f} ms{pic}")
+    return {"meta": _meta(seed), "resultats": resultats}
+
+
+def compare(doc, baseline, seuil_temps=SEUIL_TEMPS, seuil_memoire=SEUIL_MEMOIRE):
+    """Régressions de doc par rapport à baseline (même cas, même taille)."""
+    ref = {(r["cas"], r["lignes"]): r for r in baseline.get("resultats", [])}
+    regressions = []
+    for r in doc["resultats"]:
+        b = ref.get((r["cas"], r["lignes"]))
+        if b is None:
+            continue
+        t, tb = r["médiane (s)"], b["médiane (s)"]
+        if t > tb * (1 + seuil_temps) and t - tb > PLANCHER_S:
+            regressions.append({"cas": r["cas"], "lignes": r["lignes"], "mesure": "durée",
+                                "référence": tb, "actuel": t, "écart %": (t / tb - 1) * 100})
+        m, mb = r.get("pic mémoire (Mo)"), b.get("pic mémoire (Mo)")
+        if m is not None and mb and m > mb * (1 + seuil_memoire):
+            regressions.append({"cas": r["cas"], "lignes": r["lignes"], "mesure": "mémoire",
+                                "référence": mb, "actuel": m, "écart %": (m / mb - 1) * 100})
+    return regressions
+
+
+def save_json(doc, path):
+    path = pathlib.Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def load_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,309 @@
+# src/cache.py
+# Cache colonne par colonne (.npy + manifest JSON) des onglets du classeur,
+# rangé à côté du fichier Excel dans '.regraga_cache/'.
+#  - clé rapide: chemin + taille + mtime -> aucun accès au zip si rien n'a bougé
+#  - sinon: CRC de chaque partie XML (annuaire du zip) -> seuls les onglets
+#    modifiés sont relus; la table des chaînes partagées est vérifiée par
+#    préfixe (Excel ajoute en fin de table, les index existants restent valides)
+#  - éviction LRU au-delà de max_bytes, invalidation forcée possible
+#  - jamais de pickle: colonnes numériques / dates en .npy (allow_pickle=False),
+#    colonnes texte / mixtes en JSON (le dossier est synchronisé avec le classeur)
+
+import datetime
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .xlsx import open_zip, part_crcs, read_sheets, read_shared_strings, shared_strings_part, sheet_parts
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from xlsx import open_zip, part_crcs, read_sheets, read_shared_strings, shared_strings_part, sheet_parts
+
+CACHE_DIRNAME = ".regraga_cache"
+MANIFEST = "manifest.json"
+FORMAT = 2  # 1: colonnes object picklées (relues une fois puis remplacées)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# REGRAGA_CACHE=0 désactive complètement le cache
+CACHE_ENABLED = os.environ.get("REGRAGA_CACHE", "1") != "0"
+
+
+def fingerprint(path):
+    """Empreinte légère d'un fichier: "taille:mtime en ns", None s'il est absent."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def _sst_hash(strings, count):
+    h = hashlib.sha1()
+    for s in strings[:count]:
+        h.update(s.encode("utf-8", "surrogatepass"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _json_default(v):
+    # cellules non JSON natives -> valeur étiquetée (cf. _json_hook)
+    if v is pd.NA:
+        return None
+    if isinstance(v, datetime.datetime):
+        return {"$": "datetime", "v": v.isoformat()}
+    if isinstance(v, datetime.date):
+        return {"$": "date", "v": v.isoformat()}
+    if isinstance(v, datetime.time):
+        return {"$": "time", "v": v.isoformat()}
+    if isinstance(v, datetime.timedelta):
+        return {"$": "timedelta", "v": v.total_seconds()}
+    if hasattr(v, "item"):
+        return v.item()
+    return str(v)
+
+
+def _json_hook(o):
+    kind = o.get("$")
+    if kind == "datetime":
+        return pd.Timestamp(o["v"])
+    if kind == "date":
+        return datetime.date.fromisoformat(o["v"])
+    if kind == "time":
+        return datetime.time.fromisoformat(o["v"])
+    if kind == "timedelta":
+        return pd.Timedelta(seconds=o["v"])
+    return o
+
+
+def _save_column(base, arr):
+    """Colonne -> base.npy (types NumPy natifs) ou base.json (object); retourne l'encodage."""
+    if arr.dtype.hasobject:
+        with open(str(base) + ".json", "w", encoding="utf-8") as f:
+            json.dump(arr.tolist(), f, ensure_ascii=False, default=_json_default)
+        return "json"
+    np.save(str(base) + ".npy", arr, allow_pickle=False)
+    return "npy"
+
+
+def _load_column(base, enc):
+    if enc == "json":
+        with open(str(base) + ".json", encoding="utf-8") as f:
+            values = json.load(f, object_hook=_json_hook)
+        arr = np.empty(len(values), dtype=object)
+        arr[:] = values
+        return arr
+    return np.load(str(base) + ".npy", allow_pickle=False)
+
+
+def _dir_size(p):
+    return sum(f.stat().st_size for f in p.rglob("*") if f.is_file())
+
+
+class SheetCache:
+    """Cache des DataFrames d'onglets pour les classeurs d'un répertoire."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, reader=None):
+        self.max_bytes = max_bytes
+        self.reader = reader or read_sheets
+        self._lock = threading.Lock()
+
+    # ---- emplacement ----
+    @staticmethod
+    def root_for(path):
+        return pathlib.Path(path).resolve().parent / CACHE_DIRNAME
+
+    def dir_for(self, path):
+        p = pathlib.Path(path).resolve()
+        key = hashlib.sha1(str(p).encode("utf-8")).hexdigest()[:10]
+        return self.root_for(p) / f"{p.stem}-{key}"
+
+    # ---- API ----
+    def load(self, path, sheets, force=False):
+        """
+        Retourne {onglet: DataFrame} pour les onglets demandés (absents ignorés).
+        force=True ignore le cache et relit les onglets depuis le classeur.
+        """
+        path = pathlib.Path(path)
+        sheets = list(dict.fromkeys(sheets))
+        if not CACHE_ENABLED:
+            return dict(self.reader(path, sheets))
+        try:
+            return self._load(path, sheets, force)
+        except (ValueError, OSError, EOFError):
+            if not path.exists():
+                raise
+            # entrée illisible (fichier tronqué, format inattendu): cache du classeur reconstruit
+            self.invalidate(path)
+            return self._load(path, sheets, True)
+
+    def _load(self, path, sheets, force):
+        with self._lock:
+            d = self.dir_for(path)
+            manifest = self._read_manifest(d)
+            fp = fingerprint(path)
+            cached = manifest.get("sheets", {})
+
+            if not force and manifest.get("fingerprint") == fp and all(s in cached or s in manifest.get("absent", []) for s in sheets):
+                out = self._load_many(d, manifest, [s for s in sheets if s in cached])
+                self._write_manifest(d, manifest)  # dates d'accès pour l'éviction LRU
+                return out
+
+            stale, present, crcs = self._stale_sheets(d, path, manifest, sheets, force)
+            fresh = dict(self.reader(path, stale)) if stale else {}
+            for name, df in fresh.items():
+                self._store(d, manifest, name, df, crcs[name])
+            manifest["fingerprint"] = fp
+            manifest["absent"] = [s for s in sheets if s not in present]
+            out = {s: fresh[s] for s in stale if s in fresh}
+            out.update(self._load_many(d, manifest, [s for s in present if s not in out]))
+            self._write_manifest(d, manifest)
+        self.evict(self.root_for(path))
+        return {s: out[s] for s in sheets if s in out}
+
+    def invalidate(self, path):
+        """Supprime le cache du classeur path (les autres classeurs du répertoire sont conservés)."""
+        with self._lock:
+            shutil.rmtree(self.dir_for(path), ignore_errors=True)
+
+    def evict(self, root):
+        """Éviction LRU (date du dernier accès) jusqu'à max_bytes, tous classeurs du répertoire confondus."""
+        root = pathlib.Path(root)
+        if not root.exists():
+            return
+        entries = []
+        for d in root.iterdir():
+            if not d.is_dir():
+                continue
+            manifest = self._read_manifest(d)
+            for name, meta in manifest.get("sheets", {}).items():
+                entries.append((meta.get("last_access", 0), meta.get("bytes", 0), d, name))
+        total = sum(e[1] for e in entries)
+        if total <= self.max_bytes:
+            return
+        with self._lock:
+            for _, size, d, name in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                manifest = self._read_manifest(d)
+                meta = manifest.get("sheets", {}).pop(name, None)
+                if meta:
+                    shutil.rmtree(d / meta["dir"], ignore_errors=True)
+                    self._write_manifest(d, manifest)
+                total -= size
+
+    # ---- internes ----
+    def _stale_sheets(self, d, path, manifest, sheets, force):
+        """Onglets à relire: nouveaux, CRC modifié ou chaînes partagées réécrites."""
+        zf = open_zip(str(path))
+        with zf:
+            parts = sheet_parts(zf)
+            crcs = part_crcs(zf)
+            sst_part = shared_strings_part(zf)
+            sst_crc = crcs.get(sst_part, (None, None))[0] if sst_part else None
+            old_sst = manifest.get("sst", {})
+            sst_ok = True
+            if old_sst.get("crc") != sst_crc:
+                strings = read_shared_strings(zf)
+                count = old_sst.get("count", 0)
+                sst_ok = len(strings) >= count and _sst_hash(strings, count) == old_sst.get("hash")
+                manifest["sst"] = {"crc": sst_crc, "count": len(strings), "hash": _sst_hash(strings, len(strings))}
+        cached = manifest.setdefault("sheets", {})
+        if not sst_ok:
+            # index de chaînes décalés: plus aucun onglet en cache n'est fiable
+            for meta in cached.values():
+                shutil.rmtree(d / meta["dir"], ignore_errors=True)
+            cached.clear()
+        present = [s for s in sheets if s in parts]
+        sheet_crcs = {s: list(crcs.get(parts[s], (None, None))) for s in present}
+        stale = [s for s in present if force or s not in cached or cached[s]["crc"] != sheet_crcs[s]]
+        return stale, present, sheet_crcs
+
+    def _store(self, d, manifest, name, df, crc):
+        sub = f"s{hashlib.sha1(name.encode('utf-8')).hexdigest()[:12]}"
+        d.mkdir(parents=True, exist_ok=True)
+        tmp = pathlib.Path(tempfile.mkdtemp(dir=d, prefix=".tmp-"))
+        cols = []
+        for i, col in enumerate(df.columns):
+            s = df[col]
+            enc = _save_column(tmp / f"c{i}", s.to_numpy())
+            cols.append({"name": col if isinstance(col, (str, int, float)) else str(col), "dtype": str(s.dtype), "enc": enc})
+        final = d / sub
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+        manifest["sheets"][name] = {
+            "dir": sub,
+            "crc": crc,
+            "rows": len(df),
+            "columns": cols,
+            "bytes": _dir_size(final),
+            "last_access": time.time(),
+        }
+
+    def _load_many(self, d, manifest, names):
+        out = {}
+        for name in names:
+            meta = manifest["sheets"][name]
+            meta["last_access"] = time.time()
+            out[name] = self._load_sheet(d / meta["dir"], meta)
+        return out
+
+    @staticmethod
+    def _load_sheet(sub, meta):
+        data = {}
+        names = []
+        for i, c in enumerate(meta["columns"]):
+            arr = _load_column(sub / f"c{i}", c["enc"])
+            s = pd.Series(arr, copy=False)
+            if str(s.dtype) != c["dtype"]:
+                try:
+                    s = s.astype(c["dtype"])
+                except (TypeError, ValueError):
+                    pass
+            data[i] = s
+            names.append(c["name"])
+        df = pd.DataFrame(data) if data else pd.DataFrame(index=range(meta["rows"]))
+        df.columns = names if names else df.columns
+        return df
+
+    def _read_manifest(self, d):
+        try:
+            with open(d / MANIFEST, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        # ancien format: tout est relu puis réécrit sans pickle
+        return manifest if manifest.get("format") == FORMAT else {}
+
+    def _write_manifest(self, d, manifest):
+        manifest["format"] = FORMAT
+        d.mkdir(parents=True, exist_ok=True)
+        tmp = d / (MANIFEST + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, d / MANIFEST)
+
+
+_default = None
+
+
+def default_cache():
+    global _default
+    if _default is None:
+        _default = SheetCache()
+    return _default
+
+
+def load_sheets(path, sheets, force=False):
+    """Raccourci: onglets demandés via le cache par défaut."""
+    return default_cache().load(path, sheets, force=force)
+
+
+def invalidate(path):
+    default_cache().invalidate(path)
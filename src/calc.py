@@ -3,35 +3,44 @@
 import pandas as pd
 import numpy as np
 
+try:
+    from .kpis import COLS_CA, COLS_CMP, COLS_COUT_LIGNE, COLS_PRIX, COLS_PRODUIT, COLS_QTE, cell_number, choose_col
+    from .perf import timed
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from kpis import COLS_CA, COLS_CMP, COLS_COUT_LIGNE, COLS_PRIX, COLS_PRODUIT, COLS_QTE, cell_number, choose_col
+    from perf import timed
+
 def ensure_columns(df, cols):
     for c in cols:
         if c not in df.columns:
             df[c] = np.nan
     return df
 
-def build_tableau_pilotage(produits_df, ventes_df):
+@timed("build_tableau_pilotage")
+def build_tableau_pilotage(produits_df, ventes_df, cout_portion=None):
     """
     Produit un tableau de pilotage simple: total ventes par produit, CMP et marge fictive.
     Attentes minimalistes: produits_df contient 'code' et 'CMP' (coût), ventes_df contient 'code' et 'quantité'/'qte'/'quantity'
+    cout_portion: Series code -> coût portion calculé depuis tbl_Recettes (src/recettes.py),
+    prioritaire sur le CMP saisi quand le produit a une recette.
     """
     if produits_df is None or ventes_df is None:
         return pd.DataFrame()
 
-    produits = produits_df.copy()
-    ventes = ventes_df.copy()
+    # copie superficielle des produits (colonnes renommées / remplacées sans toucher
+    # à l'appelant); côté ventes seules les colonnes code et quantité sont lues
+    produits = produits_df.copy(deep=False)
 
     # normaliser noms colonnes
-    if "quantité" in ventes.columns:
-        ventes.rename(columns={"quantité": "qte"}, inplace=True)
-    if "qte" not in ventes.columns and "quantity" in ventes.columns:
-        ventes.rename(columns={"quantity": "qte"}, inplace=True)
-    if "qte" not in ventes.columns:
+    qcol = None
+    for c in ("quantité", "qte", "quantity"):
+        if c in ventes_df.columns:
+            qcol = c
+            break
+    if qcol is None:
         # essayer d'inférer
-        possible = [c for c in ventes.columns if "qte" in c.lower() or "qty" in c.lower()]
-        if possible:
-            ventes.rename(columns={possible[0]: "qte"}, inplace=True)
-        else:
-            ventes["qte"] = 1
+        possible = [c for c in ventes_df.columns if "qte" in c.lower() or "qté" in c.lower() or "qty" in c.lower()]
+        qcol = possible[0] if possible else None
 
     # CMP attendu
     if "CMP" not in produits.columns:
@@ -41,10 +50,15 @@ def build_tableau_pilotage(produits_df, ventes_df):
                 produits.rename(columns={c: "CMP"}, inplace=True)
                 break
     produits["CMP"] = pd.to_numeric(produits.get("CMP", pd.Series(0)), errors="coerce").fillna(0)
-    ventes["qte"] = pd.to_numeric(ventes["qte"], errors="coerce").fillna(0)
+    if cout_portion is not None and len(cout_portion) and "code" in produits.columns:
+        produits["CMP"] = produits["code"].map(cout_portion).astype(float).fillna(produits["CMP"])
+    if qcol is not None:
+        qte = pd.to_numeric(ventes_df[qcol], errors="coerce").fillna(0)
+    else:
+        qte = pd.Series(1, index=ventes_df.index)
 
-    # joindre
-    ventes_agg = ventes.groupby("code", as_index=False).agg({"qte":"sum"})
+    # joindre (code en catégories après normalize_tables: regroupement sur les codes entiers)
+    ventes_agg = qte.groupby(ventes_df["code"], observed=True).sum().rename("qte").reset_index()
     table = ventes_agg.merge(produits, on="code", how="left")
 
     table["total_cost"] = table["CMP"] * table["qte"]
@@ -53,9 +67,578 @@ def build_tableau_pilotage(produits_df, ventes_df):
         table["prix_vente"] = pd.to_numeric(table["prix_vente"], errors="coerce").fillna(0)
     elif "Prix de vente" in table.columns:
         table["prix_vente"] = pd.to_numeric(table["Prix de vente"], errors="coerce").fillna(0)
+    elif "Prix Menu" in table.columns:
+        table["prix_vente"] = pd.to_numeric(table["Prix Menu"], errors="coerce").fillna(0)
 
     table["revenue"] = table.get("prix_vente", 0) * table["qte"]
     table["marge"] = table["revenue"] - table["total_cost"]
     table = table.sort_values(by="qte", ascending=False)
 
-    return table
\ No newline at end of file
+    return table
+
+
+# ---------- Cubes temporels (jour / semaine / mois x produit) ----------
+# Agrégats matérialisés de tbl_Ventes: une cellule par (période, produit) avec
+# CA, quantité et coût matière. Catégorie (onglets tbl_PtDj&Sup, tbl_Taj&Pla, ...)
+# et famille sont des attributs du produit, regroupés à la lecture: le cube reste
+# de la taille (nb périodes x nb produits vendus), pas de la taille du journal.
+
+GRAINS = ("jour", "semaine", "mois")
+MESURES = ["ca", "qte", "cout"]
+COLS_DATE = ["Date", "date"]
+COLS_CODE = ["Cde_Prdt", "Code produit", "code"]
+# onglets catégories: sous-ensembles de tbl_Recettes par carte
+SHEETS_CATEGORIES = ("tbl_PtDj&Sup", "tbl_Taj&Pla", "tbl_Snk&Ita", "tbl_GaufCre&Dsrt", "tbl_BoissonJus")
+
+
+def _to_dates(s):
+    """Dates d'une colonne mixte (datetime Excel + texte saisi dans l'appli)."""
+    d = pd.to_datetime(s, errors="coerce")
+    miss = d.isna() & s.notna()
+    if miss.any():
+        d[miss] = pd.to_datetime(s[miss].astype(str), errors="coerce")
+    return d
+
+
+def _to_date(v):
+    """Date d'une cellule (datetime Excel ou texte saisi dans l'appli), NaT si illisible."""
+    if v is None:
+        return pd.NaT
+    d = pd.to_datetime(v, errors="coerce")
+    if pd.isna(d) and not (isinstance(v, float) and v != v):
+        d = pd.to_datetime(str(v), errors="coerce")
+    return d
+
+
+def _period_codes(grain, dates):
+    """Code entier de période: jours depuis 1970, lundi de la semaine, ou mois depuis 1970."""
+    d = np.asarray(dates, dtype="datetime64[ns]")
+    if grain == "mois":
+        return d.astype("datetime64[M]").astype(np.int64)
+    days = d.astype("datetime64[D]").astype(np.int64)
+    if grain == "semaine":
+        return days - (days + 3) % 7  # 1970-01-01 est un jeudi
+    if grain == "jour":
+        return days
+    raise ValueError(f"grain inconnu: {grain} (attendu: {', '.join(GRAINS)})")
+
+
+def _period_labels(grain, codes):
+    codes = np.asarray(codes, dtype=np.int64)
+    if grain == "mois":
+        return pd.PeriodIndex(codes.astype("datetime64[M]"), freq="M").astype(str)
+    return pd.DatetimeIndex(codes.astype("datetime64[D]")).strftime("%Y-%m-%d")
+
+
+def category_frame(tables):
+    """Produit / code -> catégorie depuis les onglets catégories présents ({onglet: DataFrame})."""
+    parts = []
+    for name in SHEETS_CATEGORIES:
+        df = tables.get(name)
+        if df is None or df.empty:
+            continue
+        cols = [c for c in ("Cde_Prdt", "Produit") if c in df.columns]
+        part = df[cols].dropna(how="all").drop_duplicates()
+        part["Catégorie"] = name.replace("tbl_", "", 1)
+        parts.append(part)
+    if not parts:
+        return pd.DataFrame(columns=["Cde_Prdt", "Produit", "Catégorie"])
+    return pd.concat(parts, ignore_index=True)
+
+
+def cube_dimensions(produits_df=None, categories_df=None):
+    """
+    Attributs produit pour les regroupements du cube: {"catégorie": {clé: valeur}, "famille": {...}}.
+    Les clés sont à la fois les codes et les noms produit (les lignes saisies n'ont pas toujours le code).
+    """
+    dims = {"catégorie": {}, "famille": {}}
+    for df, col, dim in ((categories_df, "Catégorie", "catégorie"), (produits_df, "Famille", "famille")):
+        if df is None or df.empty or col not in df.columns:
+            continue
+        for key in ("Produit", "Cde_Prdt"):
+            if key in df.columns:
+                sub = df[[key, col]].dropna()
+                dims[dim].update(zip(sub[key].astype(str).str.strip(), sub[col]))
+    return dims
+
+
+class _Cells:
+    """Cellules d'un grain: (période, produit) -> indice; mesures en tableaux NumPy extensibles."""
+
+    def __init__(self):
+        self.index = {}
+        self.periode = np.empty(0, dtype=np.int32)
+        self.produit = np.empty(0, dtype=np.int32)
+        self.values = np.empty((0, len(MESURES)))
+        self.n = 0
+
+    def locate(self, periodes, produits):
+        """Indices de cellules pour des clés uniques (cellules créées au besoin)."""
+        out = np.empty(len(periodes), dtype=np.int64)
+        for k, key in enumerate(zip(periodes.tolist(), produits.tolist())):
+            cell = self.index.get(key)
+            if cell is None:
+                cell = self._new(*key)
+            out[k] = cell
+        return out
+
+    def _new(self, periode, produit):
+        if self.n == len(self.periode):
+            cap = max(64, 2 * self.n)
+            self.periode = np.resize(self.periode, cap)
+            self.produit = np.resize(self.produit, cap)
+            values = np.zeros((cap, len(MESURES)))
+            values[:self.n] = self.values[:self.n]
+            self.values = values
+        cell = self.n
+        self.periode[cell] = periode
+        self.produit[cell] = produit
+        self.values[cell] = 0.0
+        self.index[(periode, produit)] = cell
+        self.n += 1
+        return cell
+
+    @property
+    def nbytes(self):
+        return self.periode[:self.n].nbytes + self.produit[:self.n].nbytes + self.values[:self.n].nbytes
+
+
+class SalesCube:
+    """
+    Cube des ventes par jour / semaine / mois x produit, mis à jour ligne par ligne.
+      from_frame(ventes)          -> amorçage vectorisé depuis tbl_Ventes
+      add(ligne) / add_frame(df)  -> nouvelles ventes (sign=-1 pour retirer)
+      frame(grain, by, ...)       -> agrégats par période et produit / catégorie / famille
+      compare(grain, a, b, by)    -> période a contre période b (ex. mars contre février)
+    Les lignes sans date ou sans produit (lignes vides du tableau Excel) sont ignorées.
+    """
+
+    def __init__(self, dimensions=None):
+        self.dimensions = {k: dict(v) for k, v in (dimensions or {}).items()}
+        self.produits = []          # id -> nom produit
+        self._pid = {}              # nom produit -> id
+        self.attributs = {k: [] for k in self.dimensions}  # dimension -> valeur par id produit
+        self.grains = {g: _Cells() for g in GRAINS}
+        self._cols = None
+
+    @classmethod
+    def from_frame(cls, ventes_df, dimensions=None):
+        cube = cls(dimensions)
+        return cube.add_frame(ventes_df)
+
+    # ---- mise à jour ----
+    def _resolve(self, df):
+        self._cols = (
+            choose_col(df, COLS_DATE),
+            choose_col(df, COLS_PRODUIT),
+            choose_col(df, COLS_CODE),
+            choose_col(df, COLS_QTE),
+            choose_col(df, COLS_PRIX),
+            choose_col(df, COLS_CA),
+            choose_col(df, COLS_CMP),
+            choose_col(df, COLS_COUT_LIGNE),
+        )
+
+    def _product_ids(self, noms, codes):
+        ids = np.empty(len(noms), dtype=np.int32)
+        for k, (nom, code) in enumerate(zip(noms, codes)):
+            pid = self._pid.get(nom)
+            if pid is None:
+                pid = self._pid[nom] = len(self.produits)
+                self.produits.append(nom)
+                for dim, mapping in self.dimensions.items():
+                    valeur = mapping.get(code) if code is not None else None
+                    self.attributs[dim].append(valeur if valeur is not None else mapping.get(nom))
+            ids[k] = pid
+        return ids
+
+    def add_frame(self, df, sign=1):
+        """Ajoute (sign=1) ou retire (sign=-1) un lot de lignes de vente: un regroupement par lot."""
+        if df is None or df.empty:
+            return self
+        if self._cols is None:
+            self._resolve(df)
+        col_date, col_prod, col_code, q, px, col_ca, cmpcol, col_cm = self._cols
+
+        def num(col):
+            if col is None or col not in df.columns:
+                return pd.Series(np.nan, index=df.index)
+            return pd.to_numeric(df[col], errors="coerce")
+
+        qte = num(q).fillna(0.0)
+        ca = num(col_ca) if col_ca in df.columns else num(px).fillna(0.0) * qte
+        cout = num(col_cm) if col_cm in df.columns else num(cmpcol).fillna(0.0) * qte
+        dates = _to_dates(df[col_date]) if col_date in df.columns else pd.Series(pd.NaT, index=df.index)
+        prod = df[col_prod] if col_prod in df.columns else pd.Series(pd.NA, index=df.index, dtype="string")
+        if isinstance(prod.dtype, pd.CategoricalDtype):
+            # produits en catégories (normalize_tables): on regroupe sur les codes entiers,
+            # le nettoyage des noms ne porte que sur le dictionnaire
+            labels = np.asarray(prod.cat.categories.astype(str).str.strip(), dtype=object)
+            keys = prod.cat.codes.to_numpy()
+            ok = dates.notna().to_numpy() & (keys >= 0)
+        else:
+            noms = prod.astype("string").str.strip()
+            keys = noms.to_numpy(dtype=object)
+            ok = (dates.notna() & noms.notna()).to_numpy()
+        if not ok.any():
+            return self
+        codes = df[col_code].astype("string").str.strip()[ok] if col_code in df.columns else pd.Series(None, index=df.index[ok])
+        nom_u, inv = np.unique(keys[ok], return_inverse=True)
+        if isinstance(prod.dtype, pd.CategoricalDtype):
+            nom_u = labels[nom_u]
+        first = np.unique(inv, return_index=True)[1]
+        code_u = [None if pd.isna(c) else c for c in codes.to_numpy(dtype=object)[first]]
+        pid = self._product_ids(nom_u.tolist(), code_u)[inv]
+        mesures = sign * np.column_stack([ca.to_numpy(dtype=float)[ok], qte.to_numpy(dtype=float)[ok],
+                                          cout.to_numpy(dtype=float)[ok]])
+        mesures = np.nan_to_num(mesures)
+        dvals = dates.to_numpy(dtype="datetime64[ns]")[ok]
+        for grain, cells in self.grains.items():
+            key = _period_codes(grain, dvals) * (1 << 31) + pid
+            uniq, inv_k = np.unique(key, return_inverse=True)
+            sums = np.zeros((len(uniq), len(MESURES)))
+            np.add.at(sums, inv_k, mesures)
+            idx = cells.locate(uniq // (1 << 31), uniq % (1 << 31))
+            cells.values[idx] += sums
+        return self
+
+    def add(self, ligne, sign=1):
+        """Ajoute une ligne (dict ou Series): une cellule par grain, sans regroupement."""
+        if self._cols is None:
+            self._resolve(pd.DataFrame(columns=list(ligne.keys())))
+        col_date, col_prod, col_code, q, px, col_ca, cmpcol, col_cm = self._cols
+        date = _to_date(ligne.get(col_date)) if col_date else pd.NaT
+        nom = ligne.get(col_prod) if col_prod else None
+        if pd.isna(date) or nom is None or pd.isna(nom) or not str(nom).strip():
+            return self  # mêmes lignes ignorées que add_frame
+        code = ligne.get(col_code) if col_code else None
+        code = None if code is None or pd.isna(code) else str(code).strip()
+        pid = self._product_ids([str(nom).strip()], [code])[0]
+        # mêmes règles que add_frame: colonne CA / coût de la ligne si présente, sinon prix x qté
+        qte = cell_number(ligne.get(q)) if q else 0.0
+        ca = cell_number(ligne.get(col_ca)) if col_ca in ligne else (cell_number(ligne.get(px)) if px else 0.0) * qte
+        cout = cell_number(ligne.get(col_cm)) if col_cm in ligne else (cell_number(ligne.get(cmpcol)) if cmpcol else 0.0) * qte
+        mesures = sign * np.array([ca, qte, cout])
+        d = np.array([date.to_datetime64()], dtype="datetime64[ns]")
+        for grain, cells in self.grains.items():
+            key = (int(_period_codes(grain, d)[0]), int(pid))
+            cell = cells.index.get(key)
+            if cell is None:
+                cell = cells._new(*key)
+            cells.values[cell] += mesures
+        return self
+
+    # ---- lecture ----
+    def frame(self, grain="mois", by="produit", start=None, end=None):
+        """
+        Agrégats du grain sur [start, end] (dates ou libellés de période, bornes incluses).
+        by: "produit", "catégorie", "famille" ou None (total par période).
+        """
+        cells = self.grains[grain] if grain in self.grains else None
+        if cells is None:
+            raise ValueError(f"grain inconnu: {grain} (attendu: {', '.join(GRAINS)})")
+        n = cells.n
+        periode = cells.periode[:n]
+        sel = np.ones(n, dtype=bool)
+        if start is not None:
+            sel &= periode >= self.period_code(grain, start)
+        if end is not None:
+            sel &= periode <= self.period_code(grain, end)
+        data = pd.DataFrame(cells.values[:n][sel], columns=MESURES)
+        data.insert(0, "période", periode[sel])
+        keys = ["période"]
+        if by is not None:
+            pid = cells.produit[:n][sel]
+            if by == "produit":
+                data.insert(1, by, np.asarray(self.produits, dtype=object)[pid] if len(pid) else [])
+            elif by in self.attributs:
+                valeurs = np.asarray(self.attributs[by], dtype=object)
+                data.insert(1, by, pd.Series(valeurs[pid] if len(pid) else [], dtype=object).fillna("(non classé)").to_numpy())
+            else:
+                raise ValueError(f"regroupement inconnu: {by}")
+            keys.append(by)
+        out = data.groupby(keys, as_index=False, sort=True)[MESURES].sum()
+        out["marge"] = out["ca"] - out["cout"]
+        out["période"] = _period_labels(grain, out["période"].to_numpy())
+        return out
+
+    @staticmethod
+    def period_code(grain, value):
+        """Code de la période contenant value (date, Timestamp ou libellé '2026-03')."""
+        return int(_period_codes(grain, [pd.Timestamp(value).to_datetime64()])[0])
+
+    def compare(self, grain, a, b, by="catégorie", mesure="ca"):
+        """Mesure de la période a contre la période b, par regroupement (écart absolu et %)."""
+        la, lb = (_period_labels(grain, [self.period_code(grain, p)])[0] for p in (a, b))
+        if la == lb:
+            lb += " (réf.)"
+        fa = self.frame(grain, by, start=a, end=a)
+        fb = self.frame(grain, by, start=b, end=b)
+        keys = [by] if by is not None else []
+        if not keys:
+            fa["total"] = fb["total"] = "Total"
+            keys = ["total"]
+        out = fa[keys + [mesure]].rename(columns={mesure: la}).merge(
+            fb[keys + [mesure]].rename(columns={mesure: lb}), on=keys, how="outer").fillna({la: 0.0, lb: 0.0})
+        out["écart"] = out[la] - out[lb]
+        out["écart %"] = np.where(out[lb] != 0, out["écart"] / out[lb].where(out[lb] != 0, 1) * 100, np.nan)
+        return out.sort_values(la, ascending=False, ignore_index=True)
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c in self.grains.values())
+
+    def __len__(self):
+        return sum(c.n for c in self.grains.values())
+
+
+# ---------- Simulation prix / CMP (what-if) ----------
+# Tous les produits x tous les scénarios en une passe: tableaux NumPy (S x N)
+# diffusés depuis les prix, CMP et volumes de base (tableau de pilotage calculé
+# une seule fois). Volumes historiques ramenés au mois pour être comparés aux
+# charges fixes mensuelles de tbl_Charges_Fixes (point mort).
+
+COLS_MONTANT_CHARGE = ["Montant_Mensuel", "Montant mensuel", "Montant"]
+COLS_FAMILLE_CHARGE = ["Famille affectée", "Famille"]
+COLS_FREQUENCE = ["Fréquence"]
+COLS_ID_CHARGE = ["ID_Charge", "ID Charge", "Code charge"]
+COLS_LIBELLE_CHARGE = ["Libellé", "Charge"]
+# montant saisi -> montant mensuel (fréquence vide: mensuelle)
+PAR_MOIS = {"mensuelle": 1.0, "annuelle": 1 / 12, "trimestrielle": 1 / 3, "semestrielle": 1 / 6,
+            "hebdomadaire": 52 / 12, "journalière": 365 / 12}
+GLOBALE = "Globale"
+
+
+def charge_lines(charges_df):
+    """
+    Lignes de charges proprement dites: identifiant (à défaut libellé) renseigné.
+    Écarte les lignes de total saisies sous le tableau (montant sans identifiant,
+    libellé « total ... » ou simple nombre), qui compteraient les charges deux fois.
+    """
+    cle = choose_col(charges_df, COLS_ID_CHARGE) or choose_col(charges_df, COLS_LIBELLE_CHARGE)
+    if cle is None:
+        return charges_df
+    keep = charges_df[cle].astype("string").str.strip().fillna("")
+    ok = (keep != "") & ~keep.str.lower().str.startswith("total") & pd.to_numeric(keep, errors="coerce").isna()
+    return charges_df[ok.to_numpy(dtype=bool)]
+
+
+def fixed_charges(charges_df):
+    """Charges fixes mensuelles par famille affectée ('Globale' pour les charges non affectées)."""
+    if charges_df is None or charges_df.empty:
+        return pd.Series(dtype=float, name="charges")
+    montant = choose_col(charges_df, COLS_MONTANT_CHARGE)
+    if montant is None:
+        return pd.Series(dtype=float, name="charges")
+    charges_df = charge_lines(charges_df)
+    m = pd.to_numeric(charges_df[montant], errors="coerce").fillna(0.0)
+    freq = choose_col(charges_df, COLS_FREQUENCE)
+    if freq is not None:
+        f = charges_df[freq].astype("string").str.strip().str.lower()
+        m = m * f.map(PAR_MOIS).astype(float).fillna(1.0).to_numpy()
+    fam = choose_col(charges_df, COLS_FAMILLE_CHARGE)
+    familles = (charges_df[fam].astype("string").str.strip().fillna(GLOBALE) if fam is not None
+                else pd.Series(GLOBALE, index=charges_df.index))
+    return m.groupby(familles.to_numpy()).sum().rename("charges")
+
+
+def sales_months(ventes_df):
+    """Nombre de mois couverts par les ventes datées (au moins 1)."""
+    col = choose_col(ventes_df, COLS_DATE) if ventes_df is not None else None
+    if col is None:
+        return 1
+    d = _to_dates(ventes_df[col]).dropna()
+    return max(1, int(d.dt.to_period("M").nunique()))
+
+
+class PriceScenarios:
+    """
+    Simulation de révisions de prix et de chocs de CMP sur tout le menu.
+      from_tables(produits, ventes, cout_portion, charges)   -> base (prix, CMP, volumes mensuels par produit)
+      evaluate(prix, cmp, elasticite)   -> ScenarioResult, S scénarios x N produits en tableaux NumPy
+      grid(prix, cmp, familles, ...)    -> grille cartésienne de variations globales (ou limitées à des familles)
+    Un choc est un % (global) ou un dict {"global": %, "familles": {famille: %}, "produits": {code: %}};
+    les niveaux se composent (global x famille x produit).
+    Élasticité-prix constante: volume = volume de base x (prix / prix de base) ** elasticite (ex. -0.8).
+    """
+
+    def __init__(self, codes, prix, cmp, volumes, familles=None, charges=None, noms=None):
+        self.codes = pd.Index(codes, name="code")
+        self.prix = np.asarray(prix, dtype=float)
+        self.cmp = np.asarray(cmp, dtype=float)
+        self.volumes = np.asarray(volumes, dtype=float)
+        fam = pd.Series(familles if familles is not None else [None] * len(self.codes), dtype=object)
+        self.familles = fam.fillna("(non classé)").astype(str).to_numpy()
+        self.noms = None if noms is None else np.asarray(noms, dtype=object)
+        self.charges = charges if charges is not None else pd.Series(dtype=float)
+        self._fam_index = pd.Index(pd.unique(self.familles))
+        self._fam_codes = self._fam_index.get_indexer(self.familles)
+        self._pos = {c: k for k, c in enumerate(self.codes)}
+
+    @property
+    def nbytes(self):
+        """Mémoire occupée par la base de simulation (tableaux par produit, codes, libellés, charges)."""
+        texte = [self.familles] + ([self.noms] if self.noms is not None else [])
+        return int(self.prix.nbytes + self.cmp.nbytes + self.volumes.nbytes + self._fam_codes.nbytes
+                   + self.codes.memory_usage(deep=True) + self._fam_index.memory_usage(deep=True)
+                   + sum(pd.Series(t, copy=False).memory_usage(deep=True, index=False) for t in texte)
+                   + self.charges.memory_usage(deep=True, index=True))
+
+    @classmethod
+    def from_tables(cls, produits_df, ventes_df, cout_portion=None, charges_df=None, mois=None):
+        """
+        Base depuis tbl_Produits / tbl_Ventes (colonnes 'code', cf. clean_codes): prix menu,
+        coût portion (recettes si fourni, sinon CMP saisi) et quantités vendues par mois.
+        """
+        base = build_tableau_pilotage(produits_df, ventes_df, cout_portion)
+        if base.empty:
+            return cls([], [], [], [], charges=fixed_charges(charges_df))
+        base = base.drop_duplicates("code")
+        mois = mois or sales_months(ventes_df)
+        prix = base["prix_vente"] if "prix_vente" in base.columns else pd.Series(0.0, index=base.index)
+        return cls(
+            base["code"].astype(str).to_numpy(),
+            pd.to_numeric(prix, errors="coerce").fillna(0.0).to_numpy(),
+            base["CMP"].to_numpy(dtype=float),
+            base["qte"].to_numpy(dtype=float) / mois,
+            familles=base["Famille"].astype(object).to_numpy() if "Famille" in base.columns else None,
+            charges=fixed_charges(charges_df),
+            noms=base["Produit"].astype(object).to_numpy() if "Produit" in base.columns else None,
+        )
+
+    # ---- chocs ----
+    def _factors(self, chocs, n):
+        """Multiplicateurs (n x N) depuis une liste de chocs, un tableau de % (n,) ou (n x N)."""
+        N = len(self.codes)
+        if chocs is None:
+            return np.ones((n, N))
+        if isinstance(chocs, np.ndarray) and chocs.dtype.kind in "iuf":
+            pct = chocs.reshape(-1, 1) if chocs.ndim == 1 else chocs
+            return np.broadcast_to(1 + pct / 100.0, (n, N))
+        out = np.ones((n, N))
+        for s, choc in enumerate(chocs):
+            if choc is None:
+                continue
+            if not isinstance(choc, dict):
+                out[s] *= 1 + float(choc) / 100.0
+                continue
+            out[s] *= 1 + float(choc.get("global", 0.0)) / 100.0
+            for fam, pct in (choc.get("familles") or {}).items():
+                k = self._fam_index.get_indexer([fam])[0]
+                if k >= 0:
+                    out[s, self._fam_codes == k] *= 1 + float(pct) / 100.0
+            for code, pct in (choc.get("produits") or {}).items():
+                k = self._pos.get(str(code))
+                if k is not None:
+                    out[s, k] *= 1 + float(pct) / 100.0
+        return out
+
+    @staticmethod
+    def _count(chocs):
+        if chocs is None:
+            return None
+        if isinstance(chocs, np.ndarray):
+            return chocs.shape[0]
+        return len(chocs)
+
+    @timed("what_if", rows=lambda r: r.ca.size)
+    def evaluate(self, prix=None, cmp=None, elasticite=0.0, labels=None):
+        """
+        prix, cmp: S chocs chacun (un seul côté peut être omis); elasticite: nombre, S valeurs
+        ou N valeurs (par produit). Retourne un ScenarioResult.
+        """
+        counts = [c for c in (self._count(prix), self._count(cmp)) if c is not None]
+        n = counts[0] if counts else 1
+        if any(c != n for c in counts):
+            raise ValueError("prix et cmp: même nombre de scénarios attendu")
+        fp = self._factors(prix, n)
+        fc = self._factors(cmp, n)
+        e = np.asarray(elasticite, dtype=float)
+        if e.ndim == 1 and len(e) == n and n != len(self.codes):
+            e = e[:, None]
+        p = self.prix * fp
+        q = self.volumes * (fp ** e if e.any() else 1.0)
+        return ScenarioResult(self, p * q, (self.cmp * fc) * q, labels=labels, elasticite=elasticite)
+
+    def grid(self, prix=(-10, -5, 0, 5, 10), cmp=(0,), familles=None, elasticite=0.0):
+        """
+        Grille prix x CMP de variations en % (len(prix) x len(cmp) scénarios), appliquées
+        à tout le menu ou aux seules familles données. Colonnes Δ prix % / Δ CMP % dans totals().
+        """
+        dp = np.repeat(np.asarray(prix, dtype=float), len(cmp))
+        dc = np.tile(np.asarray(cmp, dtype=float), len(prix))
+        mask = np.ones(len(self.codes)) if not familles else np.isin(self.familles, list(familles)).astype(float)
+        res = self.evaluate(dp[:, None] * mask, dc[:, None] * mask, elasticite)
+        res.axes = {"Δ prix %": dp, "Δ CMP %": dc}
+        return res
+
+
+class ScenarioResult:
+    """
+    CA et coût matière mensuels (S x N) des scénarios.
+      totals()            -> une ligne par scénario: CA, coût, marge, food cost %, résultat, point mort
+      produits(s)         -> détail par produit d'un scénario
+      familles(s)         -> par famille, contribution après charges fixes spécifiques
+      pivot(mesure)       -> matrice Δ prix % x Δ CMP % d'une grille (carte de chaleur)
+    """
+
+    def __init__(self, base, ca, cout, labels=None, elasticite=0.0):
+        self.base = base
+        self.ca = ca
+        self.cout = cout
+        self.labels = labels
+        self.elasticite = elasticite
+        self.axes = {}
+
+    def __len__(self):
+        return self.ca.shape[0]
+
+    def totals(self):
+        ca = self.ca.sum(axis=1)
+        cout = self.cout.sum(axis=1)
+        marge = ca - cout
+        charges = float(self.base.charges.sum())
+        taux = np.divide(marge, ca, out=np.full_like(ca, np.nan), where=ca > 0)
+        point_mort = np.divide(charges, taux, out=np.full_like(ca, np.nan), where=taux > 0)
+        out = pd.DataFrame({
+            "CA": ca,
+            "Coût matière": cout,
+            "Marge": marge,
+            "Food cost %": np.divide(cout, ca, out=np.full_like(ca, np.nan), where=ca > 0) * 100,
+            "Charges fixes": charges,
+            "Résultat": marge - charges,
+            "CA point mort": point_mort,
+            "Marge de sécurité %": np.divide(ca - point_mort, ca, out=np.full_like(ca, np.nan), where=ca > 0) * 100,
+        })
+        for k, (name, values) in enumerate(self.axes.items()):
+            out.insert(k, name, values)
+        if self.labels is not None:
+            out.insert(0, "scénario", list(self.labels))
+        return out
+
+    def produits(self, s=0):
+        b = self.base
+        ca, cout = self.ca[s], self.cout[s]
+        out = pd.DataFrame({"code": b.codes, "Famille": b.familles, "CA": ca, "Coût matière": cout,
+                            "Marge": ca - cout,
+                            "Food cost %": np.divide(cout, ca, out=np.full_like(ca, np.nan), where=ca > 0) * 100})
+        if b.noms is not None:
+            out.insert(1, "Produit", b.noms)
+        return out.sort_values("Marge", ascending=False, ignore_index=True)
+
+    def familles(self, s=0):
+        b = self.base
+        F = len(b._fam_index)
+        ca = np.bincount(b._fam_codes, weights=self.ca[s], minlength=F)
+        cout = np.bincount(b._fam_codes, weights=self.cout[s], minlength=F)
+        charges = b.charges.reindex(b._fam_index).fillna(0.0).to_numpy()
+        return pd.DataFrame({"Famille": b._fam_index, "CA": ca, "Coût matière": cout, "Marge": ca - cout,
+                             "Charges spécifiques": charges, "Contribution": ca - cout - charges}
+                            ).sort_values("Contribution", ascending=False, ignore_index=True)
+
+    def pivot(self, mesure="Résultat"):
+        """Matrice d'une mesure de totals(), lignes Δ prix %, colonnes Δ CMP % (grilles seulement)."""
+        if not self.axes:
+            raise ValueError("pivot: résultat de grid() attendu")
+        t = self.totals()
+        return t.pivot(index="Δ prix %", columns="Δ CMP %", values=mesure).sort_index(ascending=False)
@@ -0,0 +1,141 @@
+# src/catalogue.py
+# Catalogue produits construit une fois par chargement de tbl_Produits:
+#  - dict nom / code -> ligne (prix menu, coût portion, code) pour la saisie des ventes
+#  - liste triée des clés normalisées (préfixes par bisection, nom complet et début de mot)
+#  - index de trigrammes pour la recherche « contient » / approchée de l'autocomplétion
+
+import bisect
+import unicodedata
+from collections import defaultdict
+
+import pandas as pd
+
+try:
+    from .calc import COLS_CODE
+    from .kpis import COLS_CMP, COLS_PRIX, COLS_PRODUIT, choose_col
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from calc import COLS_CODE
+    from kpis import COLS_CMP, COLS_PRIX, COLS_PRODUIT, choose_col
+
+# prix menu aussi nommé 'prix_vente' (tableau de pilotage)
+COLS_PRIX_PRODUIT = COLS_PRIX + ["prix_vente"]
+
+
+def normalize(text):
+    """Clé de recherche: minuscules, sans accents, espaces réduits."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.lower().split())
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductCatalogue:
+    """
+    Index des produits de tbl_Produits.
+      get(nom_ou_code) -> dict (ligne, nom, code, prix, cmp) ou None, en O(1)
+      search(texte)    -> noms pour l'autocomplétion (préfixe d'abord, puis trigrammes)
+    """
+
+    def __init__(self, produits_df=None):
+        self.names = []
+        self.codes = []
+        self.prix = []
+        self.cmp = []
+        self.rows = []   # index de la ligne dans produits_df
+        self._by_key = {}
+        self._prefix = []   # (clé normalisée, n° produit), trié
+        self._grams = defaultdict(set)
+        if produits_df is None or produits_df.empty:
+            return
+        col_nom = choose_col(produits_df, COLS_PRODUIT) or produits_df.columns[0]
+        col_code = choose_col(produits_df, COLS_CODE)
+        col_prix = choose_col(produits_df, COLS_PRIX_PRODUIT)
+        col_cmp = choose_col(produits_df, COLS_CMP)
+
+        def num(col):
+            if col is None:
+                return [0.0] * len(produits_df)
+            return pd.to_numeric(produits_df[col], errors="coerce").fillna(0.0).tolist()
+
+        noms = produits_df[col_nom].tolist()
+        codes = produits_df[col_code].tolist() if col_code else [None] * len(produits_df)
+        for row, nom, code, prix, cmp in zip(produits_df.index, noms, codes, num(col_prix), num(col_cmp)):
+            if pd.isna(nom) or str(nom).strip() == "":
+                continue
+            nom = str(nom).strip()
+            key = normalize(nom)
+            if key in self._by_key:
+                continue  # doublon: la première ligne fait foi, comme le filtre d'origine
+            code = None if pd.isna(code) else str(code).strip()
+            i = len(self.names)
+            self.names.append(nom)
+            self.codes.append(code)
+            self.prix.append(float(prix))
+            self.cmp.append(float(cmp))
+            self.rows.append(row)
+            self._by_key[key] = i
+            if code:
+                self._by_key.setdefault(normalize(code), i)
+            # préfixes: nom complet et chaque début de mot ("tajine kefta" -> "kefta")
+            words = key.split(" ")
+            for k in range(len(words)):
+                self._prefix.append((" ".join(words[k:]), i))
+            if code:
+                self._prefix.append((normalize(code), i))
+            for g in trigrams(key):
+                self._grams[g].add(i)
+        self._prefix.sort()
+        self._prefix_keys = [k for k, _ in self._prefix]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, nom_ou_code):
+        return normalize(nom_ou_code) in self._by_key
+
+    def get(self, nom_ou_code):
+        i = self._by_key.get(normalize(nom_ou_code))
+        if i is None:
+            return None
+        return {"ligne": self.rows[i], "nom": self.names[i], "code": self.codes[i],
+                "prix": self.prix[i], "cmp": self.cmp[i]}
+
+    def prefix(self, text, limit=50):
+        """Produits dont le nom, un mot du nom ou le code commence par text."""
+        key = normalize(text)
+        out = []
+        seen = set()
+        k = bisect.bisect_left(self._prefix_keys, key)
+        while k < len(self._prefix) and self._prefix_keys[k].startswith(key) and len(out) < limit:
+            i = self._prefix[k][1]
+            if i not in seen:
+                seen.add(i)
+                out.append(i)
+            k += 1
+        return out
+
+    def fuzzy(self, text, limit=50, exclude=()):
+        """Produits classés par nombre de trigrammes communs (fautes de frappe, sous-chaînes)."""
+        grams = trigrams(normalize(text))
+        score = defaultdict(int)
+        for g in grams:
+            for i in self._grams.get(g, ()):
+                score[i] += 1
+        # au moins la moitié des trigrammes du texte doivent se retrouver dans le nom
+        seuil = max(1, len(grams) // 2)
+        ranked = sorted((i for i, s in score.items() if s >= seuil and i not in exclude),
+                        key=lambda i: (-score[i], self.names[i]))
+        return ranked[:limit]
+
+    def search(self, text, limit=50):
+        """Noms à proposer pour le texte saisi (tous les produits si le texte est vide)."""
+        if not normalize(text):
+            return self.names[:limit] if limit else list(self.names)
+        found = self.prefix(text, limit)
+        if len(found) < limit and len(normalize(text)) >= 3:
+            found += self.fuzzy(text, limit - len(found), exclude=set(found))
+        return [self.names[i] for i in found]
@@ -0,0 +1,128 @@
+# src/consolidation.py
+# Consolidation multi-sites: un classeur par point de vente, découverts dans un
+# dossier et traités en parallèle (un processus par classeur). Chaque processus
+# renvoie seulement des agrégats par produit (quelques centaines de lignes),
+# jamais tbl_Ventes; le parent assemble le pilotage par site et groupe.
+
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+try:
+    from .batch import compute_results
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from batch import compute_results
+
+# colonnes gardées du pilotage d'un site (le reste de tbl_Produits ne voyage pas)
+COLS_SITE = ["code", "Produit", "Famille", "qte", "CMP", "prix_vente", "total_cost", "revenue", "marge"]
+SOMMES = ["qte", "total_cost", "revenue", "marge"]
+EXCLUS = ("~$", "Regraga_Resultats", "Regraga_Prevision")  # fichiers verrous d'Excel, sorties de `python -m src`
+
+
+def discover(root, pattern="*.xlsx"):
+    """Classeurs sous root (récursif), hors fichiers verrous, sorties et dossiers de cache."""
+    root = pathlib.Path(root)
+    if root.is_file():
+        return [root]
+    found = []
+    for p in sorted(root.rglob(pattern)):
+        if p.name.startswith(EXCLUS) or any(part.startswith(".") for part in p.relative_to(root).parts):
+            continue
+        found.append(p)
+    return found
+
+
+def site_name(path, root):
+    """Nom du site: chemin relatif sans extension ('DATA/Dashboard Regraga 2026')."""
+    path, root = pathlib.Path(path), pathlib.Path(root)
+    try:
+        rel = path.relative_to(root) if root.is_dir() else pathlib.Path(path.name)
+    except ValueError:
+        rel = pathlib.Path(path.name)
+    return rel.with_suffix("").as_posix()
+
+
+def site_partial(path, journal=True):
+    """
+    Travail d'un processus: agrégats par produit d'un classeur.
+    Retourne un dict sérialisable léger (pilotage réduit + totaux), ou l'erreur.
+    """
+    t0 = time.perf_counter()
+    try:
+        results = compute_results(path, journal=journal)
+    except Exception as e:
+        return {"path": str(path), "erreur": str(e), "durée (s)": time.perf_counter() - t0}
+    pilotage = results["Pilotage"]
+    kpi = results["KPI"].set_index("Indicateur")["Valeur"]
+    return {
+        "path": str(path),
+        "pilotage": pilotage[[c for c in COLS_SITE if c in pilotage.columns]].reset_index(drop=True),
+        "ca": float(kpi["Total CA"]),
+        "cout": float(kpi["Coût matière total"]),
+        "durée (s)": time.perf_counter() - t0,
+        "pid": os.getpid(),
+    }
+
+
+def consolidate(paths, root=None, workers=None, journal=True):
+    """
+    Traite les classeurs en parallèle et assemble:
+      Sites (un résumé par classeur), Pilotage_Sites (site x produit), Pilotage_Groupe (produit)
+    workers: nombre de processus (défaut: nb de coeurs, borné par le nb de classeurs).
+    """
+    paths = [pathlib.Path(p) for p in paths]
+    root = pathlib.Path(root) if root is not None else pathlib.Path.cwd()
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    partials = []
+    if workers == 1:
+        partials = [site_partial(p, journal) for p in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(site_partial, p, journal) for p in paths]
+            partials = [f.result() for f in as_completed(futures)]
+        # ordre stable des sites, indépendant de l'ordre de fin des processus
+        rank = {str(p): i for i, p in enumerate(paths)}
+        partials.sort(key=lambda r: rank[r["path"]])
+    return merge_partials(partials, root)
+
+
+def merge_partials(partials, root):
+    """Pilotage par site et pilotage groupe depuis les agrégats des sites."""
+    sites, tables = [], []
+    for r in partials:
+        name = site_name(r["path"], root)
+        sites.append({
+            "site": name,
+            "classeur": r["path"],
+            "CA": r.get("ca"),
+            "Coût matière": r.get("cout"),
+            "durée (s)": round(r["durée (s)"], 3),
+            "erreur": r.get("erreur", ""),
+        })
+        if "pilotage" in r:
+            tables.append(r["pilotage"].assign(site=name))
+    out = {"Sites": pd.DataFrame(sites)}
+    if not tables:
+        return out
+    par_site = pd.concat(tables, ignore_index=True)
+    out["Pilotage_Sites"] = par_site[["site"] + [c for c in par_site.columns if c != "site"]]
+
+    # groupe: sommes par produit; CMP et prix de vente recalculés en moyennes pondérées
+    # par les quantités (chaque site garde son propre coût portion)
+    attrs = [c for c in ("Produit", "Famille") if c in par_site.columns]
+    sommes = [c for c in SOMMES if c in par_site.columns]
+    groupe = par_site.groupby("code", as_index=False, sort=False)[sommes].sum()
+    if attrs:
+        groupe = groupe.merge(par_site.drop_duplicates("code")[["code"] + attrs], on="code", how="left")
+    qte = groupe["qte"].where(groupe["qte"] != 0)
+    if "total_cost" in groupe.columns:
+        groupe["CMP"] = groupe["total_cost"] / qte
+    if "revenue" in groupe.columns:
+        groupe["prix_vente"] = groupe["revenue"] / qte
+    groupe["nb sites"] = par_site.groupby("code", sort=False)["site"].nunique().reindex(groupe["code"]).to_numpy()
+    cols = ["code"] + attrs + [c for c in COLS_SITE if c in groupe.columns and c not in ("code", *attrs)] + ["nb sites"]
+    out["Pilotage_Groupe"] = groupe[cols].sort_values("qte", ascending=False, ignore_index=True)
+    return out
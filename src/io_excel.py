@@ -1,53 +1,87 @@
 # src/io_excel.py
 
+import os
+
+import numpy as np
 import pandas as pd
 
-def read_workbook(file_like):
+try:
+    from .cache import load_sheets
+    from .calc import COLS_CODE, COLS_DATE, SHEETS_CATEGORIES, _to_dates
+    from .kpis import COLS_PRODUIT, choose_col
+    from .perf import timed
+    from .xlsx import read_sheets, sheet_names
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from cache import load_sheets
+    from calc import COLS_CODE, COLS_DATE, SHEETS_CATEGORIES, _to_dates
+    from kpis import COLS_PRODUIT, choose_col
+    from perf import timed
+    from xlsx import read_sheets, sheet_names
+
+# clé -> (nom exact, indices pour l'heuristique si l'onglet est mal nommé)
+SHEET_KEYS = (
+    ("produits", "tbl_Produits", ("produit",)),
+    ("ventes", "tbl_Ventes", ("vente", "sales")),
+    ("recettes", "tbl_Recettes", ("recette", "recipe")),
+    ("stock", "tbl_Stock", ("stock",)),
+    ("achats", "tbl_Achats", ("achat",)),
+    ("sorties", "tbl_Sorties", ("sortie",)),
+    ("charges", "tbl_Charges_Fixes", ("charge",)),
+)
+
+def resolve_sheets(names):
+    """Associe chaque clé (produits, ventes, recettes) à un nom d'onglet présent."""
+    found = {}
+    for key, exact, hints in SHEET_KEYS:
+        if exact in names:
+            found[key] = exact
+            continue
+        # si pas trouvée, essayer heuristique
+        for name in names:
+            if any(h in name.lower() for h in hints):
+                found[key] = name
+                break
+    return found
+
+@timed("read_workbook")
+def read_workbook(file_like, normalize=True, report=None):
     """
     Lit un fichier Excel (chemin ou file-like) et retourne un dict de DataFrames.
-    Attendu: feuilles principales: tbl_Produits, tbl_Ventes, tbl_Recettes (si présentes).
+    Attendu: feuilles principales: tbl_Produits, tbl_Ventes, tbl_Recettes, tbl_Stock,
+    tbl_Achats, tbl_Sorties, tbl_Charges_Fixes (si présentes). Les onglets catégories (tbl_PtDj&Sup, ...)
+    présents sont rendus sous leur propre nom.
+    Seuls ces onglets sont parsés (lecture en flux, src/xlsx.py); pour un chemin,
+    ils passent en plus par le cache colonne (src/cache.py).
+    normalize=True passe produits et ventes par normalize_tables (types compacts);
+    report (dict) reçoit alors le gain mémoire par table.
     """
     try:
-        xls = pd.read_excel(file_like, sheet_name=None, engine="openpyxl")
+        # Normaliser noms des feuilles clés (lus dans workbook.xml, sans parser les onglets)
+        names = sheet_names(file_like)
+        wanted = resolve_sheets(names)
+        wanted.update({name: name for name in SHEETS_CATEGORIES if name in names})
+        if isinstance(file_like, (str, os.PathLike)):
+            tables = load_sheets(file_like, list(wanted.values()))
+        else:
+            tables = read_sheets(file_like, list(wanted.values()))
     except Exception as e:
         raise RuntimeError(f"Erreur lecture Excel: {e}")
-
-    # Normaliser noms des feuilles clés
-    data = {}
-    if "tbl_Produits" in xls:
-        data["produits"] = xls["tbl_Produits"].copy()
-    else:
-        # si pas trouvée, essayer heuristique
-        for name, df in xls.items():
-            if "produit" in name.lower():
-                data["produits"] = df.copy()
-                break
-
-    if "tbl_Ventes" in xls:
-        data["ventes"] = xls["tbl_Ventes"].copy()
-    else:
-        for name, df in xls.items():
-            if "vente" in name.lower() or "sales" in name.lower():
-                data["ventes"] = df.copy()
-                break
-
-    if "tbl_Recettes" in xls:
-        data["recettes"] = xls["tbl_Recettes"].copy()
-    else:
-        for name, df in xls.items():
-            if "recette" in name.lower() or "recipe" in name.lower():
-                data["recettes"] = df.copy()
-                break
-
+    data = {key: tables[name] for key, name in wanted.items() if name in tables}
+    if normalize:
+        gains = normalize_tables(data, measure=report is not None)
+        if report is not None:
+            report.update(gains)
     return data
 
-def clean_codes(df, code_col_candidates=("Code produit","code","code_produit","Code")):
+@timed("clean_codes")
+def clean_codes(df, code_col_candidates=("Code produit","code","code_produit","Code","Cde_Prdt")):
     """
     Retourne un DataFrame où la colonne code est normalisée en 'code'.
     """
     if df is None:
         return None
-    df = df.copy()
+    # copie superficielle: seule la colonne code est remplacée, les autres sont partagées
+    df = df.copy(deep=False)
     found = None
     for c in code_col_candidates:
         if c in df.columns:
@@ -55,5 +89,140 @@ def clean_codes(df, code_col_candidates=("Code produit","code","code_produit","C
             break
     if found:
         df.rename(columns={found: "code"}, inplace=True)
-        df["code"] = df["code"].astype(str).str.strip()
-    return df
\ No newline at end of file
+        codes = df["code"]
+        if isinstance(codes.dtype, pd.CategoricalDtype):
+            # codes en catégories (normalize_tables): on ne nettoie que le dictionnaire
+            cats = codes.cat.categories.astype(str).str.strip()
+            if cats.is_unique:
+                df["code"] = codes.cat.rename_categories(cats)
+                return df
+        df["code"] = codes.astype(str).str.strip()
+    return df
+
+
+# ---------- Normalisation: représentation compacte de tbl_Produits / tbl_Ventes ----------
+# Noms et codes produit -> catégories sur un dictionnaire commun aux deux tables
+# (jointures et regroupements sur des codes entiers), dates -> datetime64,
+# colonnes numériques resserrées sans perte. Les colonnes sont remplacées dans
+# le DataFrame reçu, sans copie du reste.
+
+def product_dictionary(*frames):
+    """Dictionnaire produit partagé: {"noms": CategoricalDtype, "codes": CategoricalDtype} (ordre d'apparition)."""
+    out = {}
+    for key, cols in (("noms", COLS_PRODUIT), ("codes", COLS_CODE)):
+        values = []
+        for df in frames:
+            col = choose_col(df, cols) if df is not None else None
+            if col is not None:
+                values.append(pd.Series(df[col].dropna().unique(), dtype=object))
+        uniq = pd.unique(pd.concat(values, ignore_index=True)) if values else []
+        out[key] = pd.CategoricalDtype(pd.Index(uniq, dtype=object))
+    return out
+
+
+def _narrow(s):
+    """
+    Type numérique le plus étroit sans perte: entiers (ou flottants entiers sans NaN)
+    en int32 s'ils tiennent. Pas en dessous de 32 bits (qte x prix ne doit pas
+    déborder) et les flottants restent en float64 (sommes de CA exactes au centime).
+    """
+    v = s.to_numpy()
+    if v.dtype.kind == "f":
+        if len(v) == 0 or np.isnan(v).any() or not np.array_equal(v, np.trunc(v)):
+            return s
+    elif v.dtype.kind not in "iu":
+        return s
+    if len(v) and (v.min() < np.iinfo(np.int32).min or v.max() > np.iinfo(np.int32).max):
+        return s
+    return s.astype(np.int32)
+
+
+def normalize_frame(df, dictionary=None):
+    """Normalise df en place (colonnes remplacées) et le retourne."""
+    if df is None or df.empty:
+        return df
+    dictionary = dictionary or product_dictionary(df)
+    typed = set()
+    for key, cols in (("noms", COLS_PRODUIT), ("codes", COLS_CODE)):
+        col = choose_col(df, cols)
+        if col is not None and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            values = df[col].astype(object)
+            dtype = dictionary[key]
+            known = set(dtype.categories)
+            extra = [v for v in pd.unique(values.dropna()) if v not in known]
+            if extra:  # valeurs absentes du dictionnaire (ex. ventes du journal): ajoutées en fin
+                dtype = pd.CategoricalDtype(dtype.categories.append(pd.Index(extra, dtype=object)))
+            df[col] = values.astype(dtype)
+            typed.add(col)
+    col = choose_col(df, COLS_DATE)
+    if col is not None and df[col].dtype.kind != "M":
+        d = _to_dates(df[col])
+        # conversion refusée si des valeurs non vides ne sont pas des dates
+        if not (d.isna() & df[col].notna()).any():
+            df[col] = d
+        typed.add(col)
+    for col in df.columns:
+        if col in typed:
+            continue
+        s = df[col]
+        if s.dtype.kind in "O" or str(s.dtype) in ("str", "string"):
+            num = pd.to_numeric(s, errors="coerce")
+            if num.notna().sum() == 0 or (num.isna() & s.notna()).any():
+                # texte répétitif (Mois, Famille, ...): catégories propres à la colonne
+                values = s.dropna()
+                if len(values) and values.nunique() * 2 <= len(values) and \
+                        all(isinstance(v, str) for v in pd.unique(values)):
+                    df[col] = s.astype(object).astype("category")
+                continue
+            s = num
+        if s.dtype.kind in "iuf":
+            df[col] = _narrow(s)
+    return df
+
+
+def _memory(df):
+    """Octets occupés; pour une colonne catégorie seuls les codes comptent (dictionnaire à part)."""
+    if df is None:
+        return 0
+    total = int(df.index.memory_usage(deep=True))
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            total += s.cat.codes.nbytes
+        else:
+            total += int(s.memory_usage(index=False, deep=True))
+    return total
+
+
+def _dictionary_memory(df):
+    return sum(int(df[c].cat.categories.memory_usage(deep=True)) for c in df.columns
+               if isinstance(df[c].dtype, pd.CategoricalDtype))
+
+
+def normalize_tables(tables, keys=("produits", "ventes"), measure=False):
+    """
+    Normalise les tables keys de tables ({clé: DataFrame}) sur un dictionnaire produit commun.
+    measure=True: retourne {clé: {"avant (Ko)", "après (Ko)", "gain (Ko)", "gain %"}}.
+    """
+    frames = [tables.get(k) for k in keys]
+    dictionary = product_dictionary(*frames)
+    report = {}
+
+    def line(before, after):
+        return {"avant (Ko)": before / 1024, "après (Ko)": after / 1024, "gain (Ko)": (before - after) / 1024,
+                "gain %": (1 - after / before) * 100 if before else 0.0}
+
+    for key, df in zip(keys, frames):
+        if df is None:
+            continue
+        before = _memory(df) if measure else None
+        normalize_frame(df, dictionary)
+        if measure:
+            # catégories propres à la table comptées avec elle; dictionnaire produit commun à part
+            shared = sum(int(dictionary[k].categories.memory_usage(deep=True)) for k in dictionary
+                         if any(df[c].dtype == dictionary[k] for c in df.columns))
+            report[key] = line(before, _memory(df) + _dictionary_memory(df) - shared)
+    if measure:
+        report["dictionnaire produit"] = line(0, sum(int(d.categories.memory_usage(deep=True))
+                                                     for d in dictionary.values()))
+    return report
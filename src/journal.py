@@ -0,0 +1,181 @@
+# src/journal.py
+# Journal des ventes en ajout seul (SQLite en mode WAL) posé à côté du classeur.
+# Chaque vente = une insertion (coût constant, indépendant de la taille de tbl_Ventes);
+# append_many valide un lot de ventes en une transaction (service multi-caisses).
+# La compaction replie les lignes en attente dans tbl_Ventes en une seule écriture;
+# le classeur écrit est scellé (empreinte du temporaire avant remplacement) pour
+# qu'une reprise après coupure ne purge que des ventes réellement écrites.
+
+import json
+import pathlib
+import sqlite3
+import threading
+
+import pandas as pd
+
+try:
+    from .cache import fingerprint
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from cache import fingerprint
+
+
+def journal_path_for(excel_path):
+    """Chemin du journal associé à un classeur: 'X.xlsx' -> 'X.journal.sqlite'."""
+    p = pathlib.Path(excel_path)
+    return p.with_name(p.stem + ".journal.sqlite")
+
+
+def json_default(v):
+    """default= de json.dumps pour les ventes: Timestamp / datetime / numpy scalaires -> types JSON."""
+    if hasattr(v, "isoformat"):
+        return v.isoformat(sep=" ")
+    if hasattr(v, "item"):
+        return v.item()
+    return str(v)
+
+
+class SalesJournal:
+    """
+    Journal durable des ventes non encore repliées dans le classeur.
+    - append(ligne): insertion + commit (fsync du WAL), O(1)
+    - pending_frame(): lignes en attente sous forme de DataFrame
+    - compact(fold): appelle fold(df_en_attente) puis purge les lignes repliées
+    - seal(tmp): preuve d'écriture, à passer en before_replace à atomic_write dans fold
+    """
+
+    def __init__(self, path, excel_path=None):
+        self.path = pathlib.Path(path)
+        self.excel_path = pathlib.Path(excel_path) if excel_path else None
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()  # une seule compaction à la fois
+        # isolation_level=None: on pilote les transactions explicitement
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: chaque commit est synchronisé sur disque (une vente validée n'est jamais perdue)
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ventes ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " ligne TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (cle TEXT PRIMARY KEY, valeur TEXT)")
+        self._recover()
+
+    # ---- écriture ----
+    def append(self, ligne):
+        """Ajoute une ligne de vente (dict) et retourne son identifiant."""
+        payload = json.dumps(ligne, default=json_default, ensure_ascii=False)
+        with self._lock:
+            cur = self._conn.execute("INSERT INTO ventes (ligne) VALUES (?)", (payload,))
+            return cur.lastrowid
+
+    def append_many(self, lignes):
+        """
+        Ajoute plusieurs lignes en une transaction (un seul fsync du WAL: validation
+        groupée des ventes reçues par le service). Retourne leurs identifiants.
+        """
+        payloads = [json.dumps(l, default=json_default, ensure_ascii=False) for l in lignes]
+        if not payloads:
+            return []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [self._conn.execute("INSERT INTO ventes (ligne) VALUES (?)", (p,)).lastrowid for p in payloads]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    # ---- lecture ----
+    def pending(self):
+        """Liste de (id, dict) des lignes en attente, dans l'ordre de saisie."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, ligne FROM ventes ORDER BY id").fetchall()
+        return [(i, json.loads(l)) for i, l in rows]
+
+    def pending_frame(self):
+        rows = self.pending()
+        if not rows:
+            return pd.DataFrame()
+        return pd.DataFrame.from_records([l for _, l in rows])
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ventes").fetchone()[0]
+
+    # ---- compaction ----
+    def compact(self, fold):
+        """
+        Replie les lignes en attente: fold(df) doit écrire le classeur.
+        Les lignes ne sont purgées qu'après le succès de fold. Un marqueur
+        (dernier id replié, puis empreinte du classeur écrit posée par seal) permet,
+        après une coupure entre l'écriture et la purge, de savoir si le repli a eu
+        lieu (cf. _recover); fold sans seal: les lignes restent en attente après reprise.
+        Le verrou du journal n'est pas tenu pendant fold: les ventes saisies
+        pendant l'écriture (id > max_id) restent en attente pour la suivante.
+        Retourne le nombre de lignes repliées.
+        """
+        with self._compact_lock:
+            with self._lock:
+                rows = self._conn.execute("SELECT id, ligne FROM ventes ORDER BY id").fetchall()
+                if not rows:
+                    return 0
+                max_id = rows[-1][0]
+                self._set_meta("compaction_max_id", str(max_id))
+            try:
+                fold(pd.DataFrame.from_records([json.loads(l) for _, l in rows]))
+            except Exception:
+                with self._lock:
+                    self._clear_marker()
+                raise
+            with self._lock:
+                self._purge(max_id)
+            return len(rows)
+
+    def seal(self, tmp_path):
+        """
+        Enregistre (commit synchronisé) l'empreinte du classeur écrit, juste avant
+        os.replace: le renommage conserve taille et mtime, le classeur en place ne
+        porte donc cette empreinte que si le remplacement a eu lieu.
+        """
+        with self._lock:
+            self._set_meta("compaction_apres", fingerprint(tmp_path))
+
+    def _recover(self):
+        """Termine une compaction interrompue (classeur écrit mais journal non purgé)."""
+        max_id = self._get_meta("compaction_max_id")
+        if max_id is None:
+            return
+        apres = self._get_meta("compaction_apres")
+        if self.excel_path and apres and fingerprint(self.excel_path) == apres:
+            # le classeur en place est celui écrit par la compaction: les lignes y sont déjà
+            self._purge(int(max_id))
+        else:
+            # pas de preuve (coupure avant le remplacement, ou classeur retouché depuis):
+            # les lignes restent en attente plutôt que d'être perdues
+            self._clear_marker()
+
+    def _purge(self, max_id):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("DELETE FROM ventes WHERE id <= ?", (max_id,))
+            self._conn.execute("DELETE FROM meta WHERE cle LIKE 'compaction_%'")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _clear_marker(self):
+        self._conn.execute("DELETE FROM meta WHERE cle LIKE 'compaction_%'")
+
+    def _get_meta(self, cle):
+        row = self._conn.execute("SELECT valeur FROM meta WHERE cle = ?", (cle,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, cle, valeur):
+        self._conn.execute("INSERT OR REPLACE INTO meta (cle, valeur) VALUES (?, ?)", (cle, valeur))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
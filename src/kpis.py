@@ -0,0 +1,242 @@
+# src/kpis.py
+# KPI ventes incrémentaux: amorcés une fois depuis tbl_Ventes puis mis à jour
+# ligne par ligne (ajout / retrait), sans re-sommer ni regrouper tout le journal.
+
+import heapq
+import math
+from operator import itemgetter
+
+import pandas as pd
+
+try:
+    from .perf import timed
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from perf import timed
+
+# noms de colonnes acceptés (même ordre de priorité que compute_kpis)
+COLS_PRODUIT = ["Produit", "Nom du Produit", "Nom Produit"]
+COLS_QTE = ["Qté Vendue", "Qté vendue", "Quantité", "Qte", "Qty"]
+COLS_PRIX = ["Prix Menu", "Prix de vente", "Prix", "PrixVente"]
+COLS_CA = ["CA ligne", "CA", "Montant"]
+COLS_CMP = ["CMP_par_portion", "Coût Moyen Portion", "Coût_par_portion", "CMP"]
+COLS_COUT_LIGNE = ["Coût matière ligne", "Coût matière", "Cout_ligne"]
+
+
+def choose_col(df, possibles):
+    for c in possibles:
+        if c in df.columns:
+            return c
+    return None
+
+
+def cell_number(v):
+    """Valeur numérique d'une cellule (None / NaN / texte vide -> 0)."""
+    if v is None or v == "":
+        return 0.0
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(f) else f
+
+
+def _is_na(v):
+    return v is None or (isinstance(v, float) and math.isnan(v)) or v is pd.NaT
+
+
+class KpiState:
+    """
+    Accumulateur des KPI de compute_kpis: CA total, coût matière total, food cost %
+    et CA par produit (top-N par tas). Une mise à jour coûte O(1) et la lecture
+    O(nb produits), quelle que soit la taille de tbl_Ventes.
+    """
+
+    def __init__(self, top_n=5):
+        self.top_n = top_n
+        self.total_ca = 0.0
+        self.total_cm = 0.0
+        self.ca_par_produit = {}
+        self.lignes_par_produit = {}
+        self.nb_lignes = 0
+        self._cols = None  # colonnes résolues (produit, qte, prix, ca, cmp, coût ligne)
+
+    @classmethod
+    def from_frame(cls, ventes_df, top_n=5):
+        state = cls(top_n)
+        state.seed(ventes_df)
+        return state
+
+    def _resolve(self, df):
+        self._cols = (
+            choose_col(df, COLS_PRODUIT) or (df.columns[0] if len(df.columns) else None),
+            choose_col(df, COLS_QTE),
+            choose_col(df, COLS_PRIX),
+            choose_col(df, COLS_CA),
+            choose_col(df, COLS_CMP),
+            choose_col(df, COLS_COUT_LIGNE),
+        )
+
+    def seed(self, ventes_df):
+        """Amorçage vectorisé (mêmes règles que compute_kpis, sans modifier ventes_df)."""
+        self.total_ca = 0.0
+        self.total_cm = 0.0
+        self.ca_par_produit = {}
+        self.lignes_par_produit = {}
+        self.nb_lignes = 0
+        self._cols = None
+        if ventes_df is None or ventes_df.empty:
+            return self
+        self._resolve(ventes_df)
+        col_prod = self._cols[0]
+        ca = self._frame_ca(ventes_df)
+        cm = self._frame_cm(ventes_df)
+        self.total_ca = float(ca.sum())
+        self.total_cm = float(cm.sum())
+        grp = ca.groupby(ventes_df[col_prod], dropna=True, observed=True)
+        self.ca_par_produit = grp.sum().to_dict()
+        self.lignes_par_produit = grp.size().to_dict()
+        self.nb_lignes = len(ventes_df)
+        return self
+
+    @staticmethod
+    def _get(df, col):
+        # colonne absente d'un lot (ex. ligne du journal) -> NaN, comme après concat
+        return df[col] if col in df.columns else pd.Series(float("nan"), index=df.index)
+
+    def _frame_ca(self, df):
+        _, q, px, col_ca, _, _ = self._cols
+        if col_ca is not None:
+            return pd.to_numeric(self._get(df, col_ca), errors="coerce")
+        if px and q:
+            return self._get(df, px).fillna(0) * self._get(df, q).fillna(0)
+        return pd.Series(0, index=df.index)
+
+    def _frame_cm(self, df):
+        _, q, _, _, cmpcol, col_cm = self._cols
+        if col_cm is not None:
+            return pd.to_numeric(self._get(df, col_cm), errors="coerce")
+        if cmpcol and q:
+            return self._get(df, cmpcol).fillna(0) * self._get(df, q).fillna(0)
+        return pd.Series(0, index=df.index)
+
+    def _line_values(self, ligne):
+        col_prod, q, px, col_ca, cmpcol, col_cm = self._cols
+        if col_ca is not None:
+            ca = cell_number(ligne.get(col_ca))
+        else:
+            ca = cell_number(ligne.get(px)) * cell_number(ligne.get(q)) if px and q else 0.0
+        if col_cm is not None:
+            cm = cell_number(ligne.get(col_cm))
+        else:
+            cm = cell_number(ligne.get(cmpcol)) * cell_number(ligne.get(q)) if cmpcol and q else 0.0
+        return ligne.get(col_prod), ca, cm
+
+    def add(self, ligne, sign=1):
+        """Ajoute (sign=1) ou retire (sign=-1) une ligne de vente (dict ou Series)."""
+        if self._cols is None:
+            self._resolve(pd.DataFrame(columns=list(ligne.keys())))
+        prod, ca, cm = self._line_values(ligne)
+        self.total_ca += sign * ca
+        self.total_cm += sign * cm
+        self.nb_lignes += sign
+        if not _is_na(prod):
+            self._bump(prod, sign * ca, sign)
+        return self
+
+    def _bump(self, prod, ca, n):
+        n = self.lignes_par_produit.get(prod, 0) + n
+        if n <= 0:
+            # plus aucune ligne: le produit disparaît du regroupement, comme dans compute_kpis
+            self.lignes_par_produit.pop(prod, None)
+            self.ca_par_produit.pop(prod, None)
+            return
+        self.lignes_par_produit[prod] = n
+        self.ca_par_produit[prod] = self.ca_par_produit.get(prod, 0.0) + ca
+
+    def remove(self, ligne):
+        return self.add(ligne, sign=-1)
+
+    def add_frame(self, df, sign=1):
+        """Variante vectorisée pour un lot de lignes (delta d'un rechargement)."""
+        if df is None or df.empty:
+            return self
+        if self._cols is None:
+            return self.seed(df) if sign > 0 else self
+        ca = self._frame_ca(df)
+        cm = self._frame_cm(df)
+        self.total_ca += sign * float(ca.sum())
+        self.total_cm += sign * float(cm.sum())
+        self.nb_lignes += sign * len(df)
+        col_prod = self._cols[0]
+        if col_prod in df.columns:
+            grp = ca.groupby(df[col_prod], dropna=True, observed=True)
+            for (prod, v), n in zip(grp.sum().items(), grp.size().values):
+                self._bump(prod, sign * v, sign * int(n))
+        return self
+
+    def top(self, n=None):
+        """Top-N produits par CA (tas de taille n sur le dict produit -> CA)."""
+        return dict(heapq.nlargest(n or self.top_n, self.ca_par_produit.items(), key=itemgetter(1)))
+
+    def kpis(self):
+        """Même dictionnaire que compute_kpis."""
+        if self.nb_lignes <= 0:
+            return {"Total CA": 0, "Coût matière total": 0, "Food cost %": 0, "Top produits": {}}
+        return {
+            "Total CA": float(self.total_ca),
+            "Coût matière total": float(self.total_cm),
+            "Food cost %": float((self.total_cm / self.total_ca) * 100) if self.total_ca else 0.0,
+            "Top produits": self.top(),
+        }
+
+
+@timed("compute_kpis", rows_in=lambda ventes_df, produits_df: len(ventes_df))
+def compute_kpis(ventes_df, produits_df):
+    """Calcule des KPI simples en s'adaptant aux noms de colonnes présents."""
+    k = {}
+    if ventes_df.empty:
+        k["Total CA"] = 0
+        k["Coût matière total"] = 0
+        k["Food cost %"] = 0
+        k["Top produits"] = {}
+        return k
+
+    # colonnes prévues dans ton fichier
+    col_prod = choose_col(ventes_df, ["Produit", "Nom du Produit", "Nom Produit"])
+    col_qte = choose_col(ventes_df, ["Qté Vendue", "Qté vendue", "Quantité", "Qte", "Qty"])
+    col_prix = choose_col(ventes_df, ["Prix Menu", "Prix de vente", "Prix", "PrixVente"])
+    col_ca = choose_col(ventes_df, ["CA ligne", "CA", "Montant"])
+    col_cmp = choose_col(ventes_df, ["CMP_par_portion", "Coût Moyen Portion", "Coût_par_portion", "CMP"])
+    col_cm_l = choose_col(ventes_df, ["Coût matière ligne", "Coût matière", "Cout_ligne"])
+
+    # créer CA ligne si absent
+    if col_ca is None:
+        px = col_prix if col_prix else None
+        q = col_qte if col_qte else None
+        if px and q:
+            ventes_df["CA ligne"] = ventes_df[px].fillna(0) * ventes_df[q].fillna(0)
+        else:
+            ventes_df["CA ligne"] = 0
+        col_ca = "CA ligne"
+
+    # créer Coût matière ligne si absent
+    if col_cm_l is None:
+        cmpcol = col_cmp if col_cmp else None
+        q = col_qte if col_qte else None
+        if cmpcol and q:
+            ventes_df["Coût matière ligne"] = ventes_df[cmpcol].fillna(0) * ventes_df[q].fillna(0)
+        else:
+            ventes_df["Coût matière ligne"] = 0
+        col_cm_l = "Coût matière ligne"
+
+    total_ca = ventes_df[col_ca].sum()
+    total_cm = ventes_df[col_cm_l].sum()
+    k["Total CA"] = float(total_ca)
+    k["Coût matière total"] = float(total_cm)
+    k["Food cost %"] = float((total_cm / total_ca) * 100) if total_ca else 0.0
+
+    # top produits par CA (utilise la colonne produit trouvée)
+    prod_col_for_group = col_prod if col_prod else ventes_df.columns[0]
+    top = ventes_df.groupby(prod_col_for_group, dropna=True, observed=True).agg({col_ca: "sum"}).sort_values(col_ca, ascending=False).head(5)
+    k["Top produits"] = top[col_ca].to_dict() if not top.empty else {}
+    return k
@@ -0,0 +1,120 @@
+# src/memo.py
+# Mémoïsation bornée en octets (LRU) des étapes lecture / nettoyage / calcul.
+# Partagé entre sessions Streamlit via st.cache_resource; les valeurs rendues
+# sont partagées: les appelants ne doivent pas les modifier en place.
+
+import hashlib
+import numbers
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def content_hash(data):
+    """Empreinte SHA-256 d'un contenu (bytes ou file-like)."""
+    if hasattr(data, "getvalue"):
+        data = data.getvalue()
+    elif hasattr(data, "read"):
+        data.seek(0)
+        data = data.read()
+    return hashlib.sha256(data).hexdigest()
+
+
+def sizeof(value):
+    """Taille approximative (octets) d'une valeur mise en cache."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True, index=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    # objets de calcul (SalesCube, StockLedger, PriceScenarios, tableaux NumPy): taille déclarée
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, numbers.Integral):
+        return int(nbytes)
+    return sys.getsizeof(value)
+
+
+class ByteLRU:
+    """Cache LRU thread-safe borné par la taille totale des valeurs."""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # clé -> (valeur, octets)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        size = sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._data.pop(key)[1]
+            if size > self.max_bytes:
+                return value  # trop gros pour être gardé
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, s) = self._data.popitem(last=False)
+                self._bytes -= s
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._data)
+
+
+class StageRunner:
+    """
+    Exécute des étapes chaînées avec mémoïsation: chaque étape a une clé dérivée
+    de ses entrées; une étape dont la clé est en cache n'est pas recalculée.
+    Garde pour affichage: (étape, hit/miss, durée).
+    """
+
+    _MISSING = object()
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.report = []
+
+    def run(self, stage, key, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        full_key = (stage, key)
+        value = self.cache.get(full_key, self._MISSING)
+        hit = value is not self._MISSING
+        if not hit:
+            value = self.cache.put(full_key, fn(*args, **kwargs))
+        self.report.append({"étape": stage, "cache": "hit" if hit else "miss",
+                            "durée (ms)": round((time.perf_counter() - t0) * 1000, 2)})
+        return value
+
+    def report_frame(self):
+        return pd.DataFrame(self.report)
@@ -0,0 +1,256 @@
+# src/perf.py
+# Instrumentation légère des chemins critiques: spans (gestionnaire de contexte
+# ou décorateur) -> durée, lignes traitées, delta de mémoire résidente, dans un
+# tampon circulaire lu par les panneaux « perf » (Tk, Streamlit).
+# Désactivé, un span coûte un test de booléen. Variables d'environnement:
+#   REGRAGA_PERF=1                     active l'enregistrement
+#   REGRAGA_PERF_LOG=perf.jsonl        copie chaque span en JSON lines
+#   REGRAGA_PERF_PROFILE=cprofile,tracemalloc
+#                                      capture à la demande des spans de premier niveau
+#   REGRAGA_PERF_PROFILE_SPANS=save_tables,load_tables   limite la capture à ces spans
+#   REGRAGA_PERF_DIR=.regraga_perf     dossier des captures (.prof, .txt)
+#   REGRAGA_PERF_BUFFER=2000           taille du tampon circulaire
+
+import functools
+import json
+import os
+import pathlib
+import sys
+import threading
+import time
+from collections import deque
+
+
+class _State:
+    def __init__(self):
+        env = os.environ
+        self.enabled = env.get("REGRAGA_PERF", "0") not in ("", "0")
+        self.buffer = deque(maxlen=int(env.get("REGRAGA_PERF_BUFFER", "2000")))
+        self.log_path = env.get("REGRAGA_PERF_LOG") or None
+        self.profile = {p.strip() for p in env.get("REGRAGA_PERF_PROFILE", "").split(",") if p.strip()}
+        self.profile_spans = {s.strip() for s in env.get("REGRAGA_PERF_PROFILE_SPANS", "").split(",") if s.strip()}
+        self.profile_dir = pathlib.Path(env.get("REGRAGA_PERF_DIR", ".regraga_perf"))
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+
+_state = _State()
+
+
+def enabled():
+    return _state.enabled
+
+
+def enable(flag=True):
+    """Active / désactive l'enregistrement à chaud (case à cocher des panneaux perf)."""
+    _state.enabled = bool(flag)
+
+
+def records():
+    """Copie des spans du tampon, du plus ancien au plus récent."""
+    with _state.lock:
+        return list(_state.buffer)
+
+
+def clear():
+    with _state.lock:
+        _state.buffer.clear()
+
+
+def summary():
+    """Agrégat par nom de span: nombre d'appels, durée totale / moyenne / max, dernier appel."""
+    agg = {}
+    for r in records():
+        a = agg.setdefault(r["nom"], {"nom": r["nom"], "appels": 0, "total (ms)": 0.0, "max (ms)": 0.0})
+        a["appels"] += 1
+        a["total (ms)"] += r["durée (ms)"]
+        a["max (ms)"] = max(a["max (ms)"], r["durée (ms)"])
+        a["dernier (ms)"] = r["durée (ms)"]
+        a["lignes (dernier)"] = r.get("lignes")
+    out = sorted(agg.values(), key=lambda a: -a["total (ms)"])
+    for a in out:
+        a["moyenne (ms)"] = a["total (ms)"] / a["appels"]
+    return out
+
+
+# ---- mémoire résidente courante (le pic de resource.getrusage ne donne pas de delta) ----
+def _rss_linux():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _rss_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class PMC(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    pmc = PMC()
+    pmc.cb = ctypes.sizeof(PMC)
+    ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(pmc), pmc.cb)
+    return pmc.WorkingSetSize
+
+
+def _rss_none():
+    return None
+
+
+if sys.platform.startswith("linux"):
+    current_rss = _rss_linux
+elif sys.platform == "win32":
+    current_rss = _rss_windows
+else:
+    current_rss = _rss_none
+
+
+def count_rows(value):
+    """Lignes d'un résultat: DataFrame / Series, ou somme sur un tuple / dict de DataFrames."""
+    if hasattr(value, "shape") and hasattr(value, "index"):
+        return len(value)
+    items = value.values() if isinstance(value, dict) else value if isinstance(value, (tuple, list)) else ()
+    counts = [len(v) for v in items if hasattr(v, "shape") and hasattr(v, "index")]
+    return sum(counts) if counts else None
+
+
+class _NoSpan:
+    """Span inactif (enregistrement désactivé): n'alloue rien, ne mesure rien."""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOSPAN = _NoSpan()
+
+
+class Span:
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self._profiler = None
+        self._tracing = False
+
+    def __enter__(self):
+        stack = getattr(_state.local, "stack", None)
+        if stack is None:
+            stack = _state.local.stack = []
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        if self.depth == 0 and _state.profile and (not _state.profile_spans or self.name in _state.profile_spans):
+            self._start_capture()
+        self._rss0 = current_rss()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duree = time.perf_counter() - self._t0
+        rss1 = current_rss()
+        _state.local.stack.pop()
+        rec = {
+            "nom": self.name,
+            "début": time.time() - duree,
+            "durée (ms)": duree * 1000,
+            "lignes": self.rows,
+            "mémoire Δ (Ko)": None if rss1 is None or self._rss0 is None else (rss1 - self._rss0) / 1024,
+            "parent": self.parent,
+            "profondeur": self.depth,
+            "thread": threading.current_thread().name,
+            "erreur": exc_type.__name__ if exc_type else None,
+        }
+        if self._profiler is not None or self._tracing:
+            rec.update(self._stop_capture())
+        _record(rec)
+        return False
+
+    # ---- captures cProfile / tracemalloc ----
+    def _start_capture(self):
+        if "tracemalloc" in _state.profile:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self._tracing = True
+        if "cprofile" in _state.profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:  # un autre profileur est déjà actif (autre thread)
+                self._profiler = None
+
+    def _stop_capture(self):
+        out = {}
+        stamp = time.strftime("%Y%m%d-%H%M%S") + f"-{int(time.time() * 1000) % 1000:03d}"
+        base = _state.profile_dir / f"{self.name}-{stamp}"
+        _state.profile_dir.mkdir(parents=True, exist_ok=True)
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(str(base) + ".prof")
+            out["profil"] = str(base) + ".prof"
+            self._profiler = None
+        if self._tracing:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            out["pic tracemalloc (Ko)"] = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+            self._tracing = False
+            with open(str(base) + ".tracemalloc.txt", "w", encoding="utf-8") as f:
+                for stat in snapshot.statistics("lineno")[:25]:
+                    f.write(f"{stat}\n")
+            out["allocations"] = str(base) + ".tracemalloc.txt"
+        return out
+
+
+def _record(rec):
+    with _state.lock:
+        _state.buffer.append(rec)
+        if _state.log_path:
+            try:
+                with open(_state.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+            except OSError:
+                pass  # le journal perf ne doit jamais bloquer l'appli
+
+
+def span(name, rows=None):
+    """
+    with span("save_tables", rows=len(df)) as s: ...   (s.rows modifiable dans le bloc)
+    Sans effet si l'enregistrement est désactivé.
+    """
+    if not _state.enabled:
+        return _NOSPAN
+    return Span(name, rows)
+
+
+def timed(name=None, rows=count_rows, rows_in=None):
+    """
+    Décorateur: un span par appel, nommé d'après la fonction. rows(résultat) donne
+    le nombre de lignes enregistré (par défaut: DataFrame ou tuple / dict de DataFrames).
+    rows_in(*args, **kwargs), prioritaire, compte les lignes depuis les arguments
+    (évalué après l'appel: DataFrame complété sur place, état de self rechargé, ...).
+    """
+    def deco(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return fn(*args, **kwargs)
+            with Span(label) as s:
+                result = fn(*args, **kwargs)
+                if rows_in is not None or rows is not None:
+                    try:
+                        s.rows = rows_in(*args, **kwargs) if rows_in is not None else rows(result)
+                    except Exception:
+                        s.rows = None
+                return result
+        return wrapper
+    return deco
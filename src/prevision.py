@@ -0,0 +1,360 @@
+# src/prevision.py
+# Prévision des quantités par produit (semaine à venir) et achats suggérés.
+#  - séries journalières produit x date depuis tbl_Ventes (jours sans vente = 0)
+#  - un modèle par produit: lissage exponentiel à saisonnalité hebdomadaire
+#    (statsmodels, paramètres estimés), à défaut naïf saisonnier (moyenne des
+#    mêmes jours de semaine sur les dernières semaines) pour les séries courtes
+#  - ajustements répartis sur un pool de processus, par lots de produits
+#  - états (niveau, saisons, paramètres) gardés en cache: les nouveaux jours sont
+#    absorbés par la récurrence du lissage, sans réestimation; réajustement
+#    seulement si l'historique déjà vu a changé ou après REFIT_JOURS nouveaux jours
+#  - besoins ingrédients = prévisions x recettes (src/recettes.py), comparés au
+#    stock courant et au seuil critique de tbl_Stock
+
+import json
+import os
+import pathlib
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .cache import SheetCache
+    from .calc import COLS_CODE, COLS_DATE, _to_dates
+    from .kpis import COLS_QTE, choose_col
+    from .perf import timed
+    from .recettes import COLS_INGREDIENT, RecipeCosting, stock_codes
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from cache import SheetCache
+    from calc import COLS_CODE, COLS_DATE, _to_dates
+    from kpis import COLS_QTE, choose_col
+    from perf import timed
+    from recettes import COLS_INGREDIENT, RecipeCosting, stock_codes
+
+SAISON = 7              # saisonnalité hebdomadaire (jours)
+HORIZON = 7             # jours prévus
+MIN_JOURS_ETS = 4 * SAISON   # historique minimal pour estimer le lissage
+MIN_JOURS_VENTE = SAISON     # jours avec vente minimum (sinon série trop creuse)
+SEMAINES_NAIF = 4       # semaines moyennées par le naïf saisonnier
+REFIT_JOURS = 28        # réestimation des paramètres après ce nombre de nouveaux jours
+CACHE_NAME = "prevision-{stem}.json"
+
+COLS_STOCK_COURANT = ["Stock Courant", "Quantité totale", "Stock Départ"]
+COLS_SEUIL = ["Seuil critique", "Seuil"]
+
+
+# ---------- séries ----------
+def daily_series(ventes_df):
+    """
+    Quantités vendues par jour (lignes, index continu de dates) et par produit (colonnes).
+    Lignes vides du tableau Excel (quantité nulle ou date absente) ignorées.
+    """
+    code = choose_col(ventes_df, COLS_CODE)
+    date = choose_col(ventes_df, COLS_DATE)
+    qcol = choose_col(ventes_df, COLS_QTE)
+    if code is None or date is None or qcol is None:
+        raise ValueError("tbl_Ventes: colonnes date / code produit / quantité introuvables")
+    qte = pd.to_numeric(ventes_df[qcol], errors="coerce").fillna(0.0)
+    dates = _to_dates(ventes_df[date]).dt.normalize()
+    codes = ventes_df[code].astype(str).str.strip()
+    ok = (qte > 0) & dates.notna() & ventes_df[code].notna()
+    if not ok.any():
+        return pd.DataFrame(dtype=float)
+    jours = dates[ok].to_numpy(dtype="datetime64[D]")
+    table = pd.crosstab(jours, codes[ok].to_numpy(), values=qte[ok].to_numpy(), aggfunc="sum").fillna(0.0)
+    index = pd.date_range(table.index.min(), table.index.max(), freq="D")
+    table = table.set_axis(pd.DatetimeIndex(table.index)).reindex(index, fill_value=0.0)
+    table.index.name, table.columns.name = "date", "code"
+    return table.astype(float)
+
+
+def _weekday(day):
+    """Jour de semaine (0 = lundi) d'un numéro de jour depuis 1970 (1970-01-01 est un jeudi)."""
+    return (day + 3) % 7
+
+
+# ---------- modèles (exécutés dans les processus) ----------
+def _smooth(state, values, first_day):
+    """
+    Récurrence du lissage additif (niveau + saison hebdomadaire) sur de nouvelles
+    valeurs, à paramètres fixés (forme de statsmodels: la saison utilise le niveau précédent).
+    """
+    a, g = state["alpha"], state["gamma"]
+    level = state["niveau"]
+    season = list(state["saisons"])
+    for k, y in enumerate(values):
+        w = _weekday(first_day + k)
+        prev = level
+        level = a * (y - season[w]) + (1 - a) * prev
+        season[w] = g * (y - prev) + (1 - g) * season[w]
+    state["niveau"], state["saisons"] = level, season
+
+
+def _queue(values, first_day):
+    """Dernières semaines de la série (naïf saisonnier, repli du lissage)."""
+    keep = SEMAINES_NAIF * SAISON
+    return {"queue": [float(v) for v in values[-keep:]], "queue_fin": int(first_day + len(values) - 1)}
+
+
+def _naive_state(values, first_day):
+    return {"methode": "naïf saisonnier", **_queue(values, first_day)}
+
+
+def _fit_one(values, first_day):
+    """État ajusté d'une série (jours consécutifs à partir de first_day)."""
+    values = np.asarray(values, dtype=float)
+    if len(values) < MIN_JOURS_ETS or np.count_nonzero(values) < MIN_JOURS_VENTE:
+        return _naive_state(values, first_day)
+    try:
+        from statsmodels.tsa.holtwinters import ExponentialSmoothing
+        # use_brute=False: pas de recherche sur grille des paramètres initiaux (2x plus rapide, même SSE)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            res = ExponentialSmoothing(values, trend=None, seasonal="add", seasonal_periods=SAISON,
+                                       initialization_method="estimated").fit(use_brute=False)
+        p = res.params
+        alpha, gamma = float(p["smoothing_level"]), float(p["smoothing_seasonal"])
+        init = np.asarray(p["initial_seasons"], dtype=float)
+        level0 = float(p["initial_level"])
+    except Exception:  # statsmodels absent ou ajustement impossible (série constante, ...)
+        return _naive_state(values, first_day)
+    if not np.isfinite([alpha, gamma, level0]).all() or not np.isfinite(init).all():
+        return _naive_state(values, first_day)
+    # saisons initiales rangées par jour de semaine, puis récurrence sur tout l'historique
+    saisons = [0.0] * SAISON
+    for k in range(SAISON):
+        saisons[_weekday(first_day + k)] = float(init[k])
+    state = {"methode": "lissage exponentiel", "alpha": alpha, "gamma": gamma, "niveau": level0, "saisons": saisons}
+    _smooth(state, values, first_day)
+    state.update(_queue(values, first_day))
+    return state
+
+
+def _fit_batch(batch):
+    """Travail d'un processus: [(code, valeurs, premier jour)] -> {code: état}."""
+    return {code: _fit_one(values, first_day) for code, values, first_day in batch}
+
+
+def update_state(state, values, first_day):
+    """Absorbe de nouveaux jours (à partir de first_day) dans un état, sans réestimation."""
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return state
+    if state["methode"] == "lissage exponentiel":
+        _smooth(state, values, first_day)
+    queue = np.r_[np.asarray(state["queue"], dtype=float), values]
+    state.update(_queue(queue, first_day + len(values) - len(queue)))
+    return state
+
+
+def forecast_state(state, last_day, horizon=HORIZON):
+    """Quantités prévues pour les horizon jours suivant last_day (jamais négatives)."""
+    days = np.arange(last_day + 1, last_day + 1 + horizon)
+    if state["methode"] == "lissage exponentiel":
+        saisons = np.asarray(state["saisons"], dtype=float)
+        out = state["niveau"] + saisons[_weekday(days)]
+    else:
+        queue = np.asarray(state["queue"], dtype=float)
+        qdays = np.arange(state["queue_fin"] - len(queue) + 1, state["queue_fin"] + 1)
+        wd = _weekday(qdays)
+        out = np.array([queue[wd == w].mean() if (wd == w).any() else queue.mean() for w in _weekday(days)])
+    return np.maximum(out, 0.0)
+
+
+# ---------- orchestration ----------
+class DemandForecaster:
+    """
+    États par produit, ajustés en parallèle puis tenus à jour jour par jour.
+      update(series)       -> ajuste les nouveaux produits / ceux dont l'historique a changé
+                              (ou raccourci), absorbe les nouveaux jours des autres, abandonne
+                              les produits absents de series; retourne le bilan
+      forecast(horizon)    -> DataFrame code, prévision totale, jours prévus, méthode
+      save(path) / load(path)   états en JSON (cache à côté du classeur)
+    """
+
+    def __init__(self, workers=None, refit_days=REFIT_JOURS):
+        self.workers = workers
+        self.refit_days = refit_days
+        self.states = {}   # code -> état + "fin" (dernier jour absorbé), "somme" / "jours" (contrôle), "ajusté"
+        self.last_day = None
+
+    @classmethod
+    def for_workbook(cls, path, **kwargs):
+        """Forecaster dont les états sont rangés dans le cache du classeur (.regraga_cache/)."""
+        f = cls(**kwargs)
+        f.path = SheetCache.root_for(path) / CACHE_NAME.format(stem=pathlib.Path(path).stem)
+        if f.path.exists():
+            try:
+                f.load(f.path)
+            except (OSError, ValueError, KeyError):
+                f.states = {}  # cache illisible: tout réajuster
+        return f
+
+    # ---- mise à jour ----
+    def _plan(self, series):
+        """Produits à ajuster (historique complet) et à mettre à jour (nouveaux jours seulement)."""
+        days = series.index.to_numpy(dtype="datetime64[D]").astype(np.int64)
+        first, last = int(days[0]), int(days[-1])
+        values = series.to_numpy()
+        cums = np.cumsum(values, axis=0)
+        refit, incr = [], []
+        for j, code in enumerate(series.columns):
+            st = self.states.get(code)
+            if st is not None:
+                fin = st["fin"]
+                k = fin - first
+                seen = float(cums[k, j]) if 0 <= k < len(days) else None
+                # historique inchangé jusqu'au dernier jour vu et réestimation pas encore due
+                if (fin <= last and seen is not None and st["début"] == first and np.isclose(seen, st["somme"])
+                        and fin - st["ajusté"] < self.refit_days):
+                    incr.append((code, j, k + 1))
+                    continue
+            refit.append((code, j))
+        return first, last, values, cums, refit, incr
+
+    @timed("prevision_update", rows_in=lambda self, series: series.size)
+    def update(self, series):
+        # produits absents de l'historique (retirés de la carte, lignes supprimées): états abandonnés
+        codes = set(series.columns)
+        retires = [c for c in self.states if c not in codes]
+        for c in retires:
+            del self.states[c]
+        if series.empty:
+            return {"ajustés": 0, "mis à jour": 0, "inchangés": 0, "retirés": len(retires)}
+        first, last, values, cums, refit, incr = self._plan(series)
+        batch = [(code, values[:, j], first) for code, j in refit]
+        fitted = self._fit(batch)
+        for code, j in refit:
+            st = fitted[code]
+            st.update({"début": first, "fin": last, "ajusté": last, "somme": float(cums[-1, j])})
+            self.states[code] = st
+        n_incr = 0
+        for code, j, start in incr:
+            st = self.states[code]
+            if start < len(values):
+                update_state(st, values[start:, j], first + start)
+                n_incr += 1
+            st.update({"fin": last, "somme": float(cums[-1, j])})
+        self.last_day = last
+        return {"ajustés": len(refit), "mis à jour": n_incr, "inchangés": len(incr) - n_incr, "retirés": len(retires)}
+
+    def _fit(self, batch):
+        if not batch:
+            return {}
+        workers = max(1, min(self.workers or os.cpu_count() or 1, len(batch)))
+        if workers == 1:
+            return _fit_batch(batch)
+        # quelques lots par processus: le coût de lancement est payé par lot, pas par produit
+        n = workers * 4
+        chunks = [batch[i::n] for i in range(n) if batch[i::n]]
+        out = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(_fit_batch, chunks):
+                out.update(part)
+        return out
+
+    # ---- résultats ----
+    def forecast(self, horizon=HORIZON):
+        cols = ["code", "prévision", "méthode"]
+        if self.last_day is None or not self.states:
+            return pd.DataFrame(columns=cols)
+        days = pd.DatetimeIndex(np.arange(self.last_day + 1, self.last_day + 1 + horizon).astype("datetime64[D]"))
+        rows = []
+        for code, st in self.states.items():
+            # produit sans vente depuis son dernier jour absorbé: jours manquants = 0
+            if st["fin"] < self.last_day:
+                update_state(st, np.zeros(self.last_day - st["fin"]), st["fin"] + 1)
+                st["fin"] = self.last_day
+            q = forecast_state(st, self.last_day, horizon)
+            rows.append([code, float(q.sum()), st["methode"], *q])
+        out = pd.DataFrame(rows, columns=cols + [d.strftime("%Y-%m-%d") for d in days])
+        return out.sort_values("prévision", ascending=False, ignore_index=True)
+
+    # ---- persistance ----
+    def save(self, path=None):
+        path = pathlib.Path(path or self.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dernier jour": self.last_day, "états": self.states}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        return path
+
+    def load(self, path):
+        with open(path, encoding="utf-8") as f:
+            doc = json.load(f)
+        self.states = doc["états"]
+        self.last_day = doc["dernier jour"]
+        return self
+
+
+# ---------- achats ----------
+def purchase_suggestions(forecast_df, recettes_df, stock_df, stock_qte=None):
+    """
+    Besoins ingrédients de la période prévue (prévisions x recettes développées) et
+    quantités à commander: max(0, besoin + seuil critique - stock courant).
+    stock_qte: quantités en stock par ingrédient (ex. StockLedger.state()["qte"]);
+    à défaut, colonne « Stock Courant » de tbl_Stock.
+    """
+    cols = ["Cde_Ingrdt", "Ingrédient", "Unité", "Besoin prévu", "Stock courant", "Seuil critique", "Achat suggéré"]
+    if forecast_df is None or forecast_df.empty or recettes_df is None or recettes_df.empty:
+        return pd.DataFrame(columns=cols)
+    costing = RecipeCosting(recettes_df, base_codes=stock_codes(stock_df))
+    prevu = forecast_df.set_index("code")["prévision"].reindex(costing.products).fillna(0.0).to_numpy()
+    besoin = np.bincount(costing.cols, weights=costing.vals * prevu[costing.rows], minlength=len(costing.ingredients))
+    out = pd.DataFrame({"Cde_Ingrdt": costing.ingredients, "Besoin prévu": besoin})
+    out = out[out["Besoin prévu"] > 0]
+
+    infos = pd.DataFrame(index=pd.Index([], name="Cde_Ingrdt"))
+    if stock_df is not None and not stock_df.empty and choose_col(stock_df, COLS_INGREDIENT) is not None:
+        codes = stock_df[choose_col(stock_df, COLS_INGREDIENT)].astype(str).str.strip()
+        infos = pd.DataFrame({"Cde_Ingrdt": codes.to_numpy()})
+        for name, cands in (("Ingrédient", ["Ingrédient", "Nom ingredient "]), ("Unité", ["Unité"])):
+            c = choose_col(stock_df, cands)
+            infos[name] = stock_df[c].to_numpy() if c is not None else None
+        for name, cands in (("Stock courant", COLS_STOCK_COURANT), ("Seuil critique", COLS_SEUIL)):
+            c = choose_col(stock_df, cands)
+            infos[name] = pd.to_numeric(stock_df[c], errors="coerce").to_numpy() if c is not None else np.nan
+        infos = infos.drop_duplicates("Cde_Ingrdt", keep="last").set_index("Cde_Ingrdt")
+    if stock_qte is not None:
+        infos = infos.reindex(infos.index.union(pd.Index(stock_qte.index.astype(str))))
+        infos["Stock courant"] = pd.Series(stock_qte, dtype=float).set_axis(stock_qte.index.astype(str)).reindex(infos.index)
+    out = out.join(infos, on="Cde_Ingrdt")
+    for c in ("Ingrédient", "Unité", "Stock courant", "Seuil critique"):
+        if c not in out.columns:
+            out[c] = np.nan
+    stock = out["Stock courant"].fillna(0.0)
+    seuil = out["Seuil critique"].fillna(0.0)
+    out["Achat suggéré"] = np.maximum(out["Besoin prévu"] + seuil - stock, 0.0)
+    return out[cols].sort_values(["Achat suggéré", "Besoin prévu"], ascending=False, ignore_index=True)
+
+
+def forecast_workbook(path, horizon=HORIZON, workers=None, cache=True):
+    """
+    Prévisions et achats suggérés d'un classeur: {"Prévisions": ..., "Achats_Suggérés": ..., "bilan": {...}}.
+    cache=True reprend les états enregistrés à côté du classeur et les y réenregistre.
+    """
+    try:
+        from .io_excel import read_workbook
+    except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+        from io_excel import read_workbook
+
+    data = read_workbook(str(path))
+    if data.get("ventes") is None:
+        raise ValueError(f"{path}: onglet tbl_Ventes introuvable")
+    series = daily_series(data["ventes"])
+    forecaster = DemandForecaster.for_workbook(path, workers=workers) if cache else DemandForecaster(workers=workers)
+    bilan = forecaster.update(series)
+    prev = forecaster.forecast(horizon)
+    if cache:
+        forecaster.save()
+    produits = data.get("produits")
+    if produits is not None and not prev.empty:
+        code, nom = choose_col(produits, COLS_CODE), choose_col(produits, ["Produit"])
+        if code is not None and nom is not None:
+            noms = pd.Series(produits[nom].astype(str).to_numpy(), index=produits[code].astype(str).str.strip())
+            prev.insert(1, "Produit", prev["code"].map(noms[~noms.index.duplicated()]).to_numpy())
+    achats = purchase_suggestions(prev, data.get("recettes"), data.get("stock"))
+    return {"Prévisions": prev, "Achats_Suggérés": achats, "bilan": bilan}
@@ -0,0 +1,174 @@
+# src/recettes.py
+# Coût de revient par portion calculé depuis tbl_Recettes.
+# Les recettes sont aplaties (sous-recettes développées, cycles détectés) en
+# une matrice creuse produit x ingrédient (triplets COO); le coût de tous les
+# produits est alors un seul produit matrice-vecteur contre les CMP ingrédients.
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .kpis import choose_col
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from kpis import choose_col
+
+# noms propres au module: codes produit (pas les noms de kpis.COLS_PRODUIT),
+# quantités de recette et CMP ingrédient (pas ceux des lignes de vente)
+COLS_CODE_PRODUIT = ["Cde_Prdt", "Code produit", "code", "code_produit"]
+COLS_INGREDIENT = ["Cde_Ingrdt", "Code ingrédient", "Code ingrédient ", "code_ingredient"]
+COLS_QTE_RECETTE = ["Quantité", "Qté", "qte", "quantity"]
+COLS_CMP_INGREDIENT = ["CMP effectif", "CMP_effectif", "CMP Achat Unitaire", "CMP"]
+
+
+class RecipeCycleError(ValueError):
+    """Une recette se référence elle-même (directement ou via des sous-recettes)."""
+
+
+def ingredient_prices(stock_df):
+    """CMP par code ingrédient depuis tbl_Stock ('CMP effectif', à défaut 'CMP Achat Unitaire')."""
+    if stock_df is None or stock_df.empty:
+        return pd.Series(dtype=float)
+    code = choose_col(stock_df, COLS_INGREDIENT)
+    if code is None:
+        return pd.Series(dtype=float)
+    prix = pd.Series(np.nan, index=stock_df.index)
+    for c in COLS_CMP_INGREDIENT:
+        if c in stock_df.columns:
+            prix = prix.fillna(pd.to_numeric(stock_df[c], errors="coerce"))
+    out = pd.Series(prix.values, index=stock_df[code].astype(str).str.strip())
+    return out[~out.index.duplicated(keep="last")].dropna()
+
+
+def stock_codes(stock_df):
+    """Codes des ingrédients de base déclarés dans tbl_Stock."""
+    if stock_df is None or stock_df.empty:
+        return []
+    code = choose_col(stock_df, COLS_INGREDIENT)
+    return [] if code is None else list(stock_df[code].dropna().astype(str).str.strip())
+
+
+class RecipeCosting:
+    """
+    Matrice produit x ingrédient de base (quantité par portion) et coûts associés.
+      costs(prix)             -> Series code produit -> coût portion (recalcul complet)
+      update_prices(nouveaux) -> ne recalcule que les produits utilisant ces ingrédients
+    """
+
+    def __init__(self, recettes_df, base_codes=None):
+        """
+        base_codes: codes des ingrédients de base (ex. index de tbl_Stock). Les codes
+        ingrédient et produit se recouvrent dans le classeur (POI007 = filet de poisson
+        et soupe de poisson): un code de base n'est jamais développé en sous-recette.
+        """
+        col_p = choose_col(recettes_df, COLS_CODE_PRODUIT)
+        col_i = choose_col(recettes_df, COLS_INGREDIENT)
+        col_q = choose_col(recettes_df, COLS_QTE_RECETTE)
+        if col_p is None or col_i is None or col_q is None:
+            raise ValueError("tbl_Recettes: colonnes code produit / code ingrédient / quantité introuvables")
+        lignes = pd.DataFrame({
+            "p": recettes_df[col_p].astype("string").str.strip(),
+            "i": recettes_df[col_i].astype("string").str.strip(),
+            "q": pd.to_numeric(recettes_df[col_q], errors="coerce").fillna(0.0),
+        }).dropna(subset=["p", "i"])
+        lignes = lignes.groupby(["p", "i"], sort=False, as_index=False)["q"].sum()
+        direct = {p: list(zip(g["i"], g["q"])) for p, g in lignes.groupby("p", sort=False)}
+
+        flat = self._flatten(direct, set(base_codes) if base_codes is not None else set())
+        self.products = pd.Index(list(direct), name="code")
+        base = sorted({i for comp in flat.values() for i in comp})
+        self.ingredients = pd.Index(base, name="ingredient")
+        pos_i = {c: k for k, c in enumerate(base)}
+        rows, cols, vals = [], [], []
+        for r, p in enumerate(self.products):
+            for i, q in flat[p].items():
+                rows.append(r)
+                cols.append(pos_i[i])
+                vals.append(q)
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.cols = np.asarray(cols, dtype=np.int32)
+        self.vals = np.asarray(vals, dtype=np.float64)
+        # accès par colonne (ingrédient -> entrées) pour les mises à jour ciblées
+        self._order = np.argsort(self.cols, kind="stable")
+        self._indptr = np.searchsorted(self.cols[self._order], np.arange(len(base) + 1))
+        self._prices = np.zeros(len(base))
+        self._cost = np.zeros(len(self.products))
+        self.missing_prices = pd.Index([], name="ingredient")
+
+    @staticmethod
+    def _flatten(direct, base):
+        """Développe les sous-recettes (ingrédient qui est lui-même un produit hors ingrédients de base)."""
+        flat = {}
+        state = {}  # 1 = en cours, 2 = terminé
+
+        def visit(p, path):
+            if state.get(p) == 2:
+                return flat[p]
+            if state.get(p) == 1:
+                cycle = path[path.index(p):] + [p]
+                raise RecipeCycleError("Recette cyclique: " + " -> ".join(cycle))
+            state[p] = 1
+            comp = {}
+            for i, q in direct[p]:
+                if i in direct and i not in base:
+                    for j, qj in visit(i, path + [p]).items():
+                        comp[j] = comp.get(j, 0.0) + q * qj
+                else:
+                    comp[i] = comp.get(i, 0.0) + q
+            state[p] = 2
+            flat[p] = comp
+            return comp
+
+        for p in direct:
+            visit(p, [])
+        return flat
+
+    def matrix(self):
+        """Matrice dense produit x ingrédient (pour inspection / export)."""
+        m = np.zeros((len(self.products), len(self.ingredients)))
+        np.add.at(m, (self.rows, self.cols), self.vals)
+        return pd.DataFrame(m, index=self.products, columns=self.ingredients)
+
+    def costs(self, prices):
+        """Coût portion de tous les produits: un produit matrice creuse x vecteur des CMP."""
+        prices = pd.Series(prices, dtype=float)
+        vec = prices.reindex(self.ingredients)
+        self.missing_prices = self.ingredients[vec.isna().to_numpy()]
+        self._prices = np.array(vec.fillna(0.0), dtype=np.float64)
+        self._cost = np.bincount(self.rows, weights=self.vals * self._prices[self.cols],
+                                 minlength=len(self.products))
+        return self.cost_series()
+
+    def update_prices(self, changes):
+        """
+        Applique des changements de CMP {code ingrédient: prix}; seules les lignes
+        de la matrice touchées sont recalculées. Retourne les codes produits impactés.
+        """
+        touched = []
+        for code, price in dict(changes).items():
+            k = self.ingredients.get_indexer([code])[0]
+            if k < 0:
+                continue
+            delta = float(price) - self._prices[k]
+            self._prices[k] = float(price)
+            sel = self._order[self._indptr[k]:self._indptr[k + 1]]
+            if delta and len(sel):
+                np.add.at(self._cost, self.rows[sel], self.vals[sel] * delta)
+            touched.append(self.rows[sel])
+        if not touched:
+            return self.products[:0]
+        return self.products[np.unique(np.concatenate(touched))]
+
+    def cost_series(self):
+        return pd.Series(self._cost.copy(), index=self.products, name="Coût portion")
+
+
+def cout_portion(recettes_df, stock_df, prices=None):
+    """
+    Raccourci: coût portion par code produit (tbl_Recettes x CMP des ingrédients).
+    prices: CMP par ingrédient (ex. StockLedger.cmp()); à défaut, colonnes CMP de tbl_Stock.
+    """
+    if recettes_df is None or recettes_df.empty:
+        return pd.Series(dtype=float, name="Coût portion")
+    if prices is None:
+        prices = ingredient_prices(stock_df)
+    return RecipeCosting(recettes_df, base_codes=stock_codes(stock_df)).costs(prices)
@@ -0,0 +1,493 @@
+# src/service.py
+# Service local de saisie des ventes pour plusieurs caisses (2 à 4 postes aux
+# pics du Moussem). HTTP/1.1 minimal sur asyncio (bibliothèque standard seule):
+#  - validation de chaque ligne contre le catalogue de tbl_Produits en mémoire
+#    (prix menu et coût portion fixés par le service, pas par la caisse)
+#  - validation groupée: les ventes arrivées pendant une transaction partent
+#    ensemble dans la suivante du journal SQLite (un fsync par lot, pas par vente);
+#    la caisse n'a sa réponse qu'une fois la vente durable
+#  - export périodique du journal dans tbl_Ventes (src/xlsx_patch.py, écriture
+#    atomique), différé tant qu'Excel a le classeur ouvert
+# Routes:
+#   POST /ventes    {"produit": nom ou code, "qte": n, "date": optionnelle} ou liste -> 201 {"ids", "lignes"}
+#   GET  /ventes    lignes en attente d'export
+#   GET  /produits?q=texte   noms pour l'autocomplétion
+#   GET  /etat      compteurs (ventes, lots, exports)
+#   POST /export    export immédiat (409 si le classeur est ouvert dans Excel)
+# SalesClient (http.client) a l'interface de SalesJournal: l'appli Tk s'en sert
+# quand REGRAGA_SERVICE=http://poste:8765 est défini.
+
+import asyncio
+import http.client
+import json
+import math
+import pathlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, quote, urlsplit
+
+import pandas as pd
+
+try:
+    from .cache import load_sheets
+    from .catalogue import ProductCatalogue
+    from .io_excel import resolve_sheets
+    from .journal import SalesJournal, json_default, journal_path_for
+    from .recettes import cout_portion
+    from .stock import StockLedger
+    from .watcher import WorkbookConflict, excel_lock_file, sheet_crcs
+    from .writer import atomic_write
+    from .xlsx import sheet_names
+    from .xlsx_patch import append_rows
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from cache import load_sheets
+    from catalogue import ProductCatalogue
+    from io_excel import resolve_sheets
+    from journal import SalesJournal, json_default, journal_path_for
+    from recettes import cout_portion
+    from stock import StockLedger
+    from watcher import WorkbookConflict, excel_lock_file, sheet_crcs
+    from writer import atomic_write
+    from xlsx import sheet_names
+    from xlsx_patch import append_rows
+
+PORT = 8765
+EXPORT_SEC = 30          # export du journal vers tbl_Ventes
+MAX_LOT = 1000           # ventes au plus par transaction
+MAX_CORPS = 1 << 20      # taille maximale d'une requête (octets)
+MAX_QTE = 10_000
+
+CLES_PRODUIT = ("produit", "Produit", "Cde_Prdt", "code")
+CLES_QTE = ("qte", "Qté Vendue", "quantité")
+CLES_DATE = ("date", "Date")
+
+
+def sale_line(item, qte, cout_portion=None, date=None):
+    """Ligne de tbl_Ventes d'une vente (item: ProductCatalogue.get); coût recette prioritaire sur le CMP saisi."""
+    cmp_par = item["cmp"]
+    code = item["code"]
+    if cout_portion is not None and code in cout_portion.index:
+        cmp_par = float(cout_portion[code])
+    date = pd.Timestamp.now() if date is None else pd.Timestamp(date)
+    return {
+        "Date": date.strftime("%Y-%m-%d %H:%M:%S"),
+        "Produit": item["nom"],
+        "Cde_Prdt": code,
+        "Qté Vendue": qte,
+        "Prix Menu": item["prix"],
+        "CA ligne": qte * item["prix"],
+        "CMP_par_portion": cmp_par,
+        "Coût matière ligne": qte * cmp_par,
+    }
+
+
+def _first(d, keys):
+    for k in keys:
+        if d.get(k) not in (None, ""):
+            return d[k]
+    return None
+
+
+def validate(payload, catalogue, couts=None):
+    """
+    Lignes de vente depuis le corps d'une requête (dict ou liste de dicts).
+    Tout ou rien: retourne (lignes, []) ou ([], erreurs).
+    """
+    items = payload if isinstance(payload, list) else [payload]
+    lignes, erreurs = [], []
+    for k, v in enumerate(items):
+        if not isinstance(v, dict):
+            erreurs.append({"ligne": k, "erreur": "objet JSON attendu"})
+            continue
+        produit = _first(v, CLES_PRODUIT)
+        item = catalogue.get(produit) if produit is not None else None
+        if item is None:
+            erreurs.append({"ligne": k, "erreur": f"produit inconnu dans tbl_Produits: {produit}"})
+            continue
+        try:
+            qte = float(_first(v, CLES_QTE))
+        except (TypeError, ValueError):
+            qte = math.nan
+        if not (0 < qte <= MAX_QTE):
+            erreurs.append({"ligne": k, "erreur": f"quantité invalide: {_first(v, CLES_QTE)}"})
+            continue
+        date = _first(v, CLES_DATE)
+        if date is not None:
+            try:
+                date = pd.Timestamp(date)
+            except (TypeError, ValueError):
+                erreurs.append({"ligne": k, "erreur": f"date invalide: {date}"})
+                continue
+            if pd.isna(date):
+                date = None
+        lignes.append(sale_line(item, qte, couts, date))
+    return ([], erreurs) if erreurs else (lignes, [])
+
+
+def load_catalogue(path):
+    """Catalogue produits et coût portion (recettes x CMP rejoué) d'un classeur, via le cache colonne."""
+    sheets = resolve_sheets(sheet_names(path))
+    if "produits" not in sheets:
+        raise ValueError(f"{path}: onglet tbl_Produits introuvable")
+    wanted = [sheets[k] for k in ("produits", "recettes", "stock", "achats", "sorties") if k in sheets]
+    tables = load_sheets(path, wanted)
+    get = lambda key: tables.get(sheets[key]) if key in sheets else None
+    couts = pd.Series(dtype=float)
+    if get("recettes") is not None:
+        try:
+            prices = None
+            if get("stock") is not None:
+                prices = StockLedger.from_workbook(get("stock"), get("achats"), get("sorties")).cmp()
+            couts = cout_portion(get("recettes"), get("stock"), prices)
+        except ValueError:
+            pass  # recettes absentes ou cycliques: CMP saisi dans tbl_Produits
+    return ProductCatalogue(get("produits")), couts, [sheets[k] for k in ("produits", "recettes") if k in sheets]
+
+
+class SalesService:
+    """
+    Service de saisie multi-caisses.
+      run()                     -> sert jusqu'à interruption (python -m src service)
+      start() / stop()          -> même chose dans un thread (tests de charge, appli)
+      export()                  -> replie le journal dans tbl_Ventes (appelé toutes les export_sec s)
+    stats: compteurs de ventes, lots (taille moyenne = ventes / lots) et exports.
+    """
+
+    def __init__(self, excel_path, host="127.0.0.1", port=PORT, export_sec=EXPORT_SEC, max_lot=MAX_LOT):
+        self.excel_path = pathlib.Path(excel_path)
+        self.host, self.port = host, port
+        self.export_sec = export_sec
+        self.max_lot = max_lot
+        self.sheet_ventes = resolve_sheets(sheet_names(self.excel_path)).get("ventes", "tbl_Ventes")
+        self.catalogue, self.couts, self._sheets_catalogue = load_catalogue(self.excel_path)
+        self._crcs = sheet_crcs(self.excel_path, self._sheets_catalogue)
+        self.journal = SalesJournal(journal_path_for(self.excel_path), self.excel_path)
+        # un thread pour les transactions, un pour les exports: une vente n'attend jamais une écriture du classeur
+        self._db = ThreadPoolExecutor(1, thread_name_prefix="regraga-journal")
+        self._xl = ThreadPoolExecutor(1, thread_name_prefix="regraga-export")
+        self.stats = {"ventes": 0, "lots": 0, "refusées": 0, "exports": 0, "exportées": 0,
+                      "dernier export": None, "dernière erreur": None, "démarré": time.time()}
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    # ---- cycle de vie ----
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._stopping = asyncio.Event()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]  # port 0: choisi par le système
+        tasks = [asyncio.ensure_future(self._committer())]
+        if self.export_sec > 0:
+            tasks.append(asyncio.ensure_future(self._exporter()))
+        self._ready.set()
+        try:
+            async with server:
+                await self._stopping.wait()
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # dernier export; en cas d'échec les ventes restent au journal
+            try:
+                await self.export()
+            except Exception as e:
+                self.stats["dernière erreur"] = str(e)
+            self._db.shutdown()
+            self._xl.shutdown()
+            self.journal.close()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    def start(self, timeout=30):
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.serve()), name="regraga-service", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            raise RuntimeError("le service n'a pas démarré")
+        return self
+
+    def stop(self, timeout=None):
+        """Arrête le service lancé par start() (dernier export compris)."""
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # ---- validation groupée ----
+    async def _committer(self):
+        """Une transaction par tour: tout ce qui est arrivé pendant la précédente part ensemble."""
+        while True:
+            lot = [await self._queue.get()]
+            n = len(lot[0][0])
+            while n < self.max_lot and not self._queue.empty():
+                lot.append(self._queue.get_nowait())
+                n += len(lot[-1][0])
+            lignes = [l for ls, _ in lot for l in ls]
+            try:
+                ids = await self._loop.run_in_executor(self._db, self.journal.append_many, lignes)
+            except Exception as e:
+                for _, fut in lot:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.stats["ventes"] += len(lignes)
+            self.stats["lots"] += 1
+            k = 0
+            for ls, fut in lot:
+                if not fut.done():
+                    fut.set_result(ids[k:k + len(ls)])
+                k += len(ls)
+
+    async def submit(self, lignes):
+        fut = self._loop.create_future()
+        await self._queue.put((lignes, fut))
+        return await fut
+
+    # ---- export ----
+    async def _exporter(self):
+        while True:
+            await asyncio.sleep(self.export_sec)
+            try:
+                await self.export()
+            except WorkbookConflict as e:
+                self.stats["dernière erreur"] = str(e)  # réessayé au tour suivant
+            except Exception as e:
+                self.stats["dernière erreur"] = f"export: {e}"
+
+    async def export(self):
+        return await asyncio.get_running_loop().run_in_executor(self._xl, self._export)
+
+    def _fold(self, pending):
+        atomic_write(self.excel_path, lambda tmp: append_rows(self.excel_path, tmp, self.sheet_ventes,
+                                                             pending.to_dict("records")),
+                     self.journal.seal)
+
+    def _export(self):
+        lock = excel_lock_file(self.excel_path)
+        if lock is not None:
+            raise WorkbookConflict(f"classeur ouvert dans Excel ({lock.name}): ventes gardées en attente")
+        n = self.journal.compact(self._fold)
+        if n:
+            self.stats["exports"] += 1
+            self.stats["exportées"] += n
+            self.stats["dernier export"] = time.time()
+        # prix / recettes modifiés dans Excel: catalogue reconstruit (seuls ces onglets sont comparés)
+        crcs = sheet_crcs(self.excel_path, self._sheets_catalogue)
+        if crcs != self._crcs:
+            self.catalogue, self.couts, self._sheets_catalogue = load_catalogue(self.excel_path)
+            self._crcs = crcs
+        return n
+
+    # ---- HTTP ----
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                size = int(headers.get("content-length") or 0)
+                if size > MAX_CORPS:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"erreur": "requête trop grande"}, False)
+                    break
+                body = await reader.readexactly(size) if size else b""
+                try:
+                    status, payload = await self._route(method, target, body)
+                except WorkbookConflict as e:
+                    status, payload = HTTPStatus.CONFLICT, {"erreur": str(e)}
+                except Exception as e:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"erreur": str(e)}
+                keep = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep)
+                if not keep:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass  # client parti ou requête illisible
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep):
+        data = json.dumps(payload, ensure_ascii=False, default=json_default).encode("utf-8")
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", "Content-Type: application/json; charset=utf-8",
+                f"Content-Length: {len(data)}"]
+        if not keep:
+            head.append("Connection: close")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def _route(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == "/ventes" and method == "POST":
+            try:
+                payload = json.loads(body or b"null")
+            except ValueError:
+                return HTTPStatus.BAD_REQUEST, {"erreur": "JSON invalide"}
+            lignes, erreurs = validate(payload, self.catalogue, self.couts)
+            if erreurs or not lignes:
+                self.stats["refusées"] += 1
+                return HTTPStatus.UNPROCESSABLE_ENTITY, {"erreurs": erreurs or [{"erreur": "aucune vente"}]}
+            ids = await self.submit(lignes)
+            return HTTPStatus.CREATED, {"ids": ids, "lignes": lignes}
+        if url.path == "/ventes" and method == "GET":
+            pending = await self._loop.run_in_executor(self._db, self.journal.pending)
+            return HTTPStatus.OK, {"lignes": [l for _, l in pending]}
+        if url.path == "/produits" and method == "GET":
+            q = parse_qs(url.query).get("q", [""])[0]
+            return HTTPStatus.OK, {"produits": self.catalogue.search(q, limit=0 if not q else 50)}
+        if url.path == "/etat" and method == "GET":
+            attente = await self._loop.run_in_executor(self._db, len, self.journal)
+            return HTTPStatus.OK, dict(self.stats, **{"en attente": attente, "file": self._queue.qsize()})
+        if url.path == "/export" and method == "POST":
+            return HTTPStatus.OK, {"exportées": await self.export()}
+        return HTTPStatus.NOT_FOUND, {"erreur": f"{method} {url.path}: route inconnue"}
+
+
+class ServiceError(RuntimeError):
+    """Réponse d'erreur du service (vente refusée, route inconnue, ...)."""
+
+
+class SalesClient:
+    """
+    Client du service, interchangeable avec SalesJournal pour l'appli Tk:
+    append / append_many, pending_frame, len(), compact (export demandé au service), close.
+    Une connexion HTTP persistante, reprise une fois si le service l'a fermée.
+    """
+
+    def __init__(self, url, timeout=10):
+        u = urlsplit(url if "://" in url else f"http://{url}")
+        self.host, self.port = u.hostname, u.port or PORT
+        self.timeout = timeout
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _request(self, method, path, payload=None):
+        body = None if payload is None else json.dumps(payload, default=json_default, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        with self._lock:
+            for attempt in (0, 1):
+                if self._conn is None:
+                    self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                try:
+                    self._conn.request(method, path, body=body, headers=headers)
+                    resp = self._conn.getresponse()
+                    data = json.loads(resp.read() or b"{}")
+                    break
+                except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                    # connexion persistante fermée côté service: une seule reprise
+                    self._conn.close()
+                    self._conn = None
+                    if attempt:
+                        raise
+        if resp.status == HTTPStatus.CONFLICT:
+            raise WorkbookConflict(data.get("erreur"))
+        if resp.status >= 400:
+            erreurs = data.get("erreurs") or [{"erreur": data.get("erreur")}]
+            raise ServiceError("; ".join(str(e.get("erreur")) for e in erreurs))
+        return data
+
+    def append(self, ligne):
+        return self._request("POST", "/ventes", ligne)["ids"][0]
+
+    def append_many(self, lignes):
+        return self._request("POST", "/ventes", list(lignes))["ids"]
+
+    def pending_frame(self):
+        lignes = self._request("GET", "/ventes")["lignes"]
+        return pd.DataFrame.from_records(lignes) if lignes else pd.DataFrame()
+
+    def __len__(self):
+        return self._request("GET", "/etat")["en attente"]
+
+    def products(self, q=""):
+        return self._request("GET", "/produits" + (f"?q={quote(q)}" if q else ""))["produits"]
+
+    def status(self):
+        return self._request("GET", "/etat")
+
+    def compact(self, fold=None):
+        """Export immédiat par le service (fold ignoré: le service écrit le classeur)."""
+        return self._request("POST", "/export")["exportées"]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# ---------- test de charge ----------
+def load_test(url, clients=4, duree=10.0, lot=1):
+    """
+    clients caisses simultanées (un thread et une connexion chacune) envoient des
+    ventes de lot ligne(s) pendant duree secondes. Retourne débit et latences.
+    """
+    produits = SalesClient(url).products()
+    if not produits:
+        raise ValueError("catalogue vide")
+    fin = time.perf_counter() + duree
+    latences, erreurs = [], []
+    verrou = threading.Lock()
+
+    def caisse(k):
+        client = SalesClient(url)
+        mes, errs, i = [], [], k
+        while time.perf_counter() < fin:
+            ventes = [{"produit": produits[(i + j) % len(produits)], "qte": 1 + (i + j) % 3} for j in range(lot)]
+            i += lot * clients
+            t0 = time.perf_counter()
+            try:
+                client.append_many(ventes)
+            except Exception as e:
+                errs.append(str(e))
+                continue
+            mes.append(time.perf_counter() - t0)
+        client.close()
+        with verrou:
+            latences.extend(mes)
+            erreurs.extend(errs)
+
+    avant = SalesClient(url).status()
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=caisse, args=(k,), name=f"caisse-{k}") for k in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ecoule = time.perf_counter() - t0
+    apres = SalesClient(url).status()
+    ventes = len(latences) * lot
+    lots = apres["lots"] - avant["lots"]
+    lat = pd.Series(latences, dtype=float) * 1000
+    return {
+        "caisses": clients,
+        "durée (s)": ecoule,
+        "ventes": ventes,
+        "ventes/s": ventes / ecoule if ecoule else 0.0,
+        "latence p50 (ms)": lat.quantile(0.5) if len(lat) else None,
+        "latence p95 (ms)": lat.quantile(0.95) if len(lat) else None,
+        "latence p99 (ms)": lat.quantile(0.99) if len(lat) else None,
+        "transactions": lots,
+        "ventes / transaction": (apres["ventes"] - avant["ventes"]) / lots if lots else None,
+        "erreurs": len(erreurs),
+        "première erreur": erreurs[0] if erreurs else None,
+    }
@@ -0,0 +1,263 @@
+# src/stock.py
+# Coût moyen pondéré (CMP) et valorisation du stock par rejeu des mouvements:
+# stock initial (tbl_Stock), entrées (tbl_Achats), sorties (tbl_Sorties).
+#  - quantités: sommes cumulées par article (NumPy)
+#  - CMP: récurrence aux seuls achats, CMP = (Q avant x CMP + q x prix) / (Q avant + q),
+#    calculée rang par rang pour tous les articles à la fois (boucle sur le n-ième
+#    achat, pas sur les lignes); les sorties gardent le CMP courant
+#  - reprise incrémentale: l'état (Q, CMP, date) sert de point de reprise, rejouer
+#    les mouvements du jour ne retraite pas l'année
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .kpis import choose_col
+    from .recettes import COLS_INGREDIENT
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from kpis import choose_col
+    from recettes import COLS_INGREDIENT
+
+COLS_QTE_ACHAT = ["Qté d'Achat", "Qté Achat", "Quantité", "qte"]
+COLS_PRIX_ACHAT = ["Prix Achat Unitaire", "Prix unitaire", "prix"]
+COLS_QTE_SORTIE = ["Qté Sortie", "Quantité", "qte"]
+COLS_DATE = ["Date", "date"]
+COLS_STOCK_DEPART = ["Stock Départ", "Stock initial"]
+COLS_CMP_DEPART = ["CMP Achat Unitaire", "CMP effectif", "CMP"]
+
+HISTORY_COLUMNS = ["article", "date", "type", "qte_mvt", "prix", "qte", "cmp", "valeur"]
+
+
+def _num(df, candidates, default=0.0):
+    col = choose_col(df, candidates)
+    if col is None:
+        return pd.Series(default, index=df.index, dtype=float)
+    return pd.to_numeric(df[col], errors="coerce")
+
+
+def _codes(df):
+    col = choose_col(df, COLS_INGREDIENT)
+    if col is None:
+        raise ValueError("colonne code ingrédient introuvable")
+    return df[col].astype("string").str.strip()
+
+
+def _dates(df):
+    col = choose_col(df, COLS_DATE)
+    if col is None:
+        return pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    return pd.to_datetime(df[col], errors="coerce")
+
+
+def mouvements_from_workbook(achats_df=None, sorties_df=None):
+    """
+    Mouvements normalisés (article, date, qte signée, prix, type) depuis tbl_Achats / tbl_Sorties.
+    Les lignes à quantité nulle (lignes vides du tableau Excel) sont ignorées; les sorties sans
+    date (tbl_Sorties n'en a pas) ont une date NaT et sont rejouées après les mouvements datés.
+    """
+    parts = []
+    if achats_df is not None and not achats_df.empty:
+        parts.append(pd.DataFrame({
+            "article": _codes(achats_df),
+            "date": _dates(achats_df),
+            "qte": _num(achats_df, COLS_QTE_ACHAT).fillna(0.0),
+            "prix": _num(achats_df, COLS_PRIX_ACHAT, np.nan),
+            "type": "achat",
+        }))
+    if sorties_df is not None and not sorties_df.empty:
+        parts.append(pd.DataFrame({
+            "article": _codes(sorties_df),
+            "date": _dates(sorties_df),
+            "qte": -_num(sorties_df, COLS_QTE_SORTIE).fillna(0.0),
+            "prix": np.nan,
+            "type": "sortie",
+        }))
+    if not parts:
+        return pd.DataFrame(columns=["article", "date", "qte", "prix", "type"])
+    mvts = pd.concat(parts, ignore_index=True)
+    return mvts[(mvts["qte"] != 0) & mvts["article"].notna()].reset_index(drop=True)
+
+
+class StockLedger:
+    """
+    État courant par article (qte, cmp, valeur) + historique de CMP, rejouable par incréments.
+      replay(mouvements)   -> applique de nouveaux mouvements à partir du point de reprise
+                              (non datés: seulement dans le premier rejeu, depuis le stock de départ)
+      as_of(date)          -> quantité, CMP et valeur par article à une date
+      checkpoint()         -> état sérialisable; StockLedger.from_checkpoint(...) pour reprendre
+    """
+
+    def __init__(self, opening=None):
+        # opening: DataFrame index article, colonnes qte, cmp
+        if opening is None:
+            opening = pd.DataFrame(columns=["qte", "cmp"], dtype=float)
+        opening = opening[["qte", "cmp"]].astype(float)
+        self.articles = pd.Index(opening.index.astype(str), name="article")
+        self._pos = {a: i for i, a in enumerate(self.articles)}
+        self.opening = opening.set_axis(self.articles)
+        self._q = opening["qte"].fillna(0.0).to_numpy(dtype=float, copy=True)
+        self._cmp = opening["cmp"].fillna(0.0).to_numpy(dtype=float, copy=True)
+        self.checkpoint_date = pd.NaT
+        self.mouvements = 0  # mouvements absorbés depuis le stock de départ
+        self._history = []  # morceaux de l'historique, dans l'ordre des rejeux
+
+    @classmethod
+    def from_workbook(cls, stock_df, achats_df=None, sorties_df=None):
+        """Stock de départ de tbl_Stock puis rejeu complet de tbl_Achats / tbl_Sorties."""
+        opening = pd.DataFrame({
+            "qte": _num(stock_df, COLS_STOCK_DEPART).fillna(0.0).to_numpy(),
+            "cmp": _num(stock_df, COLS_CMP_DEPART).fillna(0.0).to_numpy(),
+        }, index=_codes(stock_df).to_numpy())
+        opening = opening[opening.index.notna()]
+        opening = opening[~opening.index.duplicated(keep="last")]
+        ledger = cls(opening)
+        return ledger.replay(mouvements_from_workbook(achats_df, sorties_df))
+
+    # ---- rejeu ----
+    def _ensure_articles(self, codes):
+        new = [c for c in pd.unique(codes) if c not in self._pos]
+        if not new:
+            return
+        for c in new:
+            self._pos[c] = len(self._pos)
+        self.articles = self.articles.append(pd.Index(new, name="article"))
+        self._q = np.concatenate([self._q, np.zeros(len(new))])
+        self._cmp = np.concatenate([self._cmp, np.zeros(len(new))])
+
+    def replay(self, mouvements):
+        """Applique des mouvements (colonnes article, date, qte signée, prix, type) postérieurs au point de reprise."""
+        if mouvements is None or len(mouvements) == 0:
+            return self
+        m = mouvements.reset_index(drop=True)
+        dates = pd.to_datetime(m["date"], errors="coerce")
+        if pd.notna(self.checkpoint_date) and (dates < self.checkpoint_date).any():
+            raise ValueError("Mouvement antérieur au point de reprise: rejouer depuis le stock de départ")
+        if (pd.notna(self.checkpoint_date) or self.mouvements) and dates.isna().any():
+            # sortie non datée (tbl_Sorties): rien ne dit qu'elle n'est pas déjà comptée
+            raise ValueError("Mouvement non daté après un point de reprise: rejouer depuis le stock de départ")
+        codes = m["article"].astype(str).to_numpy()
+        self._ensure_articles(codes)
+        art = np.fromiter((self._pos[c] for c in codes), dtype=np.int64, count=len(codes))
+        # tri stable article, date (NaT en dernier), ordre de saisie
+        date_key = dates.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        date_key = np.where(dates.isna().to_numpy(), np.iinfo(np.int64).max, date_key)
+        order = np.lexsort((np.arange(len(m)), date_key, art))
+        art = art[order]
+        qte = m["qte"].to_numpy(dtype=float)[order]
+        prix = pd.to_numeric(m["prix"], errors="coerce").to_numpy(dtype=float)[order]
+        is_achat = (m["type"].to_numpy() == "achat")[order] & (qte > 0)
+
+        # bornes des groupes (un groupe = un article)
+        n = len(art)
+        idx = np.arange(n)
+        new_group = np.r_[True, art[1:] != art[:-1]]
+        group_start = np.maximum.accumulate(np.where(new_group, idx, 0))
+
+        # quantités: somme cumulée par article
+        cs = np.cumsum(qte)
+        q_after = self._q[art] + cs - (cs[group_start] - qte[group_start])
+        q_before = q_after - qte
+
+        # CMP aux achats: rang k de l'achat dans son article, une passe vectorisée par rang
+        pidx = np.flatnonzero(is_achat)
+        cmp_event = np.full(n, np.nan)
+        if len(pidx):
+            first = np.r_[True, art[pidx][1:] != art[pidx][:-1]]
+            rank = np.arange(len(pidx)) - np.maximum.accumulate(np.where(first, np.arange(len(pidx)), 0))
+            by_rank = np.argsort(rank, kind="stable")
+            bounds = np.searchsorted(rank[by_rank], np.arange(rank.max() + 2))
+            current = self._cmp.copy()
+            for k in range(rank.max() + 1):
+                rows = pidx[by_rank[bounds[k]:bounds[k + 1]]]
+                a = art[rows]
+                qb = np.maximum(q_before[rows], 0.0)   # stock négatif: pas de valeur résiduelle
+                q = qte[rows]
+                p = np.where(np.isnan(prix[rows]), current[a], prix[rows])
+                denom = qb + q
+                new = np.where(denom > 0, (qb * current[a] + q * p) / np.where(denom > 0, denom, 1), p)
+                current[a] = new
+                cmp_event[rows] = new
+
+        # CMP après chaque mouvement: dernier achat de l'article, sinon CMP du point de reprise
+        last = np.maximum.accumulate(np.where(is_achat, idx, -1))
+        has = last >= group_start
+        cmp_after = np.where(has, cmp_event[np.maximum(last, 0)], self._cmp[art])
+
+        # nouvel état: dernière ligne de chaque article
+        end = np.r_[new_group[1:], True]
+        self._q[art[end]] = q_after[end]
+        self._cmp[art[end]] = cmp_after[end]
+        dmax = dates.max()
+        if pd.notna(dmax):
+            self.checkpoint_date = dmax if pd.isna(self.checkpoint_date) else max(self.checkpoint_date, dmax)
+
+        self.mouvements += len(m)
+        self._history.append(pd.DataFrame({
+            "article": self.articles[art],
+            "date": dates.to_numpy()[order],
+            "type": m["type"].to_numpy()[order],
+            "qte_mvt": qte,
+            "prix": prix,
+            "qte": q_after,
+            "cmp": cmp_after,
+            "valeur": q_after * cmp_after,
+        }))
+        return self
+
+    # ---- lecture ----
+    @property
+    def history(self):
+        """Historique des CMP / quantités après chaque mouvement."""
+        if not self._history:
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+        if len(self._history) > 1:
+            self._history = [pd.concat(self._history, ignore_index=True)]
+        return self._history[0]
+
+    def state(self):
+        """État courant: qte, cmp, valeur par article."""
+        return pd.DataFrame({"qte": self._q, "cmp": self._cmp, "valeur": self._q * self._cmp},
+                            index=self.articles)
+
+    def cmp(self):
+        return pd.Series(self._cmp.copy(), index=self.articles, name="CMP")
+
+    @property
+    def nbytes(self):
+        """Mémoire occupée: état, stock de départ, index des articles et historique."""
+        return int(self._q.nbytes + self._cmp.nbytes
+                   + self.opening.memory_usage(deep=True, index=True).sum()
+                   + self.articles.memory_usage(deep=True)
+                   + sum(h.memory_usage(deep=True, index=True).sum() for h in self._history))
+
+    def as_of(self, date=None):
+        """Quantité, CMP et valeur par article à la date donnée (None = état courant, sorties non datées incluses)."""
+        if date is None:
+            return self.state()
+        date = pd.Timestamp(date)
+        h = self.history
+        h = h[h["date"].notna() & (h["date"] <= date)]
+        h = h.iloc[np.argsort(h["date"].to_numpy(), kind="stable")]
+        last = h.drop_duplicates(subset="article", keep="last").set_index("article")
+        out = self.opening.reindex(self.articles).fillna(0.0)
+        out.loc[last.index, "qte"] = last["qte"]
+        out.loc[last.index, "cmp"] = last["cmp"]
+        out["valeur"] = out["qte"] * out["cmp"]
+        return out
+
+    # ---- point de reprise ----
+    def checkpoint(self):
+        return {
+            "articles": list(self.articles),
+            "qte": self._q.tolist(),
+            "cmp": self._cmp.tolist(),
+            "date": None if pd.isna(self.checkpoint_date) else self.checkpoint_date.isoformat(),
+            "mouvements": self.mouvements,
+        }
+
+    @classmethod
+    def from_checkpoint(cls, cp):
+        ledger = cls(pd.DataFrame({"qte": cp["qte"], "cmp": cp["cmp"]}, index=cp["articles"]))
+        ledger.checkpoint_date = pd.Timestamp(cp["date"]) if cp.get("date") else pd.NaT
+        ledger.mouvements = int(cp.get("mouvements", 0))
+        return ledger
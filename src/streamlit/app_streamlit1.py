@@ -9,11 +9,23 @@ if ROOT not in sys.path:
     sys.path.append(ROOT)
 
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 
 from io_excel import read_workbook, clean_codes
-from calc import build_tableau_pilotage
+from calc import PriceScenarios, SalesCube, build_tableau_pilotage, category_frame, cube_dimensions
+from recettes import cout_portion
+from stock import StockLedger
+from memo import ByteLRU, StageRunner, content_hash
+import perf
+
+# cache partagé par toutes les sessions du serveur (LRU borné en octets)
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+@st.cache_resource
+def get_stage_cache():
+    return ByteLRU(max_bytes=CACHE_MAX_BYTES)
 
 st.set_page_config(page_title="Regraga - Pilotage", layout="wide")
 
@@ -48,15 +60,29 @@ if uploaded is None:
         st.download_button("Télécharger CSV", csv, file_name="pilotage_test.csv", mime="text/csv")
     st.stop()
 
+# étapes mémoïsées: la clé est l'empreinte du contenu chargé, un rerun
+# (clic sur un widget) ne relit ni ne recalcule rien si le fichier n'a pas changé
+runner = StageRunner(get_stage_cache())
+file_key = content_hash(uploaded)
+
+def lecture(fichier):
+    """Classeur normalisé (types compacts) + gain mémoire par table, mémoïsés ensemble."""
+    gains = {}
+    return read_workbook(fichier, report=gains), gains
+
 # try reading the uploaded file
 try:
-    data = read_workbook(uploaded)
+    data, gains_memoire = runner.run("lecture", file_key, lecture, uploaded)
 except Exception as e:
     st.error(f"Erreur lors de la lecture du fichier Excel: {e}")
     st.stop()
 
 produits = data.get("produits")
 ventes = data.get("ventes")
+recettes = data.get("recettes")
+stock = data.get("stock")
+achats = data.get("achats")
+sorties = data.get("sorties")
 
 if produits is None:
     st.error("Feuille 'tbl_Produits' introuvable ou mal nommée. Vérifie ton fichier Excel.")
@@ -65,12 +91,29 @@ if ventes is None:
     st.warning("Feuille 'tbl_Ventes' introuvable. L'analyse sera limitée.")
 
 # normaliser codes
-produits = clean_codes(produits)
-ventes = clean_codes(ventes)
+produits = runner.run("codes produits", file_key, clean_codes, produits)
+ventes = runner.run("codes ventes", file_key, clean_codes, ventes)
+
+# CMP par ingrédient: rejeu stock de départ + achats - sorties
+ledger = None
+if stock is not None:
+    try:
+        ledger = runner.run("CMP stock", file_key, StockLedger.from_workbook, stock, achats, sorties)
+    except ValueError as e:
+        st.warning(f"CMP non calculé: {e}")
+
+# coût portion depuis tbl_Recettes x CMP (remplace la saisie manuelle)
+couts = None
+if recettes is not None:
+    try:
+        prix_ingredients = ledger.cmp() if ledger is not None else None
+        couts = runner.run("coût recettes", file_key, cout_portion, recettes, stock, prix_ingredients)
+    except ValueError as e:
+        st.warning(f"Coût des recettes non calculé: {e}")
 
 # build tableau
 try:
-    table_pilotage = build_tableau_pilotage(produits, ventes)
+    table_pilotage = runner.run("tableau pilotage", file_key, build_tableau_pilotage, produits, ventes, couts)
 except Exception as e:
     st.error(f"Erreur lors du calcul du tableau de pilotage: {e}")
     st.exception(e)
@@ -79,6 +122,90 @@ except Exception as e:
 st.markdown("### Résultats")
 st.dataframe(table_pilotage)
 
+with st.expander("Performance (cache des étapes)"):
+    cache = runner.cache
+    st.dataframe(runner.report_frame())
+    st.caption(f"Cache serveur: {len(cache)} entrée(s), {cache.nbytes / 1e6:.1f} Mo / {cache.max_bytes / 1e6:.0f} Mo, "
+               f"{cache.hits} hit(s) / {cache.misses} miss(es)")
+    if gains_memoire:
+        st.caption("Mémoire des tables après normalisation (catégories, datetime64, entiers 32 bits)")
+        st.dataframe(pd.DataFrame(gains_memoire).T.round(1))
+
+with st.expander("Perf (spans)"):
+    actif = st.checkbox("Enregistrer les spans", value=perf.enabled(),
+                        help="Équivaut à REGRAGA_PERF=1; le tampon est partagé par les sessions du serveur.")
+    if actif != perf.enabled():
+        perf.enable(actif)
+    if perf.records():
+        st.dataframe(pd.DataFrame(perf.summary()))
+        st.dataframe(pd.DataFrame(perf.records()[-50:][::-1]))
+        if st.button("Vider le tampon"):
+            perf.clear()
+    else:
+        st.caption("Aucun span enregistré (activer puis relancer un calcul).")
+
+if ledger is not None:
+    with st.expander("Valorisation du stock (CMP)"):
+        valo = ledger.state()
+        if st.checkbox("Valoriser à une date passée"):
+            valo = ledger.as_of(st.date_input("À la date du"))
+        st.metric("Valeur du stock", f"{valo['valeur'].sum():,.2f}")
+        st.dataframe(valo)
+
+# simulation prix / CMP: base calculée une fois, la grille entière est réévaluée à chaque réglage
+if ventes is not None:
+    simulation = runner.run("base simulation", file_key, PriceScenarios.from_tables, produits, ventes, couts,
+                            data.get("charges"))
+    with st.expander("Simulation prix / CMP (what-if)"):
+        c1, c2, c3 = st.columns(3)
+        bornes_prix = c1.slider("Variation des prix (%)", -50, 50, (-20, 20))
+        bornes_cmp = c2.slider("Choc CMP (%)", -50, 100, (-10, 30))
+        pas = c3.select_slider("Pas (%)", [0.5, 1, 2, 5, 10], value=2)
+        c1, c2, c3 = st.columns(3)
+        familles = c1.multiselect("Familles concernées (toutes si vide)", sorted(set(simulation.familles)))
+        elasticite = c2.slider("Élasticité-prix", -3.0, 0.0, 0.0, 0.1,
+                               help="Volume = volume historique x (prix / prix actuel) ^ élasticité")
+        mesure = c3.selectbox("Mesure", ["Résultat", "Marge", "Food cost %", "CA", "Marge de sécurité %"])
+        grille = simulation.grid(np.arange(bornes_prix[0], bornes_prix[1] + pas / 2, pas),
+                                 np.arange(bornes_cmp[0], bornes_cmp[1] + pas / 2, pas),
+                                 familles=familles, elasticite=elasticite)
+        t = grille.totals()
+        carte = t.pivot(index="Δ prix %", columns="Δ CMP %", values=mesure).sort_index(ascending=False)
+        echelle = "RdYlGn_r" if mesure == "Food cost %" else "RdYlGn"
+        fig = px.imshow(carte, aspect="auto", color_continuous_scale=echelle,
+                        labels={"x": "Δ CMP %", "y": "Δ prix %", "color": mesure},
+                        title=f"{mesure} mensuel, {len(grille)} scénario(s)")
+        st.plotly_chart(fig, use_container_width=True)
+        actuel = t[(t["Δ prix %"] == 0) & (t["Δ CMP %"] == 0)]
+        charges = simulation.charges.sum()
+        st.caption(f"Volumes: moyenne mensuelle de tbl_Ventes; charges fixes {charges:,.0f} / mois (tbl_Charges_Fixes)"
+                   + ("" if actuel.empty else f"; point mort actuel {actuel['CA point mort'].iloc[0]:,.0f} de CA / mois"))
+        c1, c2 = st.columns(2)
+        dp = c1.select_slider("Détail: Δ prix %", list(carte.index[::-1]), value=carte.index[::-1][len(carte) // 2])
+        dc = c2.select_slider("Détail: Δ CMP %", list(carte.columns), value=carte.columns[0])
+        s_idx = int(np.flatnonzero((t["Δ prix %"] == dp) & (t["Δ CMP %"] == dc))[0])
+        st.dataframe(t.iloc[[s_idx]])
+        st.dataframe(grille.familles(s_idx))
+        st.dataframe(grille.produits(s_idx))
+
+# cube jour / semaine / mois x produit: les comparaisons ne relisent pas tbl_Ventes
+if ventes is not None:
+    dims = cube_dimensions(data.get("produits"), category_frame(data))
+    cube = runner.run("cube ventes", file_key, SalesCube.from_frame, data["ventes"], dims)
+    with st.expander("Comparaison de périodes"):
+        c1, c2, c3, c4 = st.columns(4)
+        grain = c1.selectbox("Grain", ["mois", "semaine", "jour"])
+        by = c2.selectbox("Par", ["catégorie", "famille", "produit"])
+        periodes = list(cube.frame(grain, None)["période"])
+        if len(periodes) >= 1:
+            a = c3.selectbox("Période", periodes[::-1])
+            b = c4.selectbox("Contre", periodes[::-1], index=min(1, len(periodes) - 1))
+            comparaison = cube.compare(grain, a, b, by=by)
+            st.dataframe(comparaison)
+            fig = px.bar(comparaison, x=by, y=list(comparaison.columns[1:3]), barmode="group", title=f"CA {a} / {b} par {by}")
+            st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"Cube: {len(cube)} cellule(s), {cube.nbytes / 1e3:.1f} Ko")
+
 # graphique simple
 if not table_pilotage.empty:
     fig = px.bar(table_pilotage, x="code", y="qte", title="Quantités vendues par produit")
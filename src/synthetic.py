@@ -0,0 +1,210 @@
+# src/synthetic.py
+# Générateur de classeurs synthétiques fidèles à la structure du classeur réel
+# (mêmes onglets, mêmes colonnes, tableaux Excel nommés), pour les mesures de
+# performance: tbl_Ventes de 10k à plusieurs millions de lignes, cardinalités
+# produits / recettes / ingrédients proches du réel, résultat reproductible (seed).
+
+import datetime as dt
+import warnings
+
+import numpy as np
+
+# (préfixe code, famille, onglet catégorie, nb produits, prix menu min-max)
+FAMILLES = [
+    ("PDJ", "Petits déjeuners", "tbl_PtDj&Sup", 11, (45, 90)),
+    ("SUP", "Suppléments", "tbl_PtDj&Sup", 10, (5, 20)),
+    ("OME", "Œufs & Omelettes", "tbl_PtDj&Sup", 7, (25, 50)),
+    ("ENT", "Entrées & Salades", "tbl_Taj&Pla", 16, (35, 80)),
+    ("TAJ", "Tajines & Coin marocain", "tbl_Taj&Pla", 25, (80, 220)),
+    ("VIA", "Boucherie", "tbl_Taj&Pla", 22, (110, 260)),
+    ("POI", "Poissons & Fruits de mer", "tbl_Taj&Pla", 15, (90, 240)),
+    ("PUL", "Poulet", "tbl_Taj&Pla", 14, (70, 140)),
+    ("SNK", "Snack", "tbl_Snk&Ita", 23, (35, 75)),
+    ("PAT", "Pâtes", "tbl_Snk&Ita", 12, (55, 110)),
+    ("PIZ", "Pizzas", "tbl_Snk&Ita", 9, (50, 100)),
+    ("OND", "à la carte", "tbl_Snk&Ita", 3, (30, 60)),
+    ("CRP", "Crêpes & Gaufres", "tbl_GaufCre&Dsrt", 20, (25, 55)),
+    ("DES", "Glaces & Desserts", "tbl_GaufCre&Dsrt", 16, (25, 60)),
+    ("BCH", "Boissons chaudes", "tbl_BoissonJus", 33, (10, 30)),
+    ("JUS", "Jus Frais", "tbl_BoissonJus", 11, (18, 35)),
+    ("SmC", "Smoothies & Coctails", "tbl_BoissonJus", 14, (30, 50)),
+    ("MKS", "Milkshakes", "tbl_BoissonJus", 8, (30, 45)),
+    ("BFR", "Boissons froides", "tbl_BoissonJus", 6, (10, 25)),
+]
+
+# (préfixe code, nb ingrédients, unité, CMP unitaire min-max)
+INGREDIENTS = [
+    ("LEG", 30, "g", (0.005, 0.04)), ("PRL", 26, "Pièce", (1.0, 4.0)), ("CDM", 21, "g", (0.02, 0.2)),
+    ("BOU", 19, "Pièce", (1.0, 6.0)), ("SOS", 19, "ml", (0.01, 0.08)), ("FRU", 18, "g", (0.01, 0.06)),
+    ("PSU", 18, "g", (0.02, 0.15)), ("BOI", 14, "ml", (0.005, 0.05)), ("AGN", 11, "g", (0.09, 0.16)),
+    ("VEA", 11, "g", (0.08, 0.2)), ("POI", 10, "g", (0.06, 0.25)), ("EPI", 10, "g", (0.05, 0.4)),
+    ("VOL", 9, "g", (0.04, 0.08)), ("DES", 9, "Pièce", (2.0, 12.0)), ("FEC", 7, "g", (0.005, 0.03)),
+    ("PST", 6, "g", (0.01, 0.03)), ("PRP", 6, "Pièce", (0.5, 3.0)), ("FDM", 5, "g", (0.1, 0.4)),
+    ("CHA", 5, "g", (0.08, 0.2)), ("VSP", 1, "Pièce", (5.0, 10.0)), ("GLA", 1, "ml", (0.05, 0.1)),
+]
+
+QTE_PAR_UNITE = {"g": (10, 300), "ml": (20, 300), "Pièce": (1, 3)}
+
+SHEETS = ["Dashboard", "tbl_Ventes", "tbl_Charges_Fixes", "tbl_Produits", "tbl_Recettes", "tbl_Stock",
+          "tbl_Achats", "tbl_Sorties", "Référentiels", "tbl_PtDj&Sup", "tbl_Taj&Pla", "tbl_Snk&Ita",
+          "tbl_GaufCre&Dsrt", "tbl_BoissonJus"]
+
+COLS_VENTES = ["Date", "Mois", "Produit", "Cde_Prdt", "Qté Vendue", "Prix Menu", "CA ligne", "CMP_par_portion",
+               "Coût matière ligne", "Marge ligne", "% contribution %", "Famille"]
+COLS_PRODUITS = ["Cde_Prdt", "Produit", "Famille", "Coût Moyen Portion", "Prix Menu", "Marge Brute",
+                 "% Contribution", "Scoring", "Food cost % "]
+COLS_RECETTES = ["Produit", "Cde_Prdt", "Cde_Ingrdt", "Ingrédient", "Quantité", "Unité", "Coût Ingrd/prod "]
+COLS_CATEGORIE = ["Produit", "Cde_Prdt", "Cde_Ingrdt", "Ingrédient", "Quantité", "Unité"]
+COLS_STOCK = ["Cde_Ingrdt", "Ingrédient", "Unité", "CMP Achat Unitaire", "Stock Départ", "Valeur stock initiale",
+              "Achats Cumulées", " Valeur Achat", "Stock cuisine", "Valeur Stock Global", "Quantité totale",
+              "CMP effectif", " Sortie cumulée", "Stock Courant", "Seuil critique", "Alerte"]
+COLS_ACHATS = ["Date", "Réf Achat / N° BL", "Fournisseur", "Cde_Ingrdt", "Nom Ingrédient", "Qté d'Achat",
+               "Unité d'Achat", "Prix Achat Unitaire", "Valeur Ligne"]
+COLS_SORTIES = ["Code ingrédient ", "Nom ingredient ", "Qté Sortie", "Unité"]
+COLS_CHARGES = ["ID_Charge", "Colonne1", "Libellé", "Famille affectée", "Montant_Mensuel", "Fréquence",
+                "Type d’affectation"]
+
+
+def _catalogue(rng):
+    """Produits, ingrédients et recettes (matrice produit x ingrédient creuse, ~3,7 ingrédients par produit)."""
+    produits = []
+    for prefix, famille, onglet, n, (pmin, pmax) in FAMILLES:
+        for k in range(1, n + 1):
+            produits.append({"code": f"{prefix}{k:03d}", "nom": f"{famille} n°{k}", "famille": famille,
+                             "onglet": onglet, "prix": float(rng.integers(pmin, pmax + 1))})
+    ingredients = []
+    for prefix, n, unite, (cmin, cmax) in INGREDIENTS:
+        for k in range(1, n + 1):
+            ingredients.append({"code": f"{prefix}{k:03d}", "nom": f"Ingrédient {prefix} {k}", "unite": unite,
+                                "cmp": round(float(rng.uniform(cmin, cmax)), 4)})
+    recettes = []
+    for p in produits:
+        n = int(min(12, 1 + rng.poisson(2.7)))
+        cout = 0.0
+        for i in rng.choice(len(ingredients), size=n, replace=False):
+            ing = ingredients[i]
+            qmin, qmax = QTE_PAR_UNITE[ing["unite"]]
+            q = float(rng.integers(qmin, qmax + 1))
+            recettes.append({"produit": p, "ing": ing, "qte": q})
+            cout += q * ing["cmp"]
+        p["cout"] = round(cout, 4)
+    return produits, ingredients, recettes
+
+
+def _table(ws, name, columns, nrows):
+    """Tableau Excel nommé sur A1:<col><nrows+1> (noms sans '&', comme dans le classeur réel)."""
+    from openpyxl.utils import get_column_letter
+    from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
+
+    if nrows == 0:
+        return
+    t = Table(displayName=name.replace("&", ""), ref=f"A1:{get_column_letter(len(columns))}{nrows + 1}")
+    # en écriture seule, openpyxl ne lit pas l'en-tête: colonnes déclarées à la main
+    t.tableColumns = [TableColumn(id=i + 1, name=c) for i, c in enumerate(columns)]
+    t.tableStyleInfo = TableStyleInfo(name="TableStyleMedium2", showRowStripes=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # avertissement systématique du mode écriture seule
+        ws.add_table(t)
+
+
+def _sheet(wb, name, columns, rows, table=True):
+    ws = wb.create_sheet(name)
+    if table:
+        _table(ws, name, columns, len(rows))
+    ws.append(columns)
+    for r in rows:
+        ws.append(r)
+    return ws
+
+
+def generate_workbook(path, n_ventes=10_000, seed=0, start=dt.date(2025, 1, 1), days=365,
+                      n_achats=600, n_sorties=500):
+    """
+    Écrit un classeur synthétique (openpyxl en écriture seule, mémoire constante) et
+    retourne son chemin. Même seed et mêmes paramètres -> mêmes données.
+    """
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(seed)
+    produits, ingredients, recettes = _catalogue(rng)
+    wb = Workbook(write_only=True)
+
+    # ventes: popularité des produits en loi de Zipf, dates uniformes sur la période
+    poids = 1.0 / np.arange(1, len(produits) + 1)
+    poids = rng.permutation(poids / poids.sum())
+    idx = rng.choice(len(produits), size=n_ventes, p=poids)
+    jours = np.sort(rng.integers(0, days, size=n_ventes))
+    qtes = rng.integers(1, 6, size=n_ventes)
+    dates = [start + dt.timedelta(days=int(j)) for j in range(days)]
+    dates = [dt.datetime(d.year, d.month, d.day) for d in dates]
+    mois = [d.strftime("%Y-%m") for d in dates]
+
+    def ventes():
+        for i, j, q in zip(idx.tolist(), jours.tolist(), qtes.tolist()):
+            p = produits[i]
+            ca = q * p["prix"]
+            cm = q * p["cout"]
+            yield [dates[j], mois[j], p["nom"], p["code"], q, p["prix"], ca, p["cout"], cm, ca - cm,
+                   None, p["famille"]]
+
+    ws = wb.create_sheet("Dashboard")
+    ws.append([None, "Date début", "Date fin"])
+    ws.append([None, dates[0], dates[-1]])
+    ws = wb.create_sheet("tbl_Ventes")
+    _table(ws, "tbl_Ventes", COLS_VENTES, n_ventes)
+    ws.append(COLS_VENTES)
+    for r in ventes():
+        ws.append(r)
+
+    charges = [[f"CHA{k:03d}", "Divers", f"Charge {k}", "Globale" if k % 3 else FAMILLES[k % len(FAMILLES)][1],
+                float(rng.integers(500, 20000)), "Mensuelle", "Globale" if k % 3 else "Spécifique"]
+               for k in range(1, 45)]
+    _sheet(wb, "tbl_Charges_Fixes", COLS_CHARGES, charges)
+
+    lignes = []
+    for p in produits:
+        marge = p["prix"] - p["cout"]
+        lignes.append([p["code"], p["nom"], p["famille"], p["cout"], p["prix"], marge, None, None,
+                       p["cout"] / p["prix"] * 100 if p["prix"] else None])
+    _sheet(wb, "tbl_Produits", COLS_PRODUITS, lignes)
+
+    rec = [[r["produit"]["nom"], r["produit"]["code"], r["ing"]["code"], r["ing"]["nom"], r["qte"],
+            r["ing"]["unite"], r["qte"] * r["ing"]["cmp"]] for r in recettes]
+    _sheet(wb, "tbl_Recettes", COLS_RECETTES, rec)
+
+    stock = []
+    for ing in ingredients:
+        depart = float(rng.integers(0, 5000))
+        stock.append([ing["code"], ing["nom"], ing["unite"], ing["cmp"], depart, depart * ing["cmp"], 0, 0, 0,
+                      depart * ing["cmp"], depart, ing["cmp"], 0, depart, float(rng.integers(0, 1000)), "OK"])
+    _sheet(wb, "tbl_Stock", COLS_STOCK, stock)
+
+    achats = []
+    for k in range(n_achats):
+        ing = ingredients[int(rng.integers(len(ingredients)))]
+        q = float(rng.integers(1, 50)) * (100 if ing["unite"] != "Pièce" else 1)
+        prix = round(ing["cmp"] * float(rng.uniform(0.85, 1.15)), 4)
+        achats.append([dates[int(rng.integers(days))], f"BL{k + 1:05d}", f"Fournisseur {k % 12 + 1}", ing["code"],
+                       ing["nom"], q, ing["unite"], prix, q * prix])
+    achats.sort(key=lambda r: r[0])
+    _sheet(wb, "tbl_Achats", COLS_ACHATS, achats)
+
+    sorties = []
+    for _ in range(n_sorties):
+        ing = ingredients[int(rng.integers(len(ingredients)))]
+        sorties.append([ing["code"], ing["nom"], float(rng.integers(1, 20)) * (50 if ing["unite"] != "Pièce" else 1),
+                        ing["unite"]])
+    _sheet(wb, "tbl_Sorties", COLS_SORTIES, sorties)
+
+    ref = [[p["code"][:3], p["code"], None, None, None, None, p["code"], p["nom"], p["famille"], p["prix"], p["cout"]]
+           for p in produits]
+    _sheet(wb, "Référentiels", ["Racine_Prdts", "Séries", None, "Racine_Ingrdts", "Séries", None, "Cde_Prdt",
+                                 "Produit", "Famille", "Prix Menu", "Coût Matière"], ref, table=False)
+
+    for onglet in SHEETS[9:]:
+        sub = [[r["produit"]["nom"], r["produit"]["code"], r["ing"]["code"], r["ing"]["nom"], r["qte"],
+                r["ing"]["unite"]] for r in recettes if r["produit"]["onglet"] == onglet]
+        _sheet(wb, onglet, COLS_CATEGORIE, sub)
+
+    wb.save(path)
+    return path
@@ -0,0 +1,223 @@
+# src/watcher.py
+# Surveillance du classeur modifié hors de l'appli (Excel, synchro OneDrive).
+# Scrutation taille + mtime (os.stat: portable, sans dépendance; inotify ne
+# verrait pas les remplacements faits par OneDrive sous Windows), puis diff des
+# CRC des parties XML des onglets suivis (annuaire du zip, sans décompression):
+# seuls les onglets modifiés sont relus et comparés ligne à ligne à la version
+# connue -> delta (ajoutées, retirées) appliqué aux KPI / cube sans tout recharger.
+# Conflits: classeur ouvert dans Excel (fichier verrou ~$) ou onglet changé
+# depuis la version chargée -> WorkbookConflict plutôt qu'un écrasement.
+
+import contextlib
+import pathlib
+import queue
+import threading
+import zipfile
+
+import pandas as pd
+
+try:
+    from .cache import fingerprint, load_sheets
+    from .xlsx import open_zip, part_crcs, sheet_parts
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from cache import fingerprint, load_sheets
+    from xlsx import open_zip, part_crcs, sheet_parts
+
+
+class WorkbookConflict(RuntimeError):
+    """Écriture refusée: le classeur est ouvert dans Excel ou a changé depuis la version connue."""
+
+
+def excel_lock_file(path):
+    """Fichier verrou d'Excel (~$Classeur.xlsx) si le classeur est ouvert, sinon None."""
+    p = pathlib.Path(path)
+    # Excel préfixe le nom par ~$ (en remplaçant les 2 premiers caractères pour les noms longs)
+    for name in ("~$" + p.name, "~$" + p.name[2:]):
+        lock = p.with_name(name)
+        if lock.exists():
+            return lock
+    return None
+
+
+def sheet_crcs(path, sheets=None):
+    """{onglet: (crc32, taille)} des parties XML des onglets (annuaire central du zip)."""
+    with open_zip(str(path)) as zf:
+        parts = sheet_parts(zf)
+        crcs = part_crcs(zf)
+    names = parts if sheets is None else [s for s in sheets if s in parts]
+    return {s: crcs.get(parts[s]) for s in names}
+
+
+def check_unchanged(path, base, sheets=None):
+    """
+    Lève WorkbookConflict si le classeur est ouvert dans Excel ou si un onglet de
+    sheets (défaut: tous ceux de base) a changé depuis base ({onglet: crc}).
+    """
+    lock = excel_lock_file(path)
+    if lock is not None:
+        raise WorkbookConflict(f"classeur ouvert dans Excel ({lock.name}): enregistrer et fermer avant d'écrire")
+    sheets = list(base) if sheets is None else sheets
+    now = sheet_crcs(path, sheets)
+    changed = [s for s in sheets if now.get(s) != base.get(s)]
+    if changed:
+        raise WorkbookConflict(f"classeur modifié hors de l'appli depuis le chargement: {', '.join(changed)}")
+
+
+def _row_hashes(df, cols):
+    """Empreinte par ligne, indépendante des types de stockage (catégories, int32 / float64, unités de date)."""
+    data = {}
+    for i, c in enumerate(cols):
+        s = df[c]
+        if s.dtype.kind in "iufb":
+            s = s.astype("float64")
+        elif s.dtype.kind == "M":
+            s = s.astype("datetime64[ns]")
+        else:
+            s = s.astype(object)
+        data[i] = s.to_numpy()
+    return pd.util.hash_pandas_object(pd.DataFrame(data), index=False).to_numpy()
+
+
+def row_delta(old, new):
+    """
+    Lignes ajoutées / retirées entre deux versions d'un onglet, comparées comme
+    multiensembles (l'ordre ne compte pas; une ligne modifiée = retirée + ajoutée).
+    Retourne (ajoutées, retirées), sous-ensembles de new et old.
+    """
+    if old is None or old.empty:
+        return new, new.iloc[:0]
+    if new is None or new.empty:
+        return old.iloc[:0], old
+    cols = [c for c in new.columns if c in old.columns]
+    if not cols:
+        return new, old
+    ho, hn = _row_hashes(old, cols), _row_hashes(new, cols)
+    # k-ième occurrence d'une même ligne: deux lignes identiques restent distinctes
+    ko = pd.Series(ho).groupby(ho).cumcount().to_numpy()
+    kn = pd.Series(hn).groupby(hn).cumcount().to_numpy()
+    key_o = pd.MultiIndex.from_arrays([ho, ko])
+    key_n = pd.MultiIndex.from_arrays([hn, kn])
+    return new[~key_n.isin(key_o)], old[~key_o.isin(key_n)]
+
+
+class WorkbookWatcher:
+    """
+    Thread de scrutation du classeur.
+      start() / stop()
+      poll()      -> événements ("modifié" | "erreur", infos) depuis le dernier appel
+      check()     -> une scrutation immédiate (appelée par le thread toutes les interval s)
+      writing()   -> contexte des écritures de l'appli: refus si Excel a le classeur ouvert,
+                     changements externes publiés avant l'écriture, nouvelle version
+                     enregistrée comme connue après (pas d'événement pour ses propres écritures)
+      rebase()    -> version actuelle = version connue (après un rechargement complet)
+    "modifié": {"feuilles": [...], "tables": {onglet: DataFrame}, "deltas": {onglet: (ajoutées, retirées)},
+                "verrou": fichier verrou Excel ou None}
+    loader(chemin, onglets) -> {onglet: DataFrame} (défaut: cache colonne).
+    """
+
+    def __init__(self, path, sheets, interval=1.0, loader=None, tables=None):
+        self.path = pathlib.Path(path)
+        self.sheets = list(sheets)
+        self.interval = interval
+        self.loader = loader or load_sheets
+        self.events = queue.Queue()
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.tables = {}
+        self.rebase(tables)
+
+    # ---- cycle de vie ----
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="regraga-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def poll(self):
+        out = []
+        while True:
+            try:
+                out.append(self.events.get_nowait())
+            except queue.Empty:
+                return out
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:  # le thread ne doit pas mourir sur un fichier illisible
+                self.events.put(("erreur", {"erreur": e}))
+
+    # ---- version connue ----
+    def _current(self):
+        fp = fingerprint(self.path)
+        return fp, (sheet_crcs(self.path, self.sheets) if fp is not None else {})
+
+    def rebase(self, tables=None):
+        """Version actuelle du fichier = version connue; tables: onglets déjà chargés par l'appelant."""
+        with self._lock:
+            old = getattr(self, "crcs", {})
+            self.fingerprint, self.crcs = self._current()
+            self._seen = self.fingerprint
+            if tables is not None:
+                self.tables = {s: tables[s] for s in self.sheets if s in tables}
+                stale = [s for s in self.sheets if s not in self.tables and s in self.crcs]
+            else:
+                # après une écriture de l'appli: onglets réécrits relus (sans événement)
+                stale = [s for s in self.sheets if s in self.crcs and (s not in self.tables or self.crcs[s] != old.get(s))]
+            if stale:
+                self.tables.update(self.loader(self.path, stale))
+
+    # ---- scrutation ----
+    def check(self, wait_stable=True):
+        """
+        Compare le fichier à la version connue; publie et retourne l'événement "modifié"
+        (None si rien n'a changé). wait_stable: un fichier encore en cours d'écriture
+        (taille / mtime différents de la scrutation précédente) est revu au tour suivant.
+        """
+        with self._lock:
+            fp = fingerprint(self.path)
+            if fp is None or fp == self.fingerprint:
+                self._seen = fp
+                return None
+            if wait_stable and fp != self._seen:
+                self._seen = fp
+                return None
+            try:
+                crcs = sheet_crcs(self.path, self.sheets)
+            except (zipfile.BadZipFile, RuntimeError, OSError):
+                return None  # écriture partielle (synchro en cours): réessayer au tour suivant
+            changed = [s for s in self.sheets if crcs.get(s) != self.crcs.get(s)]
+            tables = self.loader(self.path, changed) if changed else {}
+            deltas = {}
+            for s in changed:
+                new = tables.get(s, pd.DataFrame())
+                deltas[s] = row_delta(self.tables.get(s), new)
+                self.tables[s] = new
+            self.fingerprint, self.crcs, self._seen = fp, crcs, fp
+            if not changed:
+                return None  # autres onglets (Dashboard, ...): rien à relire
+            event = ("modifié", {"feuilles": changed, "tables": tables, "deltas": deltas,
+                                 "verrou": excel_lock_file(self.path)})
+            self.events.put(event)
+            return event
+
+    @contextlib.contextmanager
+    def writing(self, refuse_if_open=True):
+        with self._lock:
+            if refuse_if_open:
+                lock = excel_lock_file(self.path)
+                if lock is not None:
+                    raise WorkbookConflict(f"classeur ouvert dans Excel ({lock.name}): ventes gardées en attente")
+            # modifications externes pas encore vues: publiées avant d'être absorbées par l'écriture
+            self.check(wait_stable=False)
+            yield self
+            self.rebase()
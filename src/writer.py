@@ -0,0 +1,136 @@
+# src/writer.py
+# Écriture différée (write-behind) du classeur: un seul thread écrivain reçoit
+# les demandes par une file, regroupe les rafales en une seule écriture et
+# publie l'avancement dans une file d'événements que l'interface relève avec
+# after() (Tk n'est pas thread-safe: le thread écrivain ne touche pas aux widgets).
+# Les écritures passent par atomic_write: fichier temporaire dans le même
+# dossier, fsync, os.replace -> jamais de classeur tronqué après une coupure.
+
+import os
+import pathlib
+import queue
+import tempfile
+import threading
+import time
+
+
+def fsync_dir(path):
+    """Rend le renommage durable (POSIX); sans objet sous Windows."""
+    if os.name != "posix":
+        return
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(target, write, before_replace=None):
+    """
+    write(chemin_temporaire) produit le nouveau contenu; le fichier est synchronisé
+    sur disque puis substitue la cible en une opération. En cas d'erreur la cible
+    est intacte et le temporaire supprimé.
+    before_replace(chemin_temporaire): appelé une fois le temporaire complet et
+    synchronisé, juste avant le remplacement (ex. SalesJournal.seal).
+    """
+    target = pathlib.Path(target)
+    # même dossier que la cible: os.replace reste un renommage (pas de copie entre volumes)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.stem}-", suffix=f".tmp{target.suffix}")
+    os.close(fd)
+    try:
+        write(tmp)
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        if before_replace is not None:
+            before_replace(tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    fsync_dir(target.parent)
+    return target
+
+
+_STOP = object()
+
+
+class WriteBehind:
+    """
+    Thread écrivain unique.
+      submit(instantané)  -> demande d'écriture (non bloquant); dans une rafale seul le dernier compte
+      poll()              -> événements ("début" | "ok" | "erreur", infos) depuis le dernier appel
+      flush(timeout)      -> attend que toutes les demandes soient traitées
+      close()             -> termine l'écriture en cours puis arrête le thread
+    write(instantané) s'exécute dans le thread écrivain; l'instantané ne doit plus
+    être modifié par l'appelant (DataFrame copié, ou None si write relit sa source).
+    """
+
+    def __init__(self, write, delay=0.3, name="regraga-writer"):
+        self._write = write
+        self.delay = delay
+        self._requests = queue.Queue()
+        self.events = queue.Queue()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, snapshot=None):
+        with self._cond:
+            self._pending += 1
+        self._requests.put(snapshot)
+
+    def poll(self):
+        out = []
+        while True:
+            try:
+                out.append(self.events.get_nowait())
+            except queue.Empty:
+                return out
+
+    @property
+    def busy(self):
+        with self._cond:
+            return self._pending > 0
+
+    def flush(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=None):
+        self._requests.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._requests.get()
+            if item is _STOP:
+                return
+            # laisser arriver la rafale (clics répétés, ventes en série) puis tout regrouper
+            time.sleep(self.delay)
+            n, stop = 1, False
+            while True:
+                try:
+                    nxt = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stop = True
+                    break
+                item, n = nxt, n + 1
+            self.events.put(("début", {"demandes": n}))
+            t0 = time.perf_counter()
+            try:
+                result = self._write(item)
+            except Exception as e:
+                self.events.put(("erreur", {"demandes": n, "erreur": e, "durée (s)": time.perf_counter() - t0}))
+            else:
+                self.events.put(("ok", {"demandes": n, "résultat": result, "durée (s)": time.perf_counter() - t0}))
+            with self._cond:
+                self._pending -= n
+                self._cond.notify_all()
+            if stop:
+                return
@@ -0,0 +1,348 @@
+# src/xlsx.py
+# Accès bas niveau au classeur .xlsx (archive zip) sans passer par openpyxl:
+# noms des onglets, parties XML correspondantes, CRC des parties (lus dans
+# l'annuaire central du zip, sans décompression) et table des chaînes partagées.
+
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+
+def open_zip(path_or_file):
+    """ZipFile sur un chemin ou un file-like (ex. fichier chargé dans Streamlit)."""
+    if isinstance(path_or_file, zipfile.ZipFile):
+        return path_or_file
+    if hasattr(path_or_file, "seek"):
+        path_or_file.seek(0)
+    try:
+        return zipfile.ZipFile(path_or_file)
+    except zipfile.BadZipFile as e:
+        raise RuntimeError(f"Fichier .xlsx invalide: {e}")
+
+
+def _rels(zf, part):
+    """Relations d'une partie: {rId: chemin cible absolu dans l'archive}."""
+    folder, name = posixpath.split(part)
+    rels_path = posixpath.join(folder, "_rels", name + ".rels")
+    if rels_path not in zf.namelist():
+        return {}
+    root = ET.fromstring(zf.read(rels_path))
+    out = {}
+    for rel in root.iter(f"{{{NS_PKG_REL}}}Relationship"):
+        target = rel.get("Target")
+        if target.startswith("/"):
+            target = target.lstrip("/")
+        else:
+            target = posixpath.normpath(posixpath.join(folder, target))
+        out[rel.get("Id")] = target
+    return out
+
+
+def workbook_part(zf):
+    """Chemin de xl/workbook.xml (résolu via _rels/.rels)."""
+    for target in _rels(zf, "").values():
+        if target.endswith("workbook.xml"):
+            return target
+    return "xl/workbook.xml"
+
+
+def sheet_parts(zf):
+    """Dict ordonné {nom d'onglet: partie XML de la feuille} lu dans workbook.xml."""
+    wb = workbook_part(zf)
+    rels = _rels(zf, wb)
+    root = ET.fromstring(zf.read(wb))
+    out = {}
+    sheets = root.find(f"{{{NS_MAIN}}}sheets")
+    for s in (sheets if sheets is not None else []):
+        target = rels.get(s.get(f"{{{NS_REL}}}id"))
+        if target:
+            out[s.get("name")] = target
+    return out
+
+
+def sheet_names(path_or_file):
+    """Noms des onglets sans charger le classeur."""
+    zf = open_zip(path_or_file)
+    try:
+        return list(sheet_parts(zf))
+    finally:
+        if zf is not path_or_file:
+            zf.close()
+
+
+def shared_strings_part(zf):
+    for target in _rels(zf, workbook_part(zf)).values():
+        if target.endswith("sharedStrings.xml"):
+            return target
+    return None
+
+
+def part_crcs(zf):
+    """{partie: (crc32, taille décompressée)} d'après l'annuaire central du zip."""
+    return {i.filename: (i.CRC, i.file_size) for i in zf.infolist()}
+
+
+def read_shared_strings(zf):
+    """Liste des chaînes partagées (texte riche aplati, comme openpyxl)."""
+    part = shared_strings_part(zf)
+    if part is None:
+        return []
+    from openpyxl.reader.strings import read_string_table
+    with zf.open(part) as src:
+        return list(read_string_table(src))
+
+
+# ---------------------------------------------------------------------------
+# Lecture en flux des onglets
+# ---------------------------------------------------------------------------
+# On ne parse que les parties XML des onglets demandés (iterparse, une ligne à
+# la fois) et on ne garde que les colonnes retenues. La conversion des cellules
+# reproduit openpyxl (read_only, data_only) + pandas (_convert_cell), et
+# l'inférence des types est confiée au TextParser de pandas, comme read_excel:
+# le résultat est identique à pd.read_excel pour les onglets lus.
+
+_ROW = f"{{{NS_MAIN}}}row"
+_CELL = f"{{{NS_MAIN}}}c"
+_VALUE = f"{{{NS_MAIN}}}v"
+_INLINE = f"{{{NS_MAIN}}}is"
+_SHEET_DATA = f"{{{NS_MAIN}}}sheetData"
+
+_COL_CACHE = {}
+
+
+def col_index(ref):
+    """'AB12' -> 28 (index de colonne 1-based)."""
+    letters = ref.rstrip("0123456789")
+    n = _COL_CACHE.get(letters)
+    if n is None:
+        n = 0
+        for ch in letters:
+            n = n * 26 + ord(ch) - 64
+        _COL_CACHE[letters] = n
+    return n
+
+
+def _styles_part(zf):
+    for target in _rels(zf, workbook_part(zf)).values():
+        if target.endswith("styles.xml"):
+            return target
+    return None
+
+
+def date_styles(zf):
+    """Index des styles de cellule (cellXfs) au format date / durée, comme openpyxl."""
+    from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+    part = _styles_part(zf)
+    dates, durations = set(), set()
+    if part is None:
+        return dates, durations
+    root = ET.fromstring(zf.read(part))
+    custom = {}
+    numfmts = root.find(f"{{{NS_MAIN}}}numFmts")
+    for nf in (numfmts if numfmts is not None else []):
+        custom[int(nf.get("numFmtId"))] = nf.get("formatCode")
+    xfs = root.find(f"{{{NS_MAIN}}}cellXfs")
+    for idx, xf in enumerate(xfs if xfs is not None else []):
+        fmt_id = int(xf.get("numFmtId", 0))
+        fmt = custom[fmt_id] if fmt_id in custom else builtin_format_code(fmt_id)
+        if is_date_format(fmt):
+            dates.add(idx)
+        if is_timedelta_format(fmt):
+            durations.add(idx)
+    return dates, durations
+
+
+def workbook_epoch(zf):
+    from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+    root = ET.fromstring(zf.read(workbook_part(zf)))
+    pr = root.find(f"{{{NS_MAIN}}}workbookPr")
+    if pr is not None and pr.get("date1904") in ("1", "true"):
+        return CALENDAR_MAC_1904
+    return CALENDAR_WINDOWS_1900
+
+
+def iter_rows(zf, part, strings, dates=frozenset(), durations=frozenset(), epoch=None):
+    """
+    Parcourt une feuille ligne par ligne: (n° de ligne 1-based, [(col 1-based, valeur)]).
+    Les cellules vides (sans valeur) sont omises; les erreurs (#REF!, ...) valent NaN.
+    """
+    from openpyxl.cell.text import Text
+    from openpyxl.utils.datetime import from_excel, from_ISO8601
+    nan = float("nan")
+    with zf.open(part) as src:
+        sheet_data = None
+        row_counter = 0
+        for event, elem in ET.iterparse(src, events=("start", "end")):
+            if event == "start":
+                if elem.tag == _SHEET_DATA:
+                    sheet_data = elem
+                continue
+            if elem.tag != _ROW:
+                continue
+            r = elem.get("r")
+            row_counter = int(r) if r else row_counter + 1
+            col = 0
+            cells = []
+            for c in elem:
+                if c.tag != _CELL:
+                    continue
+                ref = c.get("r")
+                col = col_index(ref) if ref else col + 1
+                t = c.get("t", "n")
+                if t == "inlineStr":
+                    child = c.find(_INLINE)
+                    if child is None:
+                        continue
+                    cells.append((col, Text.from_tree(child).content))
+                    continue
+                value = c.findtext(_VALUE) or None
+                if value is None:
+                    continue
+                if t == "n":
+                    value = float(value) if ("." in value or "E" in value or "e" in value) else int(value)
+                    style = int(c.get("s") or 0)
+                    if style in dates:
+                        try:
+                            value = from_excel(value, epoch, timedelta=style in durations)
+                        except (OverflowError, ValueError):
+                            value = nan
+                    elif isinstance(value, float) and value.is_integer():
+                        value = int(value)
+                elif t == "s":
+                    value = strings[int(value)]
+                elif t == "b":
+                    value = bool(int(value))
+                elif t == "e":
+                    value = nan
+                elif t == "d":
+                    value = from_ISO8601(value)
+                cells.append((col, value))
+            # libérer la ligne traitée: mémoire constante quelle que soit la taille de la feuille
+            if sheet_data is not None:
+                sheet_data.clear()
+            else:
+                elem.clear()
+            yield row_counter, cells
+
+
+def _column_names(header, width):
+    """Noms de colonnes tels que read_excel les produit ('Unnamed: i', doublons 'X.1')."""
+    from pandas.io.parsers import TextParser
+    row = list(header) + [""] * (width - len(header))
+    return list(TextParser([row], header=0, skip_blank_lines=False).read().columns)
+
+
+def _resolve_usecols(usecols, header):
+    """usecols (noms et/ou index 0-based) -> liste d'index triés."""
+    names = _column_names(header, len(header))
+    out = set()
+    for u in usecols:
+        if isinstance(u, int):
+            out.add(u)
+        elif u in names:
+            out.add(names.index(u))
+        elif isinstance(u, str) and u.startswith("Unnamed: ") and u[9:].isdigit():
+            out.add(int(u[9:]))
+        else:
+            raise ValueError(f"Colonne introuvable: {u!r}")
+    return sorted(out)
+
+
+def read_sheet(zf, part, strings, dates, durations, epoch, usecols=None, first_row=0, nrows=None):
+    """Lit une feuille: en-tête sur la 1re ligne, lignes de données [first_row, first_row + nrows)."""
+    import pandas as pd
+    from pandas.io.parsers import TextParser
+
+    header = None
+    selected = None
+    rows = []          # lignes de données retenues (colonnes retenues uniquement)
+    last_with_data = -1
+    width = 0          # largeur max (toutes colonnes) après retrait des cellules vides finales
+    n_data = 0         # lignes de données vues (y compris vides)
+    expected = 1
+
+    def take(cells):
+        if selected is None:
+            line = [""] * (cells[-1][0] if cells else 0)
+            for col, v in cells:
+                line[col - 1] = v
+            return line
+        line = [""] * len(selected)
+        for col, v in cells:
+            j = selected.get(col - 1)
+            if j is not None:
+                line[j] = v
+        return line
+
+    def push(cells):
+        nonlocal header, selected, last_with_data, width, n_data
+        cells = [(c, v) for c, v in cells if not (isinstance(v, str) and v == "")]
+        if cells:
+            width = max(width, cells[-1][0])
+        if header is None:
+            header = take(cells)  # en-tête complet (selected pas encore fixé)
+            if usecols is not None:
+                selected = {i: j for j, i in enumerate(_resolve_usecols(usecols, header))}
+            return True
+        idx = n_data
+        n_data += 1
+        if idx < first_row:
+            return True
+        if nrows is not None and len(rows) >= nrows:
+            return False
+        rows.append(take(cells))
+        if cells:
+            last_with_data = len(rows) - 1
+        return True
+
+    for r, cells in iter_rows(zf, part, strings, dates, durations, epoch):
+        cont = True
+        while expected < r and cont:   # lignes absentes du XML = lignes vides
+            cont = push([])
+            expected += 1
+        if not cont or not push(cells):
+            break
+        expected = r + 1
+
+    if header is None or (width == 0 and last_with_data < 0):
+        return pd.DataFrame()
+    del rows[last_with_data + 1:]
+    names = _column_names(header, width)
+    if selected is not None:
+        keep = sorted(selected, key=selected.get)
+        names = [names[i] if i < len(names) else f"Unnamed: {i}" for i in keep]
+    else:
+        rows = [line + [""] * (width - len(line)) for line in rows]
+    if not rows:
+        return pd.DataFrame(columns=names, dtype=object)
+    return TextParser(rows, names=names, header=None, skip_blank_lines=False).read()
+
+
+def read_sheets(path_or_file, sheets, usecols=None, first_row=0, nrows=None):
+    """
+    Lecture sélective: {onglet: DataFrame} pour les seuls onglets demandés.
+    usecols: liste de colonnes (noms ou index 0-based), ou dict {onglet: liste}.
+    first_row / nrows: plage de lignes de données (après l'en-tête).
+    La mémoire crête suit les colonnes retenues, pas le classeur entier.
+    """
+    zf = open_zip(path_or_file)
+    try:
+        parts = sheet_parts(zf)
+        missing = [s for s in sheets if s not in parts]
+        if missing:
+            raise ValueError(f"Onglet(s) introuvable(s): {missing}")
+        strings = read_shared_strings(zf)
+        dates, durations = date_styles(zf)
+        epoch = workbook_epoch(zf)
+        out = {}
+        for s in sheets:
+            cols = usecols.get(s) if isinstance(usecols, dict) else usecols
+            out[s] = read_sheet(zf, parts[s], strings, dates, durations, epoch, cols, first_row, nrows)
+        return out
+    finally:
+        if zf is not path_or_file:
+            zf.close()
@@ -0,0 +1,478 @@
+# src/xlsx_patch.py
+# Écriture chirurgicale du classeur: seules les parties XML modifiées sont
+# réécrites (lignes ajoutées à un onglet, plage de sa table); toutes les autres
+# parties sont recopiées octet pour octet, compressées, sans décompression.
+# Les formules du Dashboard, les objets tables, styles.xml et calcChain.xml
+# restent donc tels qu'Excel les a écrits.
+# ZIP64 non géré (parties et classeur < 4 Go).
+
+import datetime as dt
+import math
+import numbers
+import re
+import struct
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, unescape
+
+try:
+    from .xlsx import NS_MAIN, _rels, col_index, date_styles, iter_rows, read_shared_strings, sheet_parts, \
+        workbook_epoch, workbook_part
+except ImportError:  # exécution depuis src/streamlit (src dans sys.path)
+    from xlsx import NS_MAIN, _rels, col_index, date_styles, iter_rows, read_shared_strings, sheet_parts, \
+        workbook_epoch, workbook_part
+
+# ---------------------------------------------------------------------------
+# Archive: copie brute des parties inchangées
+# ---------------------------------------------------------------------------
+_LOCAL = struct.Struct("<4s2B4HL2L2H")
+_CENTRAL = struct.Struct("<4s4B4HL2L5H2L")
+_END = struct.Struct("<4s4H2LH")
+_ZIP64 = 0xFFFFFFFF
+_CHUNK = 1 << 20
+
+
+def _dos_time(date_time):
+    y, mo, d, h, mi, s = date_time
+    return (h << 11) | (mi << 5) | (s // 2), ((y - 1980) << 9) | (mo << 5) | d
+
+
+def _name_bytes(name):
+    try:
+        return name.encode("ascii"), 0
+    except UnicodeEncodeError:
+        return name.encode("utf-8"), 0x800
+
+
+def _copy_raw(fsrc, info, out):
+    """Recopie les données compressées d'une entrée (en-tête local relu pour sa longueur réelle)."""
+    fsrc.seek(info.header_offset)
+    head = fsrc.read(_LOCAL.size)
+    if head[:4] != b"PK\x03\x04":
+        raise zipfile.BadZipFile(f"en-tête local invalide: {info.filename}")
+    n, m = struct.unpack("<2H", head[26:30])
+    fsrc.seek(info.header_offset + _LOCAL.size + n + m)
+    left = info.compress_size
+    while left:
+        buf = fsrc.read(min(_CHUNK, left))
+        if not buf:
+            raise zipfile.BadZipFile(f"données tronquées: {info.filename}")
+        out.write(buf)
+        left -= len(buf)
+
+
+def rewrite_zip(src, dst, replace, level=6):
+    """
+    Copie l'archive src vers dst en remplaçant les parties de replace {partie: octets}.
+    Les autres parties gardent leurs octets compressés, CRC et tailles (annuaire
+    central); l'ordre des entrées est conservé. Retourne les parties réécrites.
+    """
+    with open(src, "rb") as fsrc, zipfile.ZipFile(fsrc) as zf, open(dst, "wb") as out:
+        infos = zf.infolist()
+        missing = set(replace) - {i.filename for i in infos}
+        if missing:
+            raise KeyError(f"parties absentes du classeur: {sorted(missing)}")
+        central = []
+        for info in infos:
+            if info.flag_bits & 0x1:
+                raise ValueError(f"{info.filename}: partie chiffrée")
+            if max(info.file_size, info.compress_size, info.header_offset) >= _ZIP64:
+                raise ValueError(f"{info.filename}: archive ZIP64 non gérée")
+            name, utf8 = _name_bytes(info.filename)
+            # bit 3: tailles dans un descripteur après les données -> on les écrit dans l'en-tête local
+            flags = (info.flag_bits & ~0x808) | utf8
+            tm, dd = _dos_time(info.date_time)
+            offset = out.tell()
+            if info.filename in replace:
+                data = replace[info.filename]
+                comp = zlib.compressobj(level, zlib.DEFLATED, -15)
+                payload = comp.compress(data) + comp.flush()
+                crc, size, csize = zlib.crc32(data), len(data), len(payload)
+                method, version = zipfile.ZIP_DEFLATED, 20
+                flags &= ~0x6  # options du deflate d'origine (rapide / maximal) sans objet ici
+                if max(size, csize) >= _ZIP64:
+                    raise ValueError(f"{info.filename}: partie trop volumineuse (ZIP64 non géré)")
+                out.write(_LOCAL.pack(b"PK\x03\x04", version, 0, flags, method, tm, dd, crc, csize, size, len(name), 0))
+                out.write(name)
+                out.write(payload)
+            else:
+                crc, size, csize = info.CRC, info.file_size, info.compress_size
+                method, version = info.compress_type, info.extract_version
+                out.write(_LOCAL.pack(b"PK\x03\x04", version, 0, flags, method, tm, dd, crc, csize, size, len(name), 0))
+                out.write(name)
+                _copy_raw(fsrc, info, out)
+            central.append(_CENTRAL.pack(b"PK\x01\x02", info.create_version, info.create_system, version, 0, flags,
+                                         method, tm, dd, crc, csize, size, len(name), 0, len(info.comment), 0,
+                                         info.internal_attr, info.external_attr, offset) + name + info.comment)
+        cd_offset = out.tell()
+        for entry in central:
+            out.write(entry)
+        if cd_offset >= _ZIP64 or len(central) > 0xFFFF:
+            raise ValueError("archive ZIP64 non gérée")
+        out.write(_END.pack(b"PK\x05\x06", 0, 0, len(central), len(central), out.tell() - cd_offset, cd_offset,
+                            len(zf.comment)) + zf.comment)
+    return sorted(replace)
+
+
+# ---------------------------------------------------------------------------
+# Feuilles: lignes et cellules manipulées en texte (pas de DOM de 5000 lignes)
+# ---------------------------------------------------------------------------
+_ROW_RE = re.compile(r"<row\b([^>]*?)(?:/>|>(.*?)</row>)", re.S)
+_CELL_RE = re.compile(r"<c\b([^>]*?)(?:/>|>(.*?)</c>)", re.S)
+_ATTR_RE = re.compile(r'([\w:]+)="([^"]*)"')
+_F_RE = re.compile(r"<f\b[^>]*?(?:/>|>.*?</f>)", re.S)
+_F_PARTS_RE = re.compile(r"<f\b([^>]*?)(?:/>|>(.*?)</f>)", re.S)
+# cellule maître d'une formule partagée: t="shared" + ref (les autres n'ont que si)
+_SHARED_MASTER_RE = re.compile(r'<f\b([^>]*?\bt="shared"[^>]*?)(?<!/)>(.*?)</f>', re.S)
+_XML_ENTITIES = {"&quot;": '"', "&apos;": "'"}
+_ROW_NUM_RE = re.compile(r'\br="(\d+)"')
+# saisie: cellule sans formule dont la valeur n'est ni vide ni 0 (texte en ligne non vide)
+_INPUT_RE = re.compile(r'<c\b[^>]*[^/]><(?:v>(?!0</v>)[^<]|is>.*?<t\b[^>]*>[^<])', re.S)
+_REF_ATTR_RE = re.compile(r'\b(ref|sqref)="([^"]*)"')
+_RANGE_RE = re.compile(r"^([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
+_CALCPR_RE = re.compile(r"<calcPr\b([^>]*?)(/?)>")
+_BAD_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_MISSING = object()
+
+
+def _letters(col):
+    from openpyxl.utils import get_column_letter
+    return get_column_letter(col)
+
+
+def _attrs(text):
+    return dict(_ATTR_RE.findall(text or ""))
+
+
+def _attr_text(attrs):
+    return "".join(f' {k}="{v}"' for k, v in attrs.items())
+
+
+def _cells(body):
+    """[(colonne, attributs, formule XML ou None, contenu)] d'une ligne."""
+    out, col = [], 0
+    for m in _CELL_RE.finditer(body or ""):
+        attrs = _attrs(m.group(1))
+        col = col_index(attrs["r"]) if "r" in attrs else col + 1
+        f = _F_RE.search(m.group(2) or "")
+        formula = f.group(0) if f else None
+        out.append((col, attrs, formula, m.group(2) or ""))
+    return out
+
+
+def _shared_masters(xml):
+    """{si: (colonne, ligne, texte)} des formules partagées de la feuille (cellules maîtres)."""
+    out = {}
+    for m in _SHARED_MASTER_RE.finditer(xml):
+        attrs = _attrs(m.group(1))
+        if "ref" not in attrs or "si" not in attrs:
+            continue
+        start = xml.rfind("<c ", 0, m.start())
+        ref = _attrs(xml[start:xml.index(">", start)]).get("r") if start >= 0 else None
+        rng = _split_range(ref) if ref else None
+        if rng:
+            out[attrs["si"]] = (rng[0], rng[1], m.group(2))
+    return out
+
+
+def _relocate(formula, col, row, src_row, masters, memo):
+    """
+    Formule de la cellule (col, src_row) recopiée en ligne row: références relatives
+    décalées (A1; les références structurées [#This Row] sont inchangées). Une formule
+    partagée est reconstruite depuis sa cellule maître; maître introuvable ou formule
+    illisible -> ValueError (l'appelant garde les lignes en attente plutôt que de les
+    écrire sans formules). Formule ordinaire illisible: recopiée telle quelle.
+    memo: une analyse par formule du modèle pour toutes les lignes créées.
+    """
+    key = (col, formula)
+    done = memo.get(key)
+    if done is None:
+        done = memo[key] = _relocation(formula, col, row, src_row, masters)
+    if done[0] == "fixe":
+        return done[1]
+    _, translator, attrs = done
+    return f"<f{attrs}>{escape(translator.translate_formula(f'{_letters(col)}{row}')[1:])}</f>"
+
+
+def _relocation(formula, col, row, src_row, masters):
+    """("fixe", XML) si la formule ne dépend pas de la ligne, sinon ("décalée", Translator, attributs)."""
+    from openpyxl.formula.translate import Translator
+    m = _F_PARTS_RE.match(formula)
+    attrs, text = _attrs(m.group(1)), m.group(2)
+    kind = attrs.pop("t", "normal")
+    if kind == "shared":
+        si = attrs.pop("si", None)
+        attrs.pop("ref", None)
+        if si not in masters:
+            raise ValueError(f"formule partagée si={si}: cellule maître introuvable, formule non recopiable")
+        mcol, mrow, text = masters[si]
+        origin = f"{_letters(mcol)}{mrow}"
+    elif kind != "normal" or not text:
+        return "fixe", formula  # formule matricielle / table de données: recopiée telle quelle
+    else:
+        origin = f"{_letters(col)}{src_row}"
+    try:
+        translator = Translator("=" + unescape(text, _XML_ENTITIES), origin=origin)
+        here, below = (translator.translate_formula(f"{_letters(col)}{r}") for r in (row, row + 1))
+    except Exception as e:
+        if kind != "shared":
+            return "fixe", formula  # syntaxe hors tokenizer (sauts de ligne, ...): recopiée telle quelle
+        raise ValueError(f"formule partagée {origin} non recopiable en {_letters(col)}{row}: {e}") from e
+    attrs = _attr_text(attrs)
+    if here == below:
+        return "fixe", f"<f{attrs}>{escape(here[1:])}</f>"
+    return "décalée", translator, attrs
+
+
+def _is_blank(body):
+    """Ligne sans saisie: cellules vides, à zéro ou formules (lignes pré-remplies du modèle)."""
+    return not body or _INPUT_RE.search(body) is None
+
+
+def _number(value):
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _cell_xml(col, row, style, formula, value, date, epoch):
+    """
+    Cellule écrite: valeur saisie (nombre, texte en ligne, date en numéro de série)
+    ou, sous une formule, valeur en cache de la formule (recalculée par Excel).
+    """
+    from openpyxl.utils.datetime import to_excel
+    head = f'<c r="{_letters(col)}{row}"' + (f' s="{style}"' if style else "")
+    f = formula or ""
+    try:
+        if value is not _MISSING and value is not None and (value != value or value in (math.inf, -math.inf)):
+            value = None  # NaN, NaT, infini: cellule laissée vide
+    except (TypeError, ValueError):
+        pass
+    if value is _MISSING or value is None:
+        return f"{head}>{f}</c>" if f else f"{head}/>"
+    if date and isinstance(value, str):
+        try:
+            value = dt.datetime.fromisoformat(value.strip())
+        except ValueError:
+            pass
+    if isinstance(value, (bool,)) or type(value).__name__ == "bool_":
+        return f'{head} t="b">{f}<v>{int(bool(value))}</v></c>'
+    if isinstance(value, (dt.datetime, dt.date, dt.time)):
+        return f"{head}>{f}<v>{_number(to_excel(value, epoch))}</v></c>"
+    if isinstance(value, numbers.Number):
+        return f"{head}>{f}<v>{_number(value)}</v></c>"
+    text = escape(_BAD_XML.sub("", str(value)))
+    if f:
+        return f'{head} t="str">{f}<v>{text}</v></c>'
+    return f'{head} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _build_row(row, row_attrs, template, values, dates, epoch, relocate=None):
+    """
+    Ligne row sur le modèle template (styles, formules), valeurs {colonne: valeur}.
+    relocate=(ligne du modèle, maîtres des formules partagées, memo): modèle pris sur
+    une autre ligne, formules décalées (cf. _relocate); sinon recopiées telles quelles.
+    """
+    attrs = dict(row_attrs)
+    attrs["r"] = str(row)
+    parts, seen = [], set()
+    for col, cattrs, formula, _ in template:
+        seen.add(col)
+        if formula and relocate is not None:
+            formula = _relocate(formula, col, row, *relocate)
+        style = cattrs.get("s")
+        parts.append((col, _cell_xml(col, row, style, formula, values.get(col, _MISSING),
+                                     style is not None and int(style) in dates, epoch)))
+    for col, value in values.items():
+        if col not in seen:
+            parts.append((col, _cell_xml(col, row, None, None, value, False, epoch)))
+    parts.sort(key=lambda p: p[0])
+    return f"<row{_attr_text(attrs)}>" + "".join(x for _, x in parts) + "</row>"
+
+
+def _split_range(ref):
+    m = _RANGE_RE.match(ref.replace("$", ""))
+    if not m:
+        return None
+    c1, r1, c2, r2 = m.groups()
+    return col_index(c1), int(r1), col_index(c2 or c1), int(r2 or r1)
+
+
+def _extend_refs(xml, bottom, new_bottom, attrs=("ref", "sqref")):
+    """Prolonge jusqu'à new_bottom les plages (ref / sqref) qui s'arrêtent à la ligne bottom."""
+    def repl(m):
+        if m.group(1) not in attrs:
+            return m.group(0)
+        out = []
+        for ref in m.group(2).split(" "):
+            rng = _split_range(ref)
+            if rng and rng[3] == bottom and rng[1] < bottom:
+                ref = f"{_letters(rng[0])}{rng[1]}:{_letters(rng[2])}{new_bottom}"
+            out.append(ref)
+        return f'{m.group(1)}="{" ".join(out)}"'
+    return _REF_ATTR_RE.sub(repl, xml)
+
+
+def _table_of(zf, sheet_part):
+    """(partie, XML, plage, {nom de colonne: index}, lignes de totaux) de la première table de la feuille."""
+    for target in _rels(zf, sheet_part).values():
+        if "/tables/" not in target:
+            continue
+        xml = zf.read(target).decode("utf-8")
+        root = ET.fromstring(xml)
+        c1, r1, c2, r2 = _split_range(root.get("ref"))
+        cols = [tc.get("name") for tc in root.iter(f"{{{NS_MAIN}}}tableColumn")]
+        header = int(root.get("headerRowCount", "1"))
+        return {"partie": target, "xml": xml, "plage": (c1, r1 + header, c2, r2),
+                "colonnes": {name: c1 + i for i, name in enumerate(cols)},
+                "totaux": int(root.get("totalsRowCount", "0"))}
+    return None
+
+
+def _header_of(zf, part):
+    """Colonnes d'un onglet sans table: première ligne de la feuille."""
+    for _, cells in iter_rows(zf, part, read_shared_strings(zf)):
+        return {str(v): c for c, v in cells if v is not None}
+    return {}
+
+
+def _column_map(names, header):
+    """{nom demandé: colonne} (correspondance exacte, puis sans espaces de bord)."""
+    loose = {str(k).strip(): v for k, v in header.items()}
+    out, unknown = {}, []
+    for name in names:
+        col = header.get(name, loose.get(str(name).strip()))
+        if col is None:
+            unknown.append(name)
+        else:
+            out[name] = col
+    return out, unknown
+
+
+def _set_full_calc(xml):
+    """calcPr fullCalcOnLoad="1": Excel recalcule les formules des lignes ajoutées à l'ouverture."""
+    m = _CALCPR_RE.search(xml)
+    if m is None or "fullCalcOnLoad=" in m.group(1):
+        return None
+    return xml[:m.start()] + f'<calcPr{m.group(1)} fullCalcOnLoad="1"{m.group(2)}>' + xml[m.end():]
+
+
+def append_rows(src, dst, sheet, rows, recalc=True):
+    """
+    Écrit rows (dicts {nom de colonne: valeur}) à la fin de l'onglet sheet de src, dans dst.
+    Si l'onglet porte une table: les lignes pré-remplies sans saisie qui suivent la
+    dernière ligne saisie sont remplies d'abord (styles et formules conservés), le
+    reste est ajouté sous la table dont la plage (ref, autoFilter) est prolongée.
+    Seules la feuille, sa table si elle grandit et workbook.xml (recalcul à
+    l'ouverture, une seule fois) sont réécrites. Retourne un rapport (dict).
+    """
+    rows = list(rows)
+    if str(src) == str(dst):
+        raise ValueError("append_rows: src et dst doivent différer (écrire dans un temporaire)")
+    with zipfile.ZipFile(src) as zf:
+        parts = sheet_parts(zf)
+        if sheet not in parts:
+            raise KeyError(f"onglet introuvable: {sheet}")
+        part = parts[sheet]
+        table = _table_of(zf, part)
+        header = table["colonnes"] if table else _header_of(zf, part)
+        names = []
+        for r in rows:
+            names.extend(k for k in r if k not in names)
+        columns, unknown = _column_map(names, header)
+        xml = zf.read(part).decode("utf-8")
+        dates = date_styles(zf)[0]
+        epoch = workbook_epoch(zf)
+        wb_part = workbook_part(zf)
+        wb_xml = zf.read(wb_part).decode("utf-8") if recalc and rows else None
+
+    start, end = xml.find("<sheetData"), xml.find("</sheetData>")
+    if start < 0:
+        raise ValueError(f"{sheet}: sheetData introuvable")
+    if end < 0:  # <sheetData/> (onglet vide)
+        open_end = xml.index(">", start) + 1
+        xml = xml[:start] + "<sheetData>" + "</sheetData>" + xml[open_end:]
+        end = start + len("<sheetData>")
+    body_start = xml.index(">", start) + 1
+    existing = [(m, int(_ROW_NUM_RE.search(m.group(1)).group(1))) for m in _ROW_RE.finditer(xml, body_start, end)]
+    by_row = {r: m for m, r in existing}
+    last_sheet_row = existing[-1][1] if existing else 0
+
+    if table:
+        c1, top, c2, bottom = table["plage"]
+        if table["totaux"]:
+            bottom -= table["totaux"]
+    else:
+        top, bottom = 2, last_sheet_row
+    # dernière ligne saisie de la table: on remplit les lignes pré-remplies qui la suivent
+    used = top - 1
+    for m, r in existing:
+        if top <= r <= bottom and not _is_blank(m.group(2)):
+            used = r
+    free = list(range(used + 1, bottom + 1))
+    overflow = max(0, len(rows) - len(free))
+    if overflow and table and (table["totaux"] or last_sheet_row > bottom):
+        raise ValueError(f"{sheet}: lignes présentes sous la table, ajout impossible sans décaler la feuille")
+    targets = free[:len(rows)] + list(range(bottom + 1, bottom + 1 + overflow))
+
+    # modèle des lignes créées: dernière ligne existante de la table
+    tpl_row = next((by_row[r] for r in range(bottom, top - 1, -1) if r in by_row), None)
+    tpl_attrs = {k: v for k, v in _attrs(tpl_row.group(1)).items() if k not in ("r", "ht", "customHeight")} \
+        if tpl_row else {}
+    tpl_cells = _cells(tpl_row.group(2)) if tpl_row else []
+    shared = any(f and 't="shared"' in f for _, _, f, _ in tpl_cells)
+    relocate = (int(_ROW_NUM_RE.search(tpl_row.group(1)).group(1)), _shared_masters(xml) if shared else {}, {}) \
+        if tpl_row else None
+
+    new_rows = {}
+    for r, values in zip(targets, rows):
+        cols = {columns[k]: v for k, v in values.items() if k in columns}
+        m = by_row.get(r)
+        if m is not None:
+            own = {k: v for k, v in _attrs(m.group(1)).items() if k != "r"}
+            new_rows[r] = _build_row(r, own, _cells(m.group(2)), cols, dates, epoch)
+        else:
+            new_rows[r] = _build_row(r, tpl_attrs, tpl_cells, cols, dates, epoch, relocate)
+
+    # recomposition de sheetData: lignes remplacées en place, nouvelles lignes insérées dans l'ordre
+    out, pos = [xml[:body_start]], body_start
+    pending = sorted(r for r in new_rows if r not in by_row)
+    for m, r in existing:
+        while pending and pending[0] < r:
+            out.append(xml[pos:m.start()])
+            pos = m.start()
+            out.append(new_rows[pending.pop(0)])
+        if r in new_rows:
+            out.append(xml[pos:m.start()])
+            out.append(new_rows[r])
+            pos = m.end()
+    out.append(xml[pos:end])
+    out.extend(new_rows[r] for r in pending)
+    out.append(xml[end:])
+    sheet_xml = "".join(out)
+
+    replace = {}
+    new_bottom = max(targets) if targets else bottom
+    if new_bottom > bottom:
+        head_end = sheet_xml.find("<sheetData")
+        tail_start = sheet_xml.find("</sheetData>")
+        # plage de la feuille (dimension) et validations / mises en forme qui suivent la table
+        dim = re.search(r"<dimension\b[^>]*/>", sheet_xml[:head_end])
+        if dim:
+            rng = _split_range(_attrs(dim.group(0))["ref"])
+            if rng and rng[3] < new_bottom:
+                fixed = f'<dimension ref="{_letters(rng[0])}{rng[1]}:{_letters(rng[2])}{new_bottom}"/>'
+                sheet_xml = sheet_xml[:dim.start()] + fixed + sheet_xml[dim.end():]
+                tail_start += len(fixed) - (dim.end() - dim.start())
+        if table:
+            sheet_xml = sheet_xml[:tail_start] + _extend_refs(sheet_xml[tail_start:], bottom, new_bottom, ("sqref",))
+            replace[table["partie"]] = _extend_refs(table["xml"], bottom, new_bottom, ("ref",)).encode("utf-8")
+    replace[part] = sheet_xml.encode("utf-8")
+    if wb_xml is not None:
+        patched = _set_full_calc(wb_xml)
+        if patched is not None:
+            replace[wb_part] = patched.encode("utf-8")
+    written = rewrite_zip(src, dst, replace)
+    return {"feuille": sheet, "lignes": targets, "remplies": len(rows) - overflow, "ajoutées": overflow,
+            "colonnes ignorées": unknown, "parties réécrites": written}
@@ -0,0 +1,9 @@
+# tests/conftest.py
+# Racine du dépôt dans sys.path: les tests importent src.* comme app.py.
+
+import pathlib
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
@@ -0,0 +1,81 @@
+# tests/test_calc.py
+# Charges fixes du what-if: lignes de total du tableau jamais comptées en plus des charges.
+
+import pathlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.calc import GLOBALE, fixed_charges
+
+WORKBOOK = pathlib.Path(__file__).resolve().parents[1] / "Dashboard Regraga 2026.xlsx"
+
+
+def _charges():
+    # même disposition que tbl_Charges_Fixes: sous-total sans identifiant puis totaux saisis en texte
+    return pd.DataFrame({
+        "ID_Charge": ["CHA001", "CHA002", "CHA003", "CHA004", None, None, None, None],
+        "Libellé": ["Loyer", "Salaires Pizzas", "Assurance", "Électricité", None,
+                    "total des charges globales", "7150", None],
+        "Famille affectée": ["Globale", "Pizzas", None, "Globale", None, None, None, None],
+        "Montant_Mensuel": [5000.0, 2000.0, 1200.0, 150.0, 8350.0, None, None, None],
+        "Fréquence": ["Mensuelle", "Mensuelle", "Annuelle", None, None, None, None, None],
+    })
+
+
+def test_total_equals_tagged_lines():
+    out = fixed_charges(_charges())
+    assert out.sum() == pytest.approx(5000 + 2000 + 1200 / 12 + 150)
+    assert out[GLOBALE] == pytest.approx(5000 + 1200 / 12 + 150)
+    assert out["Pizzas"] == pytest.approx(2000)
+
+
+def test_without_id_column_label_filters_totals():
+    df = _charges().drop(columns="ID_Charge")
+    df.loc[4, "Libellé"] = "Total"
+    assert fixed_charges(df).sum() == pytest.approx(5000 + 2000 + 1200 / 12 + 150)
+
+
+@pytest.mark.skipif(not WORKBOOK.exists(), reason="classeur de référence absent")
+def test_workbook_charges_not_double_counted():
+    from src.io_excel import read_workbook
+
+    charges = read_workbook(str(WORKBOOK))["charges"]
+    tagged = charges[charges["ID_Charge"].notna()]
+    attendu = pd.to_numeric(tagged["Montant_Mensuel"], errors="coerce").sum()
+    out = fixed_charges(charges)
+    assert out.sum() == pytest.approx(attendu)
+    # sous-total saisi sous le tableau: égal à la somme des lignes, pas ajouté à « Globale »
+    sous_total = pd.to_numeric(charges.loc[charges["ID_Charge"].isna(), "Montant_Mensuel"], errors="coerce").dropna()
+    assert np.isclose(sous_total, attendu).any()
+
+
+def _cube_lignes():
+    return pd.DataFrame({
+        "Date": ["2026-01-02 09:15:00", pd.Timestamp("2026-01-02 13:00"), "2026-01-09 10:00:00",
+                 pd.Timestamp("2026-02-14 20:30"), None, "2026-02-15 08:00:00"],
+        "Produit": ["Café", "Tajine", "Café ", "Pizza", "Thé", None],
+        "Cde_Prdt": ["P1", "P2", "P1", "P3", "P4", "P5"],
+        "Qté Vendue": [2, 1, 3, 2, 1, 1],
+        "Prix Menu": [15.0, 80.0, 15.0, 60.0, 12.0, 20.0],
+        "CMP_par_portion": [4.0, 31.0, 4.0, np.nan, 2.5, 6.0],
+    })
+
+
+@pytest.mark.parametrize("grain", ["jour", "semaine", "mois"])
+def test_cube_add_equals_add_frame(grain):
+    from src.calc import SalesCube
+
+    df = _cube_lignes()
+    dims = {"famille": {"P1": "Boissons chaudes", "Tajine": "Plats"}}
+    lot = SalesCube.from_frame(df, dims)
+    ligne = SalesCube(dims)
+    for rec in df.to_dict("records"):
+        ligne.add(rec)
+    for by in ("produit", "famille", None):
+        pd.testing.assert_frame_equal(ligne.frame(grain, by), lot.frame(grain, by))
+    # retrait ligne à ligne: cellules revenues à zéro
+    ligne.add(df.iloc[0].to_dict(), sign=-1)
+    lot.add_frame(df.iloc[[0]], sign=-1)
+    pd.testing.assert_frame_equal(ligne.frame(grain), lot.frame(grain))
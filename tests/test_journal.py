@@ -0,0 +1,133 @@
+# tests/test_journal.py
+# Journal des ventes: compaction dans une copie du classeur et reprise après coupure.
+
+import os
+import pathlib
+import shutil
+
+import pytest
+
+from src.journal import SalesJournal, journal_path_for
+from src.writer import atomic_write
+from src.xlsx_patch import append_rows
+
+WORKBOOK = pathlib.Path(__file__).resolve().parents[1] / "Dashboard Regraga 2026.xlsx"
+SHEET = "tbl_Ventes"
+
+pytestmark = pytest.mark.skipif(not WORKBOOK.exists(), reason="classeur de référence absent")
+
+
+class Crash(BaseException):
+    """Arrêt brutal simulé: ni compact ni atomic_write ne le traitent comme un échec ordinaire."""
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "classeur.xlsx"
+    shutil.copyfile(WORKBOOK, path)
+    return path
+
+
+def _sale(i):
+    return {"Date": f"2026-03-{1 + i % 28:02d} 12:00:00", "Produit": f"Test journal {i}",
+            "Qté Vendue": 1 + i, "Prix Menu": 10.0}
+
+
+def _journal(path, n=3):
+    j = SalesJournal(journal_path_for(path), path)
+    for i in range(n):
+        j.append(_sale(i))
+    return j
+
+
+def _fold(path, journal, crash=None):
+    """Repli comme l'appli: copie patchée, scellée par le journal, puis remplacement."""
+    def seal(tmp):
+        journal.seal(tmp)
+        if crash == "avant":
+            raise Crash()
+
+    def fold(pending):
+        atomic_write(path, lambda tmp: append_rows(path, tmp, SHEET, pending.to_dict("records")), seal)
+        if crash == "après":
+            raise Crash()
+    return fold
+
+
+def _produits(path):
+    from src.io_excel import read_workbook
+    ventes = read_workbook(str(path))["ventes"]
+    return set(ventes["Produit"].dropna().astype(str))
+
+
+def _touch(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 5_000_000_000))
+
+
+def test_compact_writes_rows_and_purges(workbook):
+    j = _journal(workbook)
+    assert j.compact(_fold(workbook, j)) == 3
+    assert len(j) == 0
+    assert {f"Test journal {i}" for i in range(3)} <= _produits(workbook)
+
+
+def test_crash_before_replace_keeps_sales(workbook):
+    avant = workbook.read_bytes()
+    j = _journal(workbook)
+    with pytest.raises(Crash):
+        j.compact(_fold(workbook, j, crash="avant"))
+    j.close()
+    assert workbook.read_bytes() == avant
+    _touch(workbook)  # synchro OneDrive / Excel avant le redémarrage
+    j = SalesJournal(journal_path_for(workbook), workbook)
+    assert len(j) == 3
+    # repli suivant: les ventes arrivent bien dans le classeur
+    assert j.compact(_fold(workbook, j)) == 3
+    assert len(j) == 0
+
+
+def test_crash_after_replace_purges_on_restart(workbook):
+    j = _journal(workbook)
+    with pytest.raises(Crash):
+        j.compact(_fold(workbook, j, crash="après"))
+    j.close()
+    assert {f"Test journal {i}" for i in range(3)} <= _produits(workbook)
+    j = SalesJournal(journal_path_for(workbook), workbook)
+    assert len(j) == 0
+
+
+def test_crash_after_replace_then_touched_keeps_sales(workbook):
+    # sans preuve que le classeur en place est celui écrit: rien n'est purgé
+    j = _journal(workbook)
+    with pytest.raises(Crash):
+        j.compact(_fold(workbook, j, crash="après"))
+    j.close()
+    _touch(workbook)
+    j = SalesJournal(journal_path_for(workbook), workbook)
+    assert len(j) == 3
+
+
+def test_failed_fold_keeps_sales(workbook):
+    j = _journal(workbook)
+
+    def fold(pending):
+        raise OSError("disque plein")
+    with pytest.raises(OSError):
+        j.compact(fold)
+    assert len(j) == 3
+    j.close()
+    assert len(SalesJournal(journal_path_for(workbook), workbook)) == 3
+
+
+def test_sales_saved_during_fold_stay_pending(workbook):
+    j = _journal(workbook)
+    inner = _fold(workbook, j)
+
+    def fold(pending):
+        j.append(_sale(99))  # vente saisie pendant l'écriture du classeur
+        inner(pending)
+    assert j.compact(fold) == 3
+    pending = j.pending_frame()
+    assert pending["Produit"].tolist() == ["Test journal 99"]
+    assert "Test journal 99" not in _produits(workbook)
@@ -0,0 +1,87 @@
+# tests/test_kpis.py
+# KpiState mis à jour ligne par ligne == compute_kpis recalculé sur le tableau équivalent.
+
+import pandas as pd
+import pytest
+
+from src.kpis import KpiState, compute_kpis
+
+
+def _ventes():
+    return pd.DataFrame({
+        "Date": pd.to_datetime(["2026-01-02", "2026-01-02", "2026-01-03", "2026-01-04",
+                                "2026-01-05", "2026-01-05", "2026-01-06"]),
+        "Produit": ["Café", "Thé", "Tajine", "Café", "Pizza", "Crêpe", "Jus"],
+        "Qté Vendue": [2, 1, 3, 1, 2, 4, 1],
+        "Prix Menu": [15.0, 12.0, 80.0, 15.0, 60.0, 25.0, 20.0],
+        "CMP_par_portion": [4.0, 2.5, 31.0, 4.0, 18.0, 7.5, 6.0],
+    })
+
+
+def _check(state, df):
+    attendu = compute_kpis(df.copy(), pd.DataFrame())
+    obtenu = state.kpis()
+    assert obtenu["Total CA"] == pytest.approx(attendu["Total CA"])
+    assert obtenu["Coût matière total"] == pytest.approx(attendu["Coût matière total"])
+    assert obtenu["Food cost %"] == pytest.approx(attendu["Food cost %"])
+    assert list(obtenu["Top produits"]) == list(attendu["Top produits"])
+    assert list(obtenu["Top produits"].values()) == pytest.approx(list(attendu["Top produits"].values()))
+
+
+def test_seed_equals_compute_kpis():
+    df = _ventes()
+    _check(KpiState.from_frame(df), df)
+
+
+def test_add_lines_equals_compute_kpis():
+    df = _ventes()
+    state = KpiState.from_frame(df.iloc[:3])
+    for _, ligne in df.iloc[3:].iterrows():
+        state.add(ligne.to_dict())
+    _check(state, df)
+
+
+def test_journal_line_without_optional_columns():
+    # ligne saisie dans l'appli: pas de colonne Date, comme une ligne du journal
+    df = _ventes()
+    state = KpiState.from_frame(df)
+    ligne = {"Produit": "Tajine", "Qté Vendue": 2, "Prix Menu": 80.0, "CMP_par_portion": 31.0}
+    state.add(ligne)
+    _check(state, pd.concat([df, pd.DataFrame([ligne])], ignore_index=True))
+
+
+def test_remove_lines_equals_compute_kpis():
+    df = _ventes()
+    state = KpiState.from_frame(df)
+    for i in (0, 5):
+        state.remove(df.iloc[i].to_dict())
+    _check(state, df.drop(index=[0, 5]))
+    # dernière ligne d'un produit retirée: il sort du top
+    state.remove(df.iloc[6].to_dict())
+    reste = df.drop(index=[0, 5, 6])
+    _check(state, reste)
+    assert "Jus" not in state.top()
+
+
+def test_add_frame_delta_equals_compute_kpis():
+    df = _ventes()
+    state = KpiState.from_frame(df.iloc[:4])
+    state.add_frame(df.iloc[4:])
+    state.add_frame(df.iloc[[1]], sign=-1)
+    _check(state, df.drop(index=[1]))
+
+
+def test_ca_ligne_column_takes_priority():
+    df = _ventes()
+    df["CA ligne"] = df["Prix Menu"] * df["Qté Vendue"] * 0.9  # remise appliquée
+    state = KpiState.from_frame(df.iloc[:-1])
+    state.add(df.iloc[-1].to_dict())
+    _check(state, df)
+
+
+def test_empty_state_matches_empty_frame():
+    vide = pd.DataFrame(columns=_ventes().columns)
+    assert KpiState.from_frame(vide).kpis() == compute_kpis(vide, pd.DataFrame())
+    state = KpiState.from_frame(_ventes().iloc[:1])
+    state.remove(_ventes().iloc[0].to_dict())
+    assert state.kpis() == compute_kpis(vide, pd.DataFrame())
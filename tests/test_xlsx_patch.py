@@ -0,0 +1,114 @@
+# tests/test_xlsx_patch.py
+# Ajout de lignes par patch XML: plage de table, parties recopiées brutes, formules recopiées.
+
+import pathlib
+import re
+import shutil
+import zipfile
+
+import pytest
+
+from src.xlsx_patch import append_rows, rewrite_zip
+
+WORKBOOK = pathlib.Path(__file__).resolve().parents[1] / "Dashboard Regraga 2026.xlsx"
+SHEET_PART = "xl/worksheets/sheet1.xml"
+TABLE_PART = "xl/tables/table1.xml"
+
+
+@pytest.fixture
+def small(tmp_path):
+    """Classeur minimal: onglet Ventes, table tbl_Ventes A1:D4, Total = Qté * Prix."""
+    from openpyxl import Workbook
+    from openpyxl.worksheet.table import Table
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Ventes"
+    ws.append(["Produit", "Qté", "Prix", "Total"])
+    for i, (p, q, c) in enumerate([("A", 1, 2.0), ("B", 2, 3.0), ("C", 3, 4.0)], start=2):
+        ws.append([p, q, c, f"=B{i}*C{i}"])
+    ws.add_table(Table(displayName="tbl_Ventes", ref="A1:D4"))
+    path = tmp_path / "petit.xlsx"
+    wb.save(path)
+    return path
+
+
+def _shared(path, tmp_path, master=True):
+    """Même classeur, colonne D en formule partagée (maître D2, comme l'écrit Excel)."""
+    with zipfile.ZipFile(path) as zf:
+        xml = zf.read(SHEET_PART).decode("utf-8")
+    head = '<f t="shared" ref="D2:D4" si="0">B2*C2</f>' if master else '<f t="shared" si="0"/>'
+    xml = xml.replace("<f>B2*C2</f>", head)
+    xml = re.sub(r"<f>B[34]\*C[34]</f>", '<f t="shared" si="0"/>', xml)
+    out = tmp_path / "partage.xlsx"
+    rewrite_zip(path, out, {SHEET_PART: xml.encode("utf-8")})
+    return out
+
+
+def _rows(n):
+    return [{"Produit": f"N{i}", "Qté": i + 1, "Prix": 1.5} for i in range(n)]
+
+
+def _part(path, name):
+    with zipfile.ZipFile(path) as zf:
+        return zf.read(name).decode("utf-8")
+
+
+def test_append_extends_table_and_dimension(small, tmp_path):
+    out = tmp_path / "out.xlsx"
+    report = append_rows(small, out, "Ventes", _rows(2))
+    assert report["lignes"] == [5, 6] and report["ajoutées"] == 2
+    table = _part(out, TABLE_PART)
+    assert 'ref="A1:D6"' in table and '<autoFilter ref="A1:D6"' in table
+    sheet = _part(out, SHEET_PART)
+    assert '<dimension ref="A1:D6"/>' in sheet
+    assert "<f>B5*C5</f>" in sheet and "<f>B6*C6</f>" in sheet
+
+
+def test_other_parts_copied_raw(small, tmp_path):
+    out = tmp_path / "out.xlsx"
+    rewritten = set(append_rows(small, out, "Ventes", _rows(1))["parties réécrites"])
+    with zipfile.ZipFile(small) as a, zipfile.ZipFile(out) as b:
+        assert a.namelist() == b.namelist()
+        for info in a.infolist():
+            if info.filename in rewritten:
+                continue
+            other = b.getinfo(info.filename)
+            assert (other.CRC, other.compress_size) == (info.CRC, info.compress_size)
+            assert b.read(info.filename) == a.read(info.filename)
+
+
+def test_shared_formula_rebuilt_from_master(small, tmp_path):
+    src = _shared(small, tmp_path)
+    out = tmp_path / "out.xlsx"
+    append_rows(src, out, "Ventes", _rows(2))
+    sheet = _part(out, SHEET_PART)
+    assert '<f t="shared" ref="D2:D4" si="0">B2*C2</f>' in sheet
+    assert "<f>B5*C5</f>" in sheet and "<f>B6*C6</f>" in sheet
+    assert sheet.count('si="0"') == 3
+
+
+def test_shared_formula_without_master_raises(small, tmp_path):
+    src = _shared(small, tmp_path, master=False)
+    out = tmp_path / "out.xlsx"
+    with pytest.raises(ValueError, match="maître"):
+        append_rows(src, out, "Ventes", _rows(1))
+
+
+@pytest.mark.skipif(not WORKBOOK.exists(), reason="classeur de référence absent")
+def test_rows_round_trip_through_read_workbook(tmp_path):
+    from openpyxl import load_workbook
+    from src.io_excel import read_workbook
+    src = tmp_path / "classeur.xlsx"
+    shutil.copyfile(WORKBOOK, src)
+    out = tmp_path / "out.xlsx"
+    rows = [{"Date": f"2026-03-{1 + i:02d} 12:00:00", "Produit": f"Test patch {i}",
+             "Qté Vendue": 1 + i, "Prix Menu": 10.0} for i in range(3)]
+    append_rows(src, out, "tbl_Ventes", rows)
+    ventes = read_workbook(str(out))["ventes"]
+    got = ventes[ventes["Produit"].astype(str).str.startswith("Test patch")]
+    assert list(got["Produit"]) == [r["Produit"] for r in rows]
+    assert list(got["Qté Vendue"].astype(float)) == [1.0, 2.0, 3.0]
+    assert list(got["Date"].dt.day) == [1, 2, 3]
+    before = read_workbook(str(src))["ventes"]
+    assert ventes["Date"].notna().sum() == before["Date"].notna().sum() + 3
+    load_workbook(out, read_only=True).close()